@@ -19,6 +19,18 @@ from skygear.settings import add_parser as add_setting_parser
 from .settings import \
     get_settings_parser, \
     get_smtp_settings_parser, \
+    get_container_settings_parser, \
+    get_attempt_settings_parser, \
+    get_metrics_settings_parser, \
+    get_timing_settings_parser, \
+    get_profile_settings_parser, \
+    get_memory_settings_parser, \
+    get_health_settings_parser, \
+    get_rate_limit_settings_parser, \
+    get_send_limit_settings_parser, \
+    get_circuit_settings_parser, \
+    get_deadline_settings_parser, \
+    get_replica_settings_parser, \
     get_welcome_email_settings_parser, \
     get_verify_settings_parser, \
     get_verify_test_provider_settings_parser
@@ -59,6 +71,18 @@ def includeme(settings):
     register_handlers(
         settings=settings.forgot_password,
         smtp_settings=settings.forgot_password_smtp,
+        container_settings=settings.forgot_password_container,
+        attempt_settings=settings.forgot_password_attempt,
+        metrics_settings=settings.forgot_password_metrics,
+        timing_settings=settings.forgot_password_timing,
+        profile_settings=settings.forgot_password_profile,
+        memory_settings=settings.forgot_password_memory,
+        health_settings=settings.forgot_password_health,
+        rate_limit_settings=settings.forgot_password_rate_limit,
+        send_limit_settings=settings.forgot_password_send_limit,
+        circuit_settings=settings.forgot_password_circuit,
+        deadline_settings=settings.forgot_password_deadline,
+        replica_settings=settings.forgot_password_replica,
         welcome_email_settings=settings.forgot_password_welcome_email,
         verify_settings=settings.verify,
         verify_test_provider_settings=verify_test_providers
@@ -67,6 +91,30 @@ def includeme(settings):
 
 add_setting_parser('forgot_password', get_settings_parser())
 add_setting_parser('forgot_password_smtp', get_smtp_settings_parser())
+add_setting_parser('forgot_password_container',
+                   get_container_settings_parser())
+add_setting_parser('forgot_password_attempt',
+                   get_attempt_settings_parser())
+add_setting_parser('forgot_password_metrics',
+                   get_metrics_settings_parser())
+add_setting_parser('forgot_password_timing',
+                   get_timing_settings_parser())
+add_setting_parser('forgot_password_profile',
+                   get_profile_settings_parser())
+add_setting_parser('forgot_password_memory',
+                   get_memory_settings_parser())
+add_setting_parser('forgot_password_health',
+                   get_health_settings_parser())
+add_setting_parser('forgot_password_rate_limit',
+                   get_rate_limit_settings_parser())
+add_setting_parser('forgot_password_send_limit',
+                   get_send_limit_settings_parser())
+add_setting_parser('forgot_password_circuit',
+                   get_circuit_settings_parser())
+add_setting_parser('forgot_password_deadline',
+                   get_deadline_settings_parser())
+add_setting_parser('forgot_password_replica',
+                   get_replica_settings_parser())
 add_setting_parser('forgot_password_welcome_email',
                    get_welcome_email_settings_parser())
 add_setting_parser('verify',
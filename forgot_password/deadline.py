@@ -0,0 +1,110 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from skygear import error as skyerror
+from skygear.error import SkygearException
+
+_request_timeout = 0
+_io_timeout = 0
+_local = threading.local()
+
+
+def configure_deadlines(settings):
+    """
+    Configure the request deadline and the outbound I/O timeout with the
+    specified deadline settings.
+    """
+    global _request_timeout, _io_timeout
+    _request_timeout = getattr(settings, 'request_timeout', 0) or 0
+    _io_timeout = getattr(settings, 'io_timeout', 0) or 0
+
+
+class DeadlineExceeded(SkygearException):
+    """
+    Raised when an outbound call times out or when the deadline of the
+    request has passed before the call is made.
+
+    The error is reported to the client as a plugin timeout, and the request
+    can be retried.
+    """
+    def __init__(self, operation):
+        self.operation = operation
+        super().__init__('`{}` timed out'.format(operation),
+                         skyerror.PluginTimeout,
+                         info={'operation': operation, 'retryable': True})
+
+
+@contextmanager
+def request_deadline(timeout=None):
+    """
+    Context manager setting the deadline of the current request to
+    `timeout` seconds from now, or the configured request timeout. A nested
+    deadline never extends the deadline of the enclosing one.
+    """
+    previous = getattr(_local, 'deadline', None)
+    timeout = timeout or _request_timeout
+    deadline = previous
+    if timeout:
+        deadline = time.monotonic() + timeout
+        if previous is not None:
+            deadline = min(deadline, previous)
+    _local.deadline = deadline
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def with_request_deadline(func):
+    """
+    Decorator running an op, handler or hook within a `request_deadline()`
+    of the configured request timeout, which its outbound calls share.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with request_deadline():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def remaining():
+    """
+    Return the number of seconds left before the deadline of the current
+    request, or None if there is no deadline.
+    """
+    deadline = getattr(_local, 'deadline', None)
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def get_timeout(operation, timeout=None):
+    """
+    Return the timeout in seconds of an outbound call, which is the smallest
+    of `timeout`, the configured I/O timeout and the time left before the
+    deadline. None is returned if none of them applies.
+
+    DeadlineExceeded is raised if the deadline has already passed.
+    """
+    candidates = [t for t in (timeout, _io_timeout) if t]
+    left = remaining()
+    if left is not None:
+        if left <= 0:
+            raise DeadlineExceeded(operation)
+        candidates.append(left)
+    return min(candidates) if candidates else None
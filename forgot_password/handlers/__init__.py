@@ -12,34 +12,99 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-
-from ..template import TemplateProvider
+from ..deadline import configure_deadlines
+from ..template import (FileTemplate, TemplateProvider,
+                        enable_html_minification)
+from ..timing import configure_timing
 from .forgot_password import add_templates as add_forgot_password_templates
 from .forgot_password import register_op as register_forgot_password_op
+from .health import register_handlers as register_health_handlers
+from .memory import register_op as register_memory_op
+from .metrics import register_handlers as register_metrics_handlers
+from .profile import register_op as register_profile_op
 from .reset_password import add_templates as add_reset_password_templates
 from .reset_password import register_op as register_reset_password_op
 from .reset_password import register_handlers \
     as register_reset_password_handlers
+from .send_limit import register_events as register_send_limit_events
 from .welcome_email import add_templates as add_welcome_email_templates
 from .welcome_email import register_hooks_and_ops \
     as register_welcome_email_hooks_and_ops
+from .util import user as user_util
+from .util.attempt import AttemptGuard
+from .util.circuit import configure_circuit_breakers
+from .util.container import configure_container
+from .util.memory import configure_memory_tracker, register_cache
+from .util.profiler import configure_profiler
+from .util.ratelimit import configure_rate_limits
+from .util.replica import configure_replica
+from .util.response import get_rendered_cache
+from .util.send_limit import SendLimits
+from .util.singleflight import SingleFlight
 from .verify_code import register as register_verify_code
 
 
+def register_caches(attempt_guard, flights=()):
+    """
+    Register the caches of the plugin to be included in memory reports.
+    """
+    for flight in flights:
+        register_cache('coalesced_results:{}'.format(flight.name),
+                       lambda flight=flight: len(flight.results))
+    register_cache('attempt_negative_cache',
+                   lambda: len(attempt_guard.negative_cache))
+    register_cache('attempt_failures', lambda: len(attempt_guard.failures))
+    register_cache('rendered_pages', lambda: len(get_rendered_cache()))
+    register_cache('jinja_templates',
+                   lambda: len(FileTemplate.get_jinja_env().cache or ()))
+
+
 def register_handlers(**kwargs):
     settings = kwargs['settings']
     welcome_email_settings = kwargs['welcome_email_settings']
 
+    configure_container(kwargs['container_settings'])
+    configure_timing(kwargs['timing_settings'])
+    configure_profiler(kwargs['profile_settings'])
+    configure_memory_tracker(kwargs['memory_settings'])
+    configure_rate_limits(kwargs['rate_limit_settings'])
+    configure_circuit_breakers(kwargs['circuit_settings'])
+    configure_deadlines(kwargs['deadline_settings'])
+    configure_replica(kwargs['replica_settings'])
+    user_util.accept_legacy_codes(settings.legacy_codes_until)
+    attempt_guard = AttemptGuard.from_settings(kwargs['attempt_settings'])
+    enable_html_minification(settings.minify_html)
+    forgot_password_flight = SingleFlight('user:forgot-password',
+                                          window=settings.dedup_window)
+    register_caches(attempt_guard, flights=[forgot_password_flight])
+    send_limits = SendLimits.from_settings(kwargs['send_limit_settings'])
+
     template_provider = TemplateProvider()
     add_forgot_password_templates(template_provider, settings)
     add_reset_password_templates(template_provider, settings)
     add_welcome_email_templates(template_provider, welcome_email_settings)
 
-    register_forgot_password_op(template_provider=template_provider, **kwargs)
-    register_reset_password_op(template_provider=template_provider, **kwargs)
+    register_send_limit_events(send_limits=send_limits)
+    register_forgot_password_op(template_provider=template_provider,
+                                send_limits=send_limits,
+                                forgot_password_flight=forgot_password_flight,
+                                **kwargs)
+    register_reset_password_op(template_provider=template_provider,
+                               attempt_guard=attempt_guard,
+                               **kwargs)
     register_reset_password_handlers(template_provider=template_provider,
+                                     attempt_guard=attempt_guard,
                                      **kwargs)
     register_welcome_email_hooks_and_ops(template_provider=template_provider,
                                          **kwargs)
-    register_verify_code(kwargs['verify_settings'],
-                         kwargs['verify_test_provider_settings'])
+    register_metrics_handlers(**kwargs)
+    register_profile_op(**kwargs)
+    register_memory_op(**kwargs)
+    verify_templates = register_verify_code(
+        kwargs['verify_settings'],
+        kwargs['verify_test_provider_settings'],
+        attempt_guard=attempt_guard,
+        send_limits=send_limits)
+    register_health_handlers(
+        template_providers=[template_provider, verify_templates],
+        **kwargs)
@@ -22,11 +22,16 @@ from skygear import error as skyerror
 from skygear.error import SkygearException
 from skygear.models import Record, RecordID
 from skygear.utils.context import current_context
-from skygear.utils.db import conn
 
+from ..deadline import DeadlineExceeded, with_request_deadline
 from ..template import FileTemplate
 from .template_mail import TemplateMailSender
 from .util import user as user_util
+from .util.db import with_request_connection
+from .util.metrics import instrument
+from .util.replica import replica_read
+from .util.send_limit import SendLimitExceeded, SendLimits
+from .util.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 try:
@@ -55,77 +60,105 @@ def register_op(**kwargs):
     template_provider = kwargs['template_provider']
     settings = kwargs['settings']
     smtp_settings = kwargs['smtp_settings']
+    send_limits = kwargs.get('send_limits')
+    flight = kwargs.get('forgot_password_flight')
     mail_sender = TemplateMailSender(template_provider,
                                      smtp_settings,
                                      'reset_email_text',
                                      'reset_email_html')
-    register_forgot_password_op(mail_sender, settings)
+    register_forgot_password_op(mail_sender, settings,
+                                send_limits=send_limits,
+                                flight=flight)
     register_test_forgot_password_op(mail_sender, settings)
 
 
-def register_forgot_password_op(mail_sender, settings):
+def register_forgot_password_op(mail_sender, settings, send_limits=None,
+                                flight=None):
+    send_limits = send_limits or SendLimits()
+    flight = flight or SingleFlight('user:forgot-password')
+
     @skygear.op('user:forgot-password')
+    @instrument('op', 'user:forgot-password')
+    @with_request_deadline
+    @with_request_connection
     def forgot_password(email):
         """
         Lambda function to handle forgot password request.
+
+        Concurrent requests for the same email, and requests made within
+        the dedup window after a successful one, share a single email.
         """
 
         if email is None:
             raise SkygearException('email must be set',
                                    skyerror.InvalidArgument)
 
-        with conn() as c:
-            user = user_util.get_user_from_email(c, email)
-            if not user:
-                if not settings.secure_match:
-                    return {'status': 'OK'}
-                raise SkygearException('user_id must be set',
-                                       skyerror.InvalidArgument)
-            if not user.email:
-                raise SkygearException('email must be set',
-                                       skyerror.InvalidArgument)
-
-            user_record = user_util.get_user_record(c, user.id)
-            expire_at = round(datetime.utcnow().timestamp()) + \
-                settings.reset_url_lifetime
-            code = user_util.generate_code(user, expire_at)
-
-            url_prefix = settings.url_prefix
-            if url_prefix.endswith('/'):
-                url_prefix = url_prefix[:-1]
-
-            link = '{0}/reset-password?code={1}&user_id={2}&expire_at={3}'\
-                .format(url_prefix, code, user.id, expire_at)
-
-            template_params = {
-                'appname': settings.app_name,
-                'link': link,
-                'url_prefix': url_prefix,
-                'email': user.email,
-                'user_id': user.id,
-                'code': code,
-                'user': user,
-                'user_record': user_record,
-                'expire_at': expire_at,
-            }
-
-            try:
-                mail_sender.send(
-                    (settings.sender_name, settings.sender),
-                    user.email,
-                    settings.subject,
-                    reply_to=(settings.reply_to_name, settings.reply_to),
-                    template_params=template_params)
-            except Exception as ex:
-                logger.exception('An error occurred sending reset password'
-                                 ' email to user.')
-                raise SkygearException(str(ex), skyerror.UnexpectedError)
-
-            return {'status': 'OK'}
+        # Users are looked up by the exact email, so it is not case folded
+        return flight.call(email, send_reset_email, email)
+
+    def send_reset_email(email):
+        try:
+            send_limits.check_forgot_password(email)
+        except SendLimitExceeded as ex:
+            raise SkygearException(str(ex), skyerror.PermissionDenied,
+                                   info={'retry_after': ex.retry_after})
+
+        user = replica_read(user_util.get_user_from_email, email)
+        if not user:
+            if not settings.secure_match:
+                return {'status': 'OK'}
+            raise SkygearException('user_id must be set',
+                                   skyerror.InvalidArgument)
+        if not user.email:
+            raise SkygearException('email must be set',
+                                   skyerror.InvalidArgument)
+
+        user_record = replica_read(user_util.get_user_record, user.id)
+        expire_at = round(datetime.utcnow().timestamp()) + \
+            settings.reset_url_lifetime
+        code = user_util.generate_code(user, expire_at)
+
+        url_prefix = settings.url_prefix
+        if url_prefix.endswith('/'):
+            url_prefix = url_prefix[:-1]
+
+        link = '{0}/reset-password?code={1}&user_id={2}&expire_at={3}'\
+            .format(url_prefix, code, user.id, expire_at)
+
+        template_params = {
+            'appname': settings.app_name,
+            'link': link,
+            'url_prefix': url_prefix,
+            'email': user.email,
+            'user_id': user.id,
+            'code': code,
+            'user': user,
+            'user_record': user_record,
+            'expire_at': expire_at,
+        }
+
+        try:
+            mail_sender.send(
+                (settings.sender_name, settings.sender),
+                user.email,
+                settings.subject,
+                reply_to=(settings.reply_to_name, settings.reply_to),
+                template_params=template_params)
+        except DeadlineExceeded:
+            raise
+        except Exception as ex:
+            logger.exception('An error occurred sending reset password'
+                             ' email to user.')
+            raise SkygearException(str(ex), skyerror.UnexpectedError)
+
+        return {'status': 'OK'}
 
 
 def register_test_forgot_password_op(mail_sender, settings):
     @skygear.op('user:forgot-password:test', key_required=True)
+    @instrument('op', 'user:forgot-password:test')
+    @with_request_deadline
+    @with_request_connection
     def test_forgot_password_email(email,
                                    text_template=None,
                                    html_template=None,
@@ -177,6 +210,8 @@ def register_test_forgot_password_op(mail_sender, settings):
                              text_template_string=text_template,
                              html_template_string=html_template,
                              template_params=template_params)
+        except DeadlineExceeded:
+            raise
         except Exception as ex:
             logger.exception('An error occurred sending test reset password'
                              ' email to user.')
@@ -0,0 +1,118 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import logging
+
+import skygear
+
+from .util.health import STATUS_ERROR, get_health_state
+from .util.circuit import get_circuit_states
+from .util.memory import get_cache_sizes
+from .util.metrics import REQUESTS_IN_PROGRESS
+from .util.ratelimit import get_utilization
+from .util.replica import get_replica_lag
+
+logger = logging.getLogger(__name__)
+try:
+    # Available in py-skygear v1.6
+    from skygear.utils.logging import setLoggerTag
+    setLoggerTag(logger, 'auth_plugin')
+except ImportError:
+    pass
+
+
+def warm_up_templates(template_providers):
+    """
+    Download and compile the templates, recording the outcome as the
+    health of the templates.
+    """
+    errors = []
+    for template_provider in template_providers:
+        for template in template_provider.templates:
+            try:
+                template.get()
+            except Exception as ex:
+                logger.exception('Unable to load template `%s`.',
+                                 template.name)
+                errors.append('{}: {}'.format(template.name, ex))
+
+    if errors:
+        get_health_state().set_error('templates', '; '.join(errors))
+    else:
+        get_health_state().set_ok('templates')
+
+
+def retry_template_warm_up(template_providers):
+    """
+    Load the templates again if the last warm up failed, so that the
+    plugin becomes ready once a transient download failure is over.
+    """
+    if get_health_state().get_status('templates') != STATUS_ERROR:
+        return
+    warm_up_templates(template_providers)
+
+
+def get_health_report():
+    state = get_health_state()
+    return {
+        'ready': state.is_ready(),
+        'components': state.get_components(),
+        'requests_in_progress': REQUESTS_IN_PROGRESS.total(),
+        'caches': get_cache_sizes(),
+        'rate_limits': get_utilization(),
+        'circuits': get_circuit_states(),
+        'replica_lag': get_replica_lag(),
+    }
+
+
+def register_handlers(**kwargs):
+    """
+    Register template warm up and HTTP handler reporting the health of the
+    plugin
+    """
+    template_providers = kwargs['template_providers']
+    health_settings = kwargs['health_settings']
+
+    get_health_state().register('templates', required=True)
+
+    @skygear.event('before-plugins-ready')
+    def warm_up(*args, **kwargs):
+        """
+        Plugin event handler for loading templates before server is ready.
+        """
+        warm_up_templates(template_providers)
+
+    if health_settings.template_retry_interval:
+        @skygear.every(health_settings.template_retry_interval,
+                       name='forgot_password.retry_template_warm_up')
+        def retry_warm_up():
+            """
+            Load the templates again if they failed to load.
+            """
+            retry_template_warm_up(template_providers)
+
+    if not health_settings.enable:
+        return
+
+    @skygear.handler('forgot-password:health', method=['GET'])
+    def health_handler(request):
+        """
+        A handler reporting the health of the plugin from in-memory state.
+        It responds with status 503 until the plugin is ready.
+        """
+        report = get_health_report()
+        return skygear.Response(json.dumps(report, sort_keys=True),
+                                status=200 if report['ready'] else 503,
+                                content_type='application/json',
+                                headers=[('Cache-Control', 'no-store')])
@@ -0,0 +1,52 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import skygear
+from skygear import error as skyerror
+from skygear.error import SkygearException
+from skygear.utils.context import current_context
+
+from .util.memory import get_memory_tracker
+from .util.metrics import instrument
+
+
+def register_op(**kwargs):
+    """
+    Register lambda function reporting memory allocations of the plugin
+    """
+    if get_memory_tracker() is None:
+        return
+
+    @skygear.op('forgot-password:memory', key_required=True)
+    @instrument('op', 'forgot-password:memory')
+    def get_memory_report(limit=20, key_type='lineno'):
+        """
+        Lambda function returning the top allocation sites, the growth
+        since the previous call and the sizes of the plugin caches.
+
+        `key_type` is `lineno`, `filename` or `traceback`.
+        """
+        access_key_type = current_context().get('access_key_type')
+        if not access_key_type or access_key_type != 'master':
+            raise SkygearException(
+                'master key is required',
+                skyerror.AccessKeyNotAccepted
+            )
+
+        if key_type not in ('lineno', 'filename', 'traceback'):
+            raise SkygearException(
+                'key_type `{}` is not valid'.format(key_type),
+                skyerror.InvalidArgument
+            )
+
+        return get_memory_tracker().report(limit=limit, key_type=key_type)
@@ -0,0 +1,33 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import skygear
+
+from .util.metrics import CONTENT_TYPE, render_metrics
+
+
+def register_handlers(**kwargs):
+    """
+    Register HTTP handler exposing metrics in Prometheus text format
+    """
+    metrics_settings = kwargs['metrics_settings']
+    if not metrics_settings.enable:
+        return
+
+    @skygear.handler('forgot-password:metrics', method=['GET'])
+    def metrics_handler(request):
+        """
+        A handler for Prometheus to scrape metrics of the plugin.
+        """
+        return skygear.Response(render_metrics(), status=200,
+                                content_type=CONTENT_TYPE)
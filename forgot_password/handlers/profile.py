@@ -0,0 +1,65 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import skygear
+from skygear import error as skyerror
+from skygear.error import SkygearException
+from skygear.utils.context import current_context
+
+from .util.metrics import instrument
+from .util.profiler import get_profiler
+
+
+def register_op(**kwargs):
+    """
+    Register lambda function returning the latest profile of an op or
+    handler
+    """
+    if get_profiler() is None:
+        return
+
+    @skygear.op('forgot-password:profile', key_required=True)
+    @instrument('op', 'forgot-password:profile')
+    def get_profile(name, sort='cumulative', limit=30, flush=False):
+        """
+        Lambda function returning the latest profile of an op or handler,
+        such as `user:verify_request`, as printed by pstats.
+
+        Specify `flush` to dump the stats aggregated so far before
+        returning the latest profile.
+        """
+        access_key_type = current_context().get('access_key_type')
+        if not access_key_type or access_key_type != 'master':
+            raise SkygearException(
+                'master key is required',
+                skyerror.AccessKeyNotAccepted
+            )
+
+        if not name:
+            raise SkygearException('name must be set',
+                                   skyerror.InvalidArgument)
+
+        profiler = get_profiler()
+        if flush:
+            profiler.dump()
+
+        try:
+            profile = profiler.get_latest_profile(name, sort=sort,
+                                                  limit=limit)
+        except KeyError:
+            raise SkygearException('sort key `{}` is not valid'.format(sort),
+                                   skyerror.InvalidArgument)
+        if not profile:
+            raise SkygearException('no profile for `{}` yet'.format(name),
+                                   skyerror.ResourceNotFound)
+        return profile
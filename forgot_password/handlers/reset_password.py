@@ -20,10 +20,15 @@ from urllib.parse import ParseResult, parse_qsl, urlencode, urlparse
 import skygear
 from skygear import error as skyerror
 from skygear.error import SkygearException
-from skygear.utils.db import conn
 
+from ..deadline import with_request_deadline
 from ..template import FileTemplate
 from .util import user as user_util
+from .util.attempt import AttemptRejected
+from .util.db import conn, with_request_connection
+from .util.metrics import instrument
+from .util.response import (RenderedPage, cached_html_response,
+                            html_response)
 
 logger = logging.getLogger(__name__)
 try:
@@ -43,9 +48,10 @@ ResetPasswordRequestParams = namedtuple(
     ['code', 'user_id', 'expire_at', 'user', 'user_record'])
 
 
-def get_validated_request_parameters(db_connection, request):
+def get_request_parameters(request):
     """
-    Validates reset password request parameters, return it if it is valid.
+    Validates reset password request parameters without accessing the
+    database, return code, user_id and expire_at if they are valid.
     """
     code = request.values.get('code')
     user_id = request.values.get('user_id')
@@ -65,6 +71,18 @@ def get_validated_request_parameters(db_connection, request):
     except ValueError:
         raise IllegalArgumentError('expire_at is malformed')
 
+    if not user_util.precheck_code(user_id, code, expire_at):
+        raise IllegalArgumentError('code is invalid or expired')
+
+    return code, user_id, expire_at
+
+
+def get_validated_request_parameters(db_connection, code, user_id,
+                                     expire_at):
+    """
+    Validates reset password request parameters against the database,
+    return it if it is valid.
+    """
     user = user_util.get_user_and_validate_code(db_connection, user_id,
                                                 code, expire_at)
 
@@ -117,14 +135,14 @@ def response_url_redirect(url, **kwargs):
                             headers=[('Location', new_url.geturl())])
 
 
-def response_form(template_provider, **kwargs):
+def response_form(template_provider, request=None, **kwargs):
     body = template_provider.\
         get_template('reset_password_form').\
         render(**kwargs)
-    return skygear.Response(body, content_type='text/html')
+    return html_response(request, RenderedPage(body))
 
 
-def response_success(template_provider, settings, **kwargs):
+def response_success(template_provider, settings, request=None, **kwargs):
     # filter some kwargs since some are not capable to be embedded in url
     # for redirection
     filtered_kwargs = {
@@ -141,10 +159,11 @@ def response_success(template_provider, settings, **kwargs):
         get_template('reset_password_success').\
         render(**kwargs)
 
-    return skygear.Response(body, content_type='text/html')
+    return html_response(request, RenderedPage(body))
 
 
-def response_params_error(template_provider, settings, **kwargs):
+def response_params_error(template_provider, settings, request=None,
+                          **kwargs):
     kwargs['error'] = 'Invalid URL'
 
     # filter some kwargs since some are not capable to be embedded in url
@@ -156,13 +175,11 @@ def response_params_error(template_provider, settings, **kwargs):
     if settings.error_redirect:
         return response_url_redirect(settings.error_redirect,
                                      **filtered_kwargs)
-    body = template_provider.\
-        get_template('reset_password_error').\
-        render(**kwargs)
-    return skygear.Response(body, status=400, content_type='text/html')
+    template = template_provider.get_template('reset_password_error')
+    return cached_html_response(request, template, status=400, **kwargs)
 
 
-def response_error(template_provider, settings, **kwargs):
+def response_error(template_provider, settings, request=None, **kwargs):
     # filter some kwargs since some are not capable to be embedded in url
     # for redirection
     filtered_kwargs = {
@@ -174,7 +191,7 @@ def response_error(template_provider, settings, **kwargs):
     if settings.error_redirect:
         return response_url_redirect(settings.error_redirect,
                                      **filtered_kwargs)
-    return response_form(template_provider, **kwargs)
+    return response_form(template_provider, request=request, **kwargs)
 
 
 def add_templates(template_provider, settings):
@@ -194,7 +211,12 @@ def register_op(**kwargs):
     """
     Register lambda function handling reset password request
     """
+    attempt_guard = kwargs['attempt_guard']
+
     @skygear.op('user:reset-password')
+    @instrument('op', 'user:reset-password')
+    @with_request_deadline
+    @with_request_connection
     def reset_password(user_id, code, expire_at, new_password):
         """
         Lambda function to handle reset password request.
@@ -210,12 +232,27 @@ def register_op(**kwargs):
             raise SkygearException('expire_at must be set',
                                    skyerror.InvalidArgument)
 
+        # The op is called without authentication, so the caller is not
+        # known. Only bad codes are remembered; counting failures by the
+        # user_id would let anyone lock a user out of resetting.
+        attempt_key = ('reset', user_id, code, expire_at)
+        try:
+            attempt_guard.check(None, attempt_key)
+        except AttemptRejected as ex:
+            raise SkygearException(str(ex), skyerror.PermissionDenied)
+
+        if not user_util.precheck_code(user_id, code, expire_at):
+            attempt_guard.record_failure(None, attempt_key)
+            raise SkygearException('user_id is not found or code invalid',
+                                   skyerror.ResourceNotFound)
+
         with conn() as c:
             user = user_util.get_user_and_validate_code(c,
                                                         user_id,
                                                         code,
                                                         expire_at)
             if not user:
+                attempt_guard.record_failure(None, attempt_key)
                 raise SkygearException('user_id is not found or code invalid',
                                        skyerror.ResourceNotFound)
 
@@ -234,17 +271,33 @@ def register_handlers(**kwargs):
     """
     template_provider = kwargs['template_provider']
     settings = kwargs['settings']
+    attempt_guard = kwargs['attempt_guard']
 
     @skygear.handler('reset-password', method=['GET', 'POST'])
+    @instrument('handler', 'reset-password')
+    @with_request_deadline
+    @with_request_connection
     def reset_password_form_handler(request):
         """
         A handler for reset password requests.
         """
-        with conn() as c:
-            try:
-                params = get_validated_request_parameters(c, request)
-            except IllegalArgumentError:
-                return response_params_error(template_provider, settings)
+        caller = attempt_guard.get_caller(request)
+        attempt_key = None
+        try:
+            attempt_guard.check(caller)
+            code, user_id, expire_at = get_request_parameters(request)
+            attempt_key = ('reset', user_id, code, expire_at)
+            attempt_guard.check(caller, attempt_key)
+            with conn() as c:
+                params = get_validated_request_parameters(c, code, user_id,
+                                                          expire_at)
+        except AttemptRejected:
+            return response_params_error(template_provider, settings,
+                                         request=request)
+        except IllegalArgumentError:
+            attempt_guard.record_failure(caller, attempt_key)
+            return response_params_error(template_provider, settings,
+                                         request=request)
 
         template_params = {
             'user': params.user,
@@ -255,7 +308,8 @@ def register_handlers(**kwargs):
         }
 
         if request.method != 'POST':
-            return response_form(template_provider, **template_params)
+            return response_form(template_provider, request=request,
+                                 **template_params)
 
         # Handle form submission
         try:
@@ -264,9 +318,11 @@ def register_handlers(**kwargs):
             logger.info('Successfully reset password for user.')
             return response_success(template_provider,
                                     settings,
+                                    request=request,
                                     **template_params)
         except Exception as ex:
             return response_error(template_provider,
                                   settings,
+                                  request=request,
                                   error=str(ex),
                                   **template_params)
@@ -0,0 +1,42 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import skygear
+from skygear.utils.db import conn
+
+
+def register_events(**kwargs):
+    """
+    Register events creating and purging the send limit table
+    """
+    send_limits = kwargs['send_limits']
+    if not send_limits.enabled:
+        return
+
+    @skygear.event('before-plugins-ready')
+    def create_send_limit_table(*args, **kwargs):
+        """
+        Plugin event handler for creating the send limit table before server
+        is ready.
+        """
+        with conn() as c:
+            send_limits.limiter.create_table(c)
+
+    @skygear.every(send_limits.limiter.window,
+                   name='forgot_password.purge_send_limits')
+    def purge_send_limits():
+        """
+        Delete send limits of keys without recent sends.
+        """
+        with conn() as c:
+            send_limits.limiter.purge(c)
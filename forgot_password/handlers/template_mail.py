@@ -17,6 +17,7 @@ import logging
 
 from ..template import StringTemplate
 from .util import email as email_util
+from .util.metrics import observe_provider_send
 
 logger = logging.getLogger(__name__)
 try:
@@ -96,9 +97,12 @@ class TemplateMailSender:
             smtp_login=self.smtp_settings.login,
             smtp_password=self.smtp_settings.password,
         )
-        mailer.send_mail(sender,
-                         email,
-                         subject,
-                         text_template.render(**template_params),
-                         html=html_template.render(**template_params),
-                         reply_to=reply_to)
+        text_body = text_template.render(**template_params)
+        html_body = html_template.render(**template_params)
+        with observe_provider_send('smtp', self.text_template_name):
+            mailer.send_mail(sender,
+                             email,
+                             subject,
+                             text_body,
+                             html=html_body,
+                             reply_to=reply_to)
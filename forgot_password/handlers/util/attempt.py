@@ -0,0 +1,146 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import ipaddress
+import logging
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+try:
+    # Available in py-skygear v1.6
+    from skygear.utils.logging import setLoggerTag
+    setLoggerTag(logger, 'auth_plugin')
+except ImportError:
+    pass
+
+
+class AttemptRejected(Exception):
+    def __init__(self, reason):
+        self._reason = reason
+
+    @property
+    def reason(self):
+        return self._reason
+
+    def __str__(self):
+        return self.reason
+
+
+class AttemptGuard:
+    """
+    Short-circuit known-bad code submissions before they reach the
+    database.
+
+    Failed `(subject, code)` pairs are kept in a bounded negative cache for
+    a short TTL. Failures are also counted per caller; callers with more
+    than `max_failures` failures within `failure_window` seconds are
+    rejected until the window ends.
+
+    The caller of an HTTP handler request is its client address, as
+    forwarded by skygear-server and the `trusted_proxies`.
+    """
+    def __init__(self, cache_size=10000, cache_ttl=60, max_failures=20,
+                 failure_window=300, trusted_proxies=()):
+        self._negative_cache = TTLCache(cache_size, cache_ttl)
+        self._failures = TTLCache(cache_size, failure_window)
+        self._max_failures = max_failures
+        self._trusted_proxies = parse_trusted_proxies(trusted_proxies)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(cache_size=settings.cache_size,
+                   cache_ttl=settings.cache_ttl,
+                   max_failures=settings.max_failures,
+                   failure_window=settings.failure_window,
+                   trusted_proxies=settings.trusted_proxies or ())
+
+    @property
+    def negative_cache(self):
+        return self._negative_cache
+
+    @property
+    def failures(self):
+        return self._failures
+
+    def get_caller(self, request):
+        return get_request_caller(request, self._trusted_proxies)
+
+    def check(self, caller, key=None):
+        """
+        Raise AttemptRejected if the caller has too many failures or
+        the key is known to be bad.
+        """
+        if self._max_failures and caller is not None \
+                and self._failures.get(caller, 0) >= self._max_failures:
+            logger.info('Rejected attempt from caller with too many '
+                        'failures.')
+            raise AttemptRejected('too many failed attempts')
+        if key is not None and key in self._negative_cache:
+            raise AttemptRejected('code is not valid')
+
+    def record_failure(self, caller, key=None):
+        """
+        Record a failed attempt of the caller, and remember the key as bad.
+        """
+        if key is not None:
+            self._negative_cache.set(key)
+        if caller is not None:
+            self._failures.increment(caller)
+
+
+def parse_trusted_proxies(proxies):
+    """
+    Return the networks of the trusted proxies, given as a comma-separated
+    string or a list of addresses and CIDR ranges.
+    """
+    if isinstance(proxies, str):
+        proxies = proxies.split(',')
+    return [ipaddress.ip_network(proxy.strip(), strict=False)
+            for proxy in proxies if proxy.strip()]
+
+
+def _is_trusted(address, trusted_proxies):
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in network for network in trusted_proxies)
+
+
+def get_request_caller(request, trusted_proxies=()):
+    """
+    Return the client address of an HTTP handler request.
+
+    Handler requests are relayed by skygear-server, which is the trusted
+    hop: py-skygear rebuilds them without a remote address, and
+    skygear-server appends the address it was called from to
+    `X-Forwarded-For`. The caller is the rightmost address of
+    `X-Forwarded-For` that is not one of the `trusted_proxies` returned by
+    `parse_trusted_proxies`, such as load balancers in front of
+    skygear-server. Addresses further left are set by the client and are
+    not used.
+    """
+    forwarded_for = request.headers.get('X-Forwarded-For')
+    if not forwarded_for:
+        return request.remote_addr or None
+
+    address = None
+    for hop in reversed(forwarded_for.split(',')):
+        hop = hop.strip()
+        if not hop:
+            continue
+        address = hop
+        if not _is_trusted(hop, trusted_proxies):
+            break
+    return address
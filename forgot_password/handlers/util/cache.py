@@ -0,0 +1,89 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    A thread-safe in-memory cache holding at most `maxsize` entries, each
+    of which expires `ttl` seconds after it is set. The least recently set
+    entry is evicted when the cache is full.
+    """
+    def __init__(self, maxsize, ttl, timer=time.monotonic):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._timer = timer
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expire_at, value = self._entries[key]
+            except KeyError:
+                return default
+            if expire_at <= self._timer():
+                del self._entries[key]
+                return default
+            return value
+
+    def set(self, key, value=True, ttl=None):
+        ttl = self._ttl if ttl is None else ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            while len(self._entries) >= self._maxsize > 0:
+                self._entries.popitem(last=False)
+            self._entries[key] = (self._timer() + ttl, value)
+
+    def increment(self, key, delta=1):
+        """
+        Increment the counter stored in the key and return the new value.
+        The expiry of an existing entry is kept unchanged.
+        """
+        with self._lock:
+            now = self._timer()
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                self._entries.pop(key, None)
+                while len(self._entries) >= self._maxsize > 0:
+                    self._entries.popitem(last=False)
+                entry = (now + self._ttl, 0)
+            value = entry[1] + delta
+            self._entries[key] = (entry[0], value)
+            return value
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key):
+        sentinel = object()
+        return self.get(key, sentinel) is not sentinel
+
+    def __len__(self):
+        return len(self._entries)
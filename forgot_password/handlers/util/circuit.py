@@ -0,0 +1,271 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+try:
+    # Available in py-skygear v1.6
+    from skygear.utils.logging import setLoggerTag
+    setLoggerTag(logger, 'auth_plugin')
+except ImportError:
+    pass
+
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+STATE_VALUES = {
+    STATE_CLOSED: 0,
+    STATE_HALF_OPEN: 1,
+    STATE_OPEN: 2,
+}
+
+CIRCUIT_STATE = registry.gauge(
+    'forgot_password_circuit_state',
+    'State of the circuit breaker of an SMTP relay or SMS account '
+    '(0 closed, 1 half open, 2 open).',
+    ('circuit',))
+CIRCUIT_REJECTIONS = registry.counter(
+    'forgot_password_circuit_rejections_total',
+    'Number of sends rejected because the circuit breaker is open.',
+    ('circuit',))
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name, retry_after):
+        self.name = name
+        self.retry_after = retry_after
+        super().__init__('`{}` is unavailable, retry in {:.0f}s'
+                         .format(name, retry_after))
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of an SMTP relay or SMS account.
+
+    The circuit opens after `failure_threshold` consecutive failed sends.
+    Only failures of the relay or account, such as connection errors,
+    timeouts and server errors, are counted; errors caused by the message,
+    such as an invalid recipient, are not. A send taking longer than
+    `latency_threshold` seconds counts as a failure even if it succeeds.
+    While the circuit is open, sends fail immediately. After
+    `reset_timeout` seconds the circuit is half open and up to
+    `half_open_max` trial sends are let through; the circuit closes if they
+    succeed and opens again if they fail.
+    """
+    def __init__(self, name, failure_threshold=5, latency_threshold=0,
+                 reset_timeout=30, half_open_max=1, timer=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.latency_threshold = latency_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+        self._timer = timer
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trials = 0
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(name, value=STATE_VALUES[STATE_CLOSED])
+
+    @property
+    def state(self):
+        with self._lock:
+            self._update_state()
+            return self._state
+
+    def _set_state(self, state):
+        if state != self._state:
+            logger.warning('Circuit of `%s` is now %s.', self.name, state)
+        self._state = state
+        CIRCUIT_STATE.set(self.name, value=STATE_VALUES[state])
+
+    def _update_state(self):
+        if self._state == STATE_OPEN and \
+                self._timer() - self._opened_at >= self.reset_timeout:
+            self._set_state(STATE_HALF_OPEN)
+            self._trials = 0
+
+    def before_call(self):
+        """
+        Raise CircuitOpenError if the send is not allowed.
+        """
+        with self._lock:
+            self._update_state()
+            if self._state == STATE_CLOSED:
+                return
+            if self._state == STATE_HALF_OPEN and \
+                    self._trials < self.half_open_max:
+                self._trials += 1
+                return
+            if self._opened_at is None:
+                retry_after = 0
+            else:
+                retry_after = max(0, self._opened_at + self.reset_timeout -
+                                  self._timer())
+        CIRCUIT_REJECTIONS.inc(self.name)
+        raise CircuitOpenError(self.name, retry_after)
+
+    def _open(self):
+        self._opened_at = self._timer()
+        self._set_state(STATE_OPEN)
+
+    def record_success(self, duration=0):
+        if self.latency_threshold and duration > self.latency_threshold:
+            logger.warning('Send through `%s` took %.2fs.', self.name,
+                           duration)
+            self.record_failure()
+            return
+        with self._lock:
+            self._failures = 0
+            if self._state == STATE_HALF_OPEN:
+                self._set_state(STATE_CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == STATE_HALF_OPEN or \
+                    self._failures >= self.failure_threshold:
+                self._open()
+
+    def release(self):
+        """
+        Give back a trial send allowed by `before_call` whose outcome is not
+        recorded.
+        """
+        with self._lock:
+            if self._state == STATE_HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def call(self, func, *args, is_failure=None, **kwargs):
+        """
+        Call the function if the circuit allows, recording its outcome.
+
+        An error is recorded as a failure if `is_failure` returns True for
+        it, or if `is_failure` is not given. Other errors are raised without
+        being recorded.
+        """
+        self.before_call()
+        return self.record_call(func, *args, is_failure=is_failure, **kwargs)
+
+    def record_call(self, func, *args, is_failure=None, **kwargs):
+        """
+        Call the function allowed by `before_call`, recording its outcome
+        like `call`.
+        """
+        start = self._timer()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as ex:
+            if is_failure is None or is_failure(ex):
+                self.record_failure()
+            else:
+                self.release()
+            raise
+        self.record_success(self._timer() - start)
+        return result
+
+
+_settings = None
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def configure_circuit_breakers(settings):
+    """
+    Configure the circuit breakers of SMTP relays and SMS accounts with the
+    specified circuit settings.
+    """
+    global _settings
+    with _breakers_lock:
+        _settings = settings
+        _breakers.clear()
+
+
+def get_circuit_breaker(name):
+    """
+    Return the circuit breaker of an SMTP relay or SMS account, or None if
+    circuit breakers are disabled.
+    """
+    if not getattr(_settings, 'failure_threshold', 0):
+        return None
+
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(name)
+            if breaker is None:
+                breaker = _breakers[name] = CircuitBreaker(
+                    name,
+                    failure_threshold=_settings.failure_threshold,
+                    latency_threshold=_settings.latency_threshold,
+                    reset_timeout=_settings.reset_timeout,
+                    half_open_max=_settings.half_open_max)
+    return breaker
+
+
+def _call(func, *args, is_failure=None, **kwargs):
+    return func(*args, **kwargs)
+
+
+@contextmanager
+def circuit_breaker(name):
+    """
+    Context manager checking the circuit breaker of an SMTP relay or SMS
+    account named `name` before the block runs, so that the block fails
+    immediately while the circuit is open. It yields a function making the
+    send like `call_with_circuit_breaker`, which is expected to be called
+    once in the block.
+    """
+    breaker = get_circuit_breaker(name)
+    if breaker is None:
+        yield _call
+        return
+
+    breaker.before_call()
+    calls = []
+
+    def call(func, *args, is_failure=None, **kwargs):
+        calls.append(func)
+        return breaker.record_call(func, *args, is_failure=is_failure,
+                                   **kwargs)
+
+    try:
+        yield call
+    finally:
+        if not calls:
+            breaker.release()
+
+
+def call_with_circuit_breaker(name, func, *args, is_failure=None, **kwargs):
+    """
+    Call the function through the circuit breaker of an SMTP relay or SMS
+    account named `name`. Only errors for which `is_failure` returns True
+    are recorded as failures, if it is given.
+    """
+    breaker = get_circuit_breaker(name)
+    if breaker is None:
+        return func(*args, **kwargs)
+    return breaker.call(func, *args, is_failure=is_failure, **kwargs)
+
+
+def get_circuit_states():
+    return {name: breaker.state
+            for name, breaker in sorted(_breakers.items())}
@@ -0,0 +1,146 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from skygear.container import PayloadEncoder, SkygearContainer
+from skygear.options import options as skyoptions
+from skygear.transmitter.http import HttpTransport
+
+from ...deadline import DeadlineExceeded, get_timeout
+from ...timing import span
+from .db import release_connection
+
+logger = logging.getLogger(__name__)
+try:
+    # Available in py-skygear v1.6
+    from skygear.utils.logging import setLoggerTag
+    setLoggerTag(logger, 'auth_plugin')
+except ImportError:
+    pass
+
+
+# Actions that can be sent again safely when the connection to
+# skygear-server fails before a response is received.
+IDEMPOTENT_ACTIONS = frozenset([
+    'record:fetch',
+    'schema:fetch',
+    'schema:field_access:get',
+    'schema:field_access:update',
+])
+
+
+class PooledHttpTransport:
+    """
+    Transport sending actions to skygear-server over a keep-alive HTTP
+    connection pool.
+
+    It replaces the py-skygear HTTP transport, which opens a new connection
+    for every action.
+    """
+    def __init__(self, pool_size=10, timeout=60, max_retries=2):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Content-type': 'application/json',
+            'Accept': 'application/json',
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def send_action(self, action_name, payload, url, timeout=None):
+        data = json.dumps(payload, cls=PayloadEncoder)
+        timeout = timeout or self.timeout
+        attempts = 1
+        if action_name in IDEMPOTENT_ACTIONS:
+            attempts += self.max_retries
+
+        for attempt in range(attempts):
+            # A retry only gets the time left before the request deadline
+            attempt_timeout = get_timeout(
+                'container:{}'.format(action_name), timeout)
+            try:
+                return self.session.post(url, data=data,
+                                         timeout=attempt_timeout).json()
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt + 1 >= attempts:
+                    raise
+                logger.warning('Retrying action `%s` after connection '
+                               'error.', action_name)
+
+
+_settings = None
+_container = None
+_container_lock = threading.Lock()
+
+
+def configure_container(settings):
+    """
+    Configure the shared container with the specified container settings.
+
+    The container is created lazily because the default transport is only
+    known after the plugin has started.
+    """
+    global _settings, _container
+    with _container_lock:
+        _settings = settings
+        _container = None
+
+
+def _create_container():
+    transport = None
+    if isinstance(SkygearContainer.transport, HttpTransport):
+        transport = PooledHttpTransport(
+            pool_size=getattr(_settings, 'pool_size', 10),
+            timeout=getattr(_settings, 'timeout', 60),
+            max_retries=getattr(_settings, 'max_retries', 2),
+        )
+    return SkygearContainer(api_key=skyoptions.masterkey,
+                            transport=transport)
+
+
+def get_container():
+    """
+    Return the container shared by all server actions sent by the plugin.
+    """
+    global _container
+    if _container is None:
+        with _container_lock:
+            if _container is None:
+                _container = _create_container()
+    return _container
+
+
+def send_action(action_name, params):
+    """
+    Send an action to skygear-server with the shared container.
+    """
+    operation = 'container:{}'.format(action_name)
+    release_connection()
+    timeout = get_timeout(operation, getattr(_settings, 'timeout', 60))
+    with span(operation):
+        try:
+            return get_container().send_action(
+                action_name,
+                params,
+                plugin_request=True,
+                timeout=timeout
+            )
+        except requests.Timeout:
+            raise DeadlineExceeded(operation)
@@ -0,0 +1,136 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import functools
+import sys
+import threading
+from contextlib import ExitStack, contextmanager
+
+from skygear.utils.db import conn as skygear_conn
+
+_local = threading.local()
+
+
+class RequestConnection:
+    """
+    The database connection shared by the calls of `conn()` in a request.
+    The connection is checked out on first use and its transaction spans
+    the rest of the request, or until it is released before an outbound
+    call.
+    """
+    def __init__(self):
+        self._stack = None
+        self._connection = None
+        self.depth = 0
+
+    def get(self):
+        if self._connection is None:
+            stack = ExitStack()
+            self._connection = stack.enter_context(skygear_conn())
+            self._stack = stack
+        return self._connection
+
+    def close(self, exc_type=None, exc_value=None, traceback=None):
+        """
+        Commit the transaction and return the connection to the pool, or
+        roll back if closed with an exception.
+        """
+        stack, self._stack, self._connection = self._stack, None, None
+        if stack is not None:
+            stack.__exit__(exc_type, exc_value, traceback)
+
+
+@contextmanager
+def request_connection():
+    """
+    Context manager sharing one database connection among the calls of
+    `conn()` until it exits. Nested scopes use the enclosing one.
+    """
+    if getattr(_local, 'connection', None) is not None:
+        yield
+        return
+
+    connection = _local.connection = RequestConnection()
+    try:
+        yield
+    except BaseException:
+        _local.connection = None
+        connection.close(*sys.exc_info())
+        raise
+    _local.connection = None
+    connection.close()
+
+
+def with_request_connection(func):
+    """
+    Decorator running an op, handler or hook in a `request_connection()`
+    scope, so that its database queries share one connection and
+    transaction.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with request_connection():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def conn():
+    """
+    Context manager yielding a connection to the Skygear database.
+
+    Within a request, the connection of the request is yielded. An error
+    raised in the block rolls back the transaction of the request, and the
+    next call checks out a new connection. Otherwise, each call has a
+    connection and transaction of its own.
+    """
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        with skygear_conn() as c:
+            yield c
+        return
+
+    connection.depth += 1
+    try:
+        yield connection.get()
+    except BaseException:
+        connection.close(*sys.exc_info())
+        raise
+    finally:
+        connection.depth -= 1
+
+
+@contextmanager
+def own_conn():
+    """
+    Context manager yielding a connection and transaction of its own, even
+    within a request, such as to hold a lock while the connection of the
+    request is released.
+    """
+    with skygear_conn() as c:
+        yield c
+
+
+def release_connection():
+    """
+    Commit the transaction of the request and return its connection to the
+    pool. It is called before slow outbound calls, such as sending a
+    message, so that the writes of the request are kept even if the call
+    fails, and locks and connections are not held while waiting. The next
+    call of `conn()` checks out a connection again.
+
+    Nothing is released while a `conn()` block is running.
+    """
+    connection = getattr(_local, 'connection', None)
+    if connection is not None and not connection.depth:
+        connection.close()
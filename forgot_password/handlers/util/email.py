@@ -12,9 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import logging
+import smtplib
+import socket
 
 import pyzmail
 
+from ...deadline import DeadlineExceeded, get_timeout
+from ...timing import span
+from . import ratelimit
+from .circuit import CircuitOpenError, circuit_breaker
+from .db import release_connection
+
 logger = logging.getLogger(__name__)
 try:
     # Available in py-skygear v1.6
@@ -24,6 +32,46 @@ except ImportError:
     pass
 
 
+def send_mail2(payload, mail_from, rcpt_to, smtp_host, smtp_port=25,
+               smtp_mode='normal', smtp_login=None, smtp_password=None,
+               timeout=None):
+    """
+    Send the message to a SMTP host, like `pyzmail.send_mail2`, but with a
+    timeout on the connection and every SMTP command.
+    """
+    if timeout is None:
+        timeout = socket.getdefaulttimeout()
+    if smtp_mode == 'ssl':
+        smtp = smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=timeout)
+    else:
+        smtp = smtplib.SMTP(smtp_host, smtp_port, timeout=timeout)
+        if smtp_mode == 'tls':
+            smtp.starttls()
+
+    try:
+        if smtp_login and smtp_password:
+            smtp.login(smtp_login, smtp_password)
+        return smtp.sendmail(mail_from, rcpt_to, payload)
+    finally:
+        try:
+            smtp.quit()
+        except Exception:
+            pass
+
+
+def is_smtp_failure(ex):
+    """
+    Return whether an error sending email is a failure of the SMTP relay,
+    rather than one caused by the message, such as a refused recipient.
+    """
+    if isinstance(ex, smtplib.SMTPRecipientsRefused):
+        return False
+    if isinstance(ex, smtplib.SMTPDataError) and ex.smtp_code >= 500:
+        return False
+    # Connection errors, timeouts and other SMTP errors
+    return isinstance(ex, OSError)
+
+
 class Mailer:
     def __init__(self, **smtp_params):
         self.smtp_params = smtp_params
@@ -57,15 +105,33 @@ class Mailer:
             )
             headers.append(('Reply-To', reply_to_value))
 
-        payload, mail_from, rcpt_to, msg_id = pyzmail.compose_mail(
-            sender_tuple, [to], subject, encoding, text_args,
-            html=html_args, headers=headers)
+        with span('compose'):
+            payload, mail_from, rcpt_to, msg_id = pyzmail.compose_mail(
+                sender_tuple, [to], subject, encoding, text_args,
+                html=html_args, headers=headers)
 
+        relay = 'smtp:{}:{}'.format(self.smtp_params.get('smtp_host'),
+                                    self.smtp_params.get('smtp_port', 25))
+        release_connection()
         try:
-            pyzmail.send_mail2(payload,
-                               mail_from,
-                               rcpt_to,
-                               **self.smtp_params)
+            # The circuit is checked first, so that an open circuit fails
+            # without waiting for the rate limit.
+            with circuit_breaker(relay) as call:
+                ratelimit.acquire('smtp', relay)
+                with span('smtp'):
+                    call(send_mail2,
+                         payload,
+                         mail_from,
+                         rcpt_to,
+                         timeout=get_timeout(relay),
+                         is_failure=is_smtp_failure,
+                         **self.smtp_params)
+        except socket.timeout:
+            logger.error('Timed out sending email through `%s`.', relay)
+            raise DeadlineExceeded(relay)
+        except (CircuitOpenError, DeadlineExceeded,
+                ratelimit.RateLimitExceeded):
+            raise
         except Exception:
             logger.exception('Unable to send email to the receipient.')
             raise Exception('Unable to send email to the receipient.')
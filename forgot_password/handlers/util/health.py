@@ -0,0 +1,95 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import time
+
+STATUS_PENDING = 'pending'
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+
+
+class HealthState:
+    """
+    Status of the components of the plugin.
+
+    The status is updated as a side effect of normal operation, such as
+    downloading templates or sending email, so that it can be reported
+    without probing the dependencies. The plugin is ready when all
+    required components are ok.
+    """
+    def __init__(self, timer=time.time):
+        self._timer = timer
+        self._components = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, required=False):
+        with self._lock:
+            if name not in self._components:
+                self._components[name] = {
+                    'status': STATUS_PENDING,
+                    'required': required,
+                    'updated_at': None,
+                    'failures': 0,
+                    'message': None,
+                }
+            elif required:
+                self._components[name]['required'] = True
+
+    def _update(self, name, status, message=None):
+        with self._lock:
+            component = self._components.get(name)
+            if component is None:
+                component = self._components[name] = {
+                    'required': False,
+                    'failures': 0,
+                }
+            component['status'] = status
+            component['updated_at'] = self._timer()
+            component['message'] = message
+            if status == STATUS_ERROR:
+                component['failures'] += 1
+            else:
+                component['failures'] = 0
+
+    def set_ok(self, name):
+        self._update(name, STATUS_OK)
+
+    def set_error(self, name, message):
+        self._update(name, STATUS_ERROR, str(message))
+
+    def get_status(self, name):
+        component = self._components.get(name)
+        return component['status'] if component else None
+
+    def is_ready(self):
+        with self._lock:
+            return all(component['status'] == STATUS_OK
+                       for component in self._components.values()
+                       if component['required'])
+
+    def get_components(self):
+        with self._lock:
+            return {name: dict(component)
+                    for name, component in self._components.items()}
+
+    def clear(self):
+        with self._lock:
+            self._components.clear()
+
+
+health_state = HealthState()
+
+
+def get_health_state():
+    return health_state
@@ -0,0 +1,71 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import logging
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import func, select
+
+from ...deadline import DeadlineExceeded, get_timeout
+from ...timing import span
+
+logger = logging.getLogger(__name__)
+try:
+    # Available in py-skygear v1.6
+    from skygear.utils.logging import setLoggerTag
+    setLoggerTag(logger, 'auth_plugin')
+except ImportError:
+    pass
+
+
+# SQLSTATE of lock_not_available, raised when lock_timeout is reached
+LOCK_NOT_AVAILABLE = '55P03'
+
+
+def advisory_lock_id(*parts):
+    """
+    Return the 64-bit advisory lock ID of the parts of a key.
+    """
+    key = '\x00'.join(str(part) for part in parts).encode('utf-8')
+    digest = hashlib.sha256(key).digest()
+    return int.from_bytes(digest[:8], 'big', signed=True)
+
+
+def acquire_advisory_lock(c, operation, *parts):
+    """
+    Acquire a transaction-level PostgreSQL advisory lock on the key, which
+    is held until the transaction of the connection ends.
+
+    Return True if the lock was held by another transaction and had to be
+    waited for. The wait is bounded by the request deadline, after which
+    DeadlineExceeded is raised.
+    """
+    lock_id = advisory_lock_id(*parts)
+    with span('db:advisory_lock'):
+        if c.execute(select([func.pg_try_advisory_xact_lock(lock_id)])) \
+                .scalar():
+            return False
+
+        timeout = get_timeout(operation)
+        if timeout:
+            c.execute(select([func.set_config(
+                'lock_timeout', '{}ms'.format(max(int(timeout * 1000), 1)),
+                True)]))
+        try:
+            c.execute(select([func.pg_advisory_xact_lock(lock_id)]))
+        except OperationalError as ex:
+            if getattr(ex.orig, 'pgcode', None) == LOCK_NOT_AVAILABLE:
+                raise DeadlineExceeded(operation)
+            raise
+        return True
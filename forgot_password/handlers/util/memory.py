@@ -0,0 +1,159 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import threading
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+logger = logging.getLogger(__name__)
+try:
+    # Available in py-skygear v1.6
+    from skygear.utils.logging import setLoggerTag
+    setLoggerTag(logger, 'auth_plugin')
+except ImportError:
+    pass
+
+
+# Allocations made by tracemalloc itself are not interesting.
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+_caches = {}
+
+
+def register_cache(name, sizer):
+    """
+    Register a callable returning the number of entries of a plugin cache,
+    so that the size is included in memory reports.
+    """
+    _caches[name] = sizer
+
+
+def get_cache_sizes():
+    sizes = {}
+    for name, sizer in sorted(_caches.items()):
+        try:
+            sizes[name] = sizer()
+        except Exception:
+            logger.exception('Unable to get the size of cache `%s`.', name)
+            sizes[name] = None
+    return sizes
+
+
+def get_max_rss():
+    """
+    Return the maximum resident set size of the process in kilobytes
+    (bytes on macOS), or None if it is not available.
+    """
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _format_statistic(stat):
+    frame = stat.traceback[0]
+    result = {
+        'file': frame.filename,
+        'line': frame.lineno,
+        'size': stat.size,
+        'count': stat.count,
+    }
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        result['size_diff'] = stat.size_diff
+        result['count_diff'] = stat.count_diff
+    if len(stat.traceback) > 1:
+        result['traceback'] = stat.traceback.format()
+    return result
+
+
+class MemoryTracker:
+    """
+    Report top allocation sites and their growth since the previous report
+    with tracemalloc.
+    """
+    def __init__(self, frames=1):
+        self.frames = frames
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+
+    def stop(self):
+        with self._lock:
+            self._previous = None
+        tracemalloc.stop()
+
+    def take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+    def report(self, limit=20, key_type='lineno'):
+        """
+        Take a snapshot and return the top allocation sites, the sites
+        that grew the most since the previous report and the sizes of
+        the plugin caches.
+        """
+        if not tracemalloc.is_tracing():
+            self.start()
+        snapshot = self.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+
+        with self._lock:
+            previous, self._previous = self._previous, snapshot
+
+        top = snapshot.statistics(key_type)[:limit]
+        growth = []
+        if previous is not None:
+            diff = snapshot.compare_to(previous, key_type)
+            growth = [stat for stat in diff if stat.size_diff > 0][:limit]
+
+        return {
+            'traced_memory': {'current': current, 'peak': peak},
+            'max_rss': get_max_rss(),
+            'top': [_format_statistic(stat) for stat in top],
+            'growth': [_format_statistic(stat) for stat in growth],
+            'caches': get_cache_sizes(),
+        }
+
+
+_tracker = None
+
+
+def configure_memory_tracker(settings):
+    """
+    Start tracing memory allocations with the specified memory settings,
+    or stop if it is not enabled.
+    """
+    global _tracker
+    if not getattr(settings, 'enable', False):
+        if _tracker is not None:
+            _tracker.stop()
+        _tracker = None
+        return None
+    _tracker = MemoryTracker(frames=settings.frames)
+    _tracker.start()
+    return _tracker
+
+
+def get_memory_tracker():
+    return _tracker
@@ -0,0 +1,294 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from ...timing import begin_request, end_request, span
+from .health import get_health_state
+from .profiler import profile_call
+
+# Histogram buckets in seconds, covering fast lambdas to slow SMTP relays.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                   5.0, 10.0, float('inf'))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\') \
+        .replace('\n', '\\n') \
+        .replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, _escape_label_value(v))
+                          for k, v in labels) + '}'
+
+
+class Metric:
+    """
+    Base class of a metric family with a fixed set of label names.
+    """
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _labelvalues(self, labelvalues):
+        if len(labelvalues) != len(self.labelnames):
+            raise ValueError('expected labels {}, got {}'.format(
+                self.labelnames, labelvalues))
+        return tuple(str(v) for v in labelvalues)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self):
+        """
+        Return a list of `(name, labels, value)` samples.
+        """
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            '# HELP {} {}'.format(self.name, self.documentation),
+            '# TYPE {} {}'.format(self.name, self.type_name),
+        ]
+        for name, labels, value in self.samples():
+            lines.append('{}{} {}'.format(name, _format_labels(labels),
+                                          _format_value(value)))
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        key = self._labelvalues(labelvalues)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, *labelvalues):
+        return self._values.get(self._labelvalues(labelvalues), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, list(zip(self.labelnames, key)), value)
+                for key, value in items]
+
+
+class Gauge(Counter):
+    """
+    Metric with a value that can go up and down.
+    """
+    type_name = 'gauge'
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, *labelvalues, value):
+        key = self._labelvalues(labelvalues)
+        with self._lock:
+            self._values[key] = value
+
+    def total(self):
+        with self._lock:
+            return sum(self._values.values())
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        buckets = tuple(sorted(buckets))
+        if buckets[-1] != float('inf'):
+            buckets += (float('inf'),)
+        self.buckets = buckets
+
+    def observe(self, value, *labelvalues):
+        key = self._labelvalues(labelvalues)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+
+    def get_count(self, *labelvalues):
+        state = self._values.get(self._labelvalues(labelvalues))
+        return sum(state[0]) if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1]))
+                           for k, v in self._values.items())
+        samples = []
+        for key, (counts, total) in items:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append(('{}_bucket'.format(self.name),
+                                labels + [('le', _format_value(bound))],
+                                cumulative))
+            samples.append(('{}_sum'.format(self.name), labels, total))
+            samples.append(('{}_count'.format(self.name), labels,
+                            cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics exposed in Prometheus text format.
+    """
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), **kwargs):
+        return self.register(Histogram(name, documentation, labelnames,
+                                       **kwargs))
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+    def render(self):
+        return ''.join(metric.render() + '\n' for metric in self._metrics)
+
+
+registry = MetricsRegistry()
+
+REQUESTS = registry.counter(
+    'forgot_password_requests_total',
+    'Number of ops, handlers and hooks called.',
+    ('kind', 'name', 'outcome'))
+REQUESTS_IN_PROGRESS = registry.gauge(
+    'forgot_password_requests_in_progress',
+    'Number of ops, handlers and hooks being called.',
+    ('kind', 'name'))
+REQUEST_DURATION = registry.histogram(
+    'forgot_password_request_duration_seconds',
+    'Time spent in ops, handlers and hooks.',
+    ('kind', 'name'))
+PROVIDER_SENDS = registry.counter(
+    'forgot_password_provider_sends_total',
+    'Number of emails and SMS sent through providers.',
+    ('provider', 'key', 'outcome'))
+PROVIDER_SEND_DURATION = registry.histogram(
+    'forgot_password_provider_send_duration_seconds',
+    'Time spent sending emails and SMS through providers.',
+    ('provider', 'key'))
+LEGACY_CODE_CHECKS = registry.counter(
+    'forgot_password_legacy_code_checks_total',
+    'Number of legacy reset codes checked against the database.',
+    ('outcome',))
+
+
+def _outcome(result):
+    """
+    Handlers return an error page instead of raising, so treat 4xx and 5xx
+    responses as errors.
+    """
+    status_code = getattr(result, 'status_code', None)
+    if isinstance(status_code, int) and status_code >= 400:
+        return 'error'
+    return 'ok'
+
+
+def instrument(kind, name):
+    """
+    Decorator counting calls, errors and latency of an op, handler or hook.
+    The stages of the call are also written to the timing log, and a
+    fraction of the calls are profiled, if enabled.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            timing = begin_request(kind, name)
+            REQUESTS_IN_PROGRESS.inc(kind, name)
+            start = time.perf_counter()
+            outcome = 'error'
+            try:
+                with profile_call(name):
+                    result = func(*args, **kwargs)
+                outcome = _outcome(result)
+                return result
+            finally:
+                REQUEST_DURATION.observe(time.perf_counter() - start,
+                                         kind, name)
+                REQUESTS.inc(kind, name, outcome)
+                REQUESTS_IN_PROGRESS.dec(kind, name)
+                end_request(timing, outcome)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def observe_provider_send(provider, key):
+    """
+    Context manager counting sends, errors and latency of a provider.
+    The outcome is also recorded as the health of the provider.
+    """
+    component = 'provider:{}'.format(provider)
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        with span('send:{}'.format(provider)):
+            yield
+        outcome = 'ok'
+        get_health_state().set_ok(component)
+    except Exception as ex:
+        get_health_state().set_error(component, ex)
+        raise
+    finally:
+        PROVIDER_SEND_DURATION.observe(time.perf_counter() - start,
+                                       provider, key)
+        PROVIDER_SENDS.inc(provider, key, outcome)
+
+
+def render_metrics():
+    return registry.render()
@@ -0,0 +1,208 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+try:
+    # Available in py-skygear v1.6
+    from skygear.utils.logging import setLoggerTag
+    setLoggerTag(logger, 'auth_plugin')
+except ImportError:
+    pass
+
+
+PROFILE_SUFFIX = '.prof'
+
+
+def _file_prefix(name):
+    return re.sub(r'[^A-Za-z0-9_-]+', '_', name) + '-'
+
+
+class SamplingProfiler:
+    """
+    Profile a fraction of calls with cProfile and aggregate the stats per
+    name.
+
+    The aggregated stats are dumped to `directory` every `interval`
+    seconds, and only the latest `keep` dumps of each name are kept.
+    """
+    def __init__(self, directory, sample_rate=0.01, interval=300, keep=12,
+                 timer=time.time):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.keep = keep
+        self._timer = timer
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_dump = timer()
+
+    def should_sample(self):
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @contextmanager
+    def profile(self, name):
+        """
+        Profile the block if it is sampled. Nested blocks are profiled as
+        part of the outermost block.
+        """
+        if getattr(self._local, 'active', False) or not self.should_sample():
+            yield
+            return
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active on this thread.
+            yield
+            return
+
+        self._local.active = True
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._local.active = False
+            self.add(name, profile)
+
+    def add(self, name, profile):
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                self._stats[name] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        if self._timer() - self._last_dump >= self.interval:
+            self.dump()
+
+    def dump(self):
+        """
+        Write the aggregated stats to the profile directory and start
+        aggregating again.
+        """
+        with self._lock:
+            stats, self._stats = self._stats, {}
+            now = self._timer()
+            self._last_dump = now
+
+        os.makedirs(self.directory, exist_ok=True)
+        for name, name_stats in stats.items():
+            path = os.path.join(self.directory, '{}{}{}'.format(
+                _file_prefix(name), int(now * 1000), PROFILE_SUFFIX))
+            try:
+                name_stats.dump_stats(path)
+            except OSError:
+                logger.exception('Unable to write profile of `%s`.', name)
+                continue
+            self._rotate(name)
+
+    def get_profile_paths(self, name):
+        """
+        Return the paths of the dumped profiles of a name, oldest first.
+        """
+        prefix = _file_prefix(name)
+        try:
+            filenames = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        paths = [
+            os.path.join(self.directory, filename)
+            for filename in filenames
+            if filename.startswith(prefix) and
+            filename.endswith(PROFILE_SUFFIX) and
+            filename[len(prefix):-len(PROFILE_SUFFIX)].isdigit()
+        ]
+        return sorted(paths, key=lambda path: int(
+            os.path.basename(path)[len(prefix):-len(PROFILE_SUFFIX)]))
+
+    def _rotate(self, name):
+        paths = self.get_profile_paths(name)
+        for path in paths[:max(len(paths) - self.keep, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def get_latest_profile(self, name, sort='cumulative', limit=30):
+        """
+        Return the latest dumped profile of a name as printed by pstats,
+        or None if there is no profile.
+        """
+        paths = self.get_profile_paths(name)
+        if not paths:
+            return None
+        stream = io.StringIO()
+        stats = pstats.Stats(paths[-1], stream=stream)
+        stats.sort_stats(sort).print_stats(limit)
+        return {
+            'name': name,
+            'path': paths[-1],
+            'stats': stream.getvalue(),
+        }
+
+
+_profiler = None
+
+
+def configure_profiler(settings):
+    """
+    Create the shared profiler with the specified profile settings, or
+    disable profiling if the sample rate is zero.
+    """
+    global _profiler
+    sample_rate = getattr(settings, 'sample_rate', 0) or 0
+    if sample_rate <= 0:
+        _profiler = None
+        return None
+    _profiler = SamplingProfiler(settings.directory,
+                                 sample_rate=sample_rate,
+                                 interval=settings.interval,
+                                 keep=settings.keep)
+    return _profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+class _NullProfile:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_PROFILE = _NullProfile()
+
+
+def profile_call(name):
+    """
+    Return a context manager profiling the block with the shared profiler
+    if profiling is enabled.
+    """
+    if _profiler is None:
+        return _NULL_PROFILE
+    return _profiler.profile(name)
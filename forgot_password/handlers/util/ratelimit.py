@@ -0,0 +1,160 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import threading
+import time
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+try:
+    # Available in py-skygear v1.6
+    from skygear.utils.logging import setLoggerTag
+    setLoggerTag(logger, 'auth_plugin')
+except ImportError:
+    pass
+
+
+RATE_LIMIT_WAIT = registry.histogram(
+    'forgot_password_rate_limit_wait_seconds',
+    'Time spent waiting for the rate limit of an SMTP relay or SMS account.',
+    ('limiter',),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+RATE_LIMIT_REJECTIONS = registry.counter(
+    'forgot_password_rate_limit_rejections_total',
+    'Number of sends rejected because the wait would be too long.',
+    ('limiter',))
+RATE_LIMIT_UTILIZATION = registry.gauge(
+    'forgot_password_rate_limit_utilization',
+    'Fraction of the burst of a rate limit in use after the last send.',
+    ('limiter',))
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, name, wait):
+        self.name = name
+        self.wait = wait
+        super().__init__('rate limit of `{}` exceeded, retry in {:.2f}s'
+                         .format(name, wait))
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` sends per second with bursts of up to
+    `burst` sends.
+
+    A send that arrives when the bucket is empty reserves a future token
+    and waits for it, unless the wait would exceed `max_wait` seconds.
+    """
+    def __init__(self, name, rate, burst, max_wait=1.0,
+                 timer=time.monotonic, sleep=time.sleep):
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_wait = max_wait
+        self._timer = timer
+        self._sleep = sleep
+        self._tokens = float(self.burst)
+        self._updated_at = timer()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+    def reserve(self):
+        """
+        Take a token and return the number of seconds to wait before it can
+        be used. Raise RateLimitExceeded without taking a token if the wait
+        would be longer than `max_wait`.
+        """
+        with self._lock:
+            self._refill(self._timer())
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if wait > self.max_wait:
+                RATE_LIMIT_REJECTIONS.inc(self.name)
+                raise RateLimitExceeded(self.name, wait)
+            self._tokens -= 1
+            RATE_LIMIT_UTILIZATION.set(self.name, value=self.utilization)
+        return wait
+
+    def acquire(self):
+        """
+        Wait until a send is allowed by the rate limit.
+        """
+        wait = self.reserve()
+        RATE_LIMIT_WAIT.observe(wait, self.name)
+        if wait > 0:
+            logger.info('Waiting %.3fs for rate limit of `%s`.', wait,
+                        self.name)
+            self._sleep(wait)
+
+    @property
+    def utilization(self):
+        """
+        Fraction of the burst in use, including reserved tokens. It is
+        above 1 when sends are waiting.
+        """
+        return (self.burst - self._tokens) / self.burst
+
+
+_settings = None
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def configure_rate_limits(settings):
+    """
+    Configure the rate limits of SMTP relays and SMS accounts with the
+    specified rate limit settings.
+    """
+    global _settings
+    with _buckets_lock:
+        _settings = settings
+        _buckets.clear()
+
+
+def _get_bucket(kind, name):
+    rate = getattr(_settings, '{}_rate'.format(kind), 0)
+    if not rate or rate <= 0:
+        return None
+
+    bucket = _buckets.get(name)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.get(name)
+            if bucket is None:
+                bucket = _buckets[name] = TokenBucket(
+                    name,
+                    rate,
+                    getattr(_settings, '{}_burst'.format(kind), 1),
+                    max_wait=getattr(_settings, 'max_wait', 1.0))
+    return bucket
+
+
+def acquire(kind, name):
+    """
+    Wait for the rate limit of an SMTP relay (`kind` is `smtp`) or an SMS
+    account (`kind` is `sms`). Sends sharing the same `name`, such as
+    the relay host or the account ID, share the same limit.
+    """
+    bucket = _get_bucket(kind, name)
+    if bucket is not None:
+        bucket.acquire()
+
+
+def get_utilization():
+    return {name: bucket.utilization
+            for name, bucket in sorted(_buckets.items())}
@@ -0,0 +1,160 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import threading
+import time
+
+import sqlalchemy as sa
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql import text
+
+from .db import conn
+from .health import get_health_state
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+try:
+    # Available in py-skygear v1.6
+    from skygear.utils.logging import setLoggerTag
+    setLoggerTag(logger, 'auth_plugin')
+except ImportError:
+    pass
+
+
+REPLICA_READS = registry.counter(
+    'forgot_password_replica_reads_total',
+    'Number of read-only lookups by the database that answered them.',
+    ('route',))
+
+# Seconds the replica is behind the primary. A replica that has replayed
+# everything it received is not behind, even if no write happened lately.
+LAG_SQL = text('''
+SELECT CASE
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+''')
+
+# The same query before PostgreSQL 10 renamed the functions.
+LEGACY_LAG_SQL = text('''
+SELECT CASE
+    WHEN pg_last_xlog_receive_location() = pg_last_xlog_replay_location()
+        THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+''')
+
+_engine = None
+_max_lag = 0
+_lag_check_interval = 5
+_lag = None
+_lag_checked_at = None
+_timer = time.monotonic
+_lock = threading.Lock()
+
+
+def configure_replica(settings):
+    """
+    Configure the read replica with the specified replica settings. Reads
+    go to the primary if no replica URL is set.
+    """
+    global _engine, _max_lag, _lag_check_interval, _lag, _lag_checked_at
+    url = getattr(settings, 'url', None)
+    _engine = None
+    if url:
+        _engine = sa.create_engine(
+            url, pool_size=getattr(settings, 'pool_size', 5))
+        get_health_state().register('replica')
+    _max_lag = getattr(settings, 'max_lag', 0) or 0
+    _lag_check_interval = getattr(settings, 'lag_check_interval', 5)
+    _lag = None
+    _lag_checked_at = None
+
+
+def _get_lag_sql(c):
+    """
+    Return the lag query for the version of the replica, which SQLAlchemy
+    reads from `server_version_num` on connect.
+    """
+    version = c.dialect.server_version_info
+    if version is not None and version < (10,):
+        return LEGACY_LAG_SQL
+    return LAG_SQL
+
+
+def _check_lag(c):
+    """
+    Return whether the replica is too far behind the primary. The lag is
+    queried at most once per check interval and shared by all reads.
+    """
+    global _lag, _lag_checked_at
+    if not _max_lag:
+        return False
+
+    now = _timer()
+    with _lock:
+        checked = _lag_checked_at is not None \
+            and now - _lag_checked_at < _lag_check_interval
+    if not checked:
+        lag = c.execute(_get_lag_sql(c)).scalar()
+        with _lock:
+            _lag = float(lag) if lag is not None else 0.0
+            _lag_checked_at = now
+    return _lag > _max_lag
+
+
+def _read_primary(route, func, *args):
+    REPLICA_READS.inc(route)
+    with conn() as c:
+        return func(c, *args)
+
+
+def replica_read(func, *args, fallback=True):
+    """
+    Call the read-only lookup `func(c, *args)` with a connection to the
+    read replica, if one is configured, and return its result.
+
+    The lookup is sent to the primary instead when the replica lags by more
+    than the maximum lag or cannot be reached. With `fallback`, a lookup
+    that finds nothing on the replica is repeated on the primary, in case
+    the row was written too recently to be replicated.
+    """
+    if _engine is None:
+        return _read_primary('primary', func, *args)
+
+    try:
+        with _engine.begin() as c:
+            if _check_lag(c):
+                result, route = None, 'fallback_lag'
+            else:
+                result, route = func(c, *args), 'replica'
+        get_health_state().set_ok('replica')
+    except DBAPIError as ex:
+        logger.warning('Unable to read from the replica: %s', ex)
+        get_health_state().set_error('replica', ex)
+        result, route = None, 'fallback_error'
+
+    if route == 'replica':
+        if result is not None or not fallback:
+            REPLICA_READS.inc(route)
+            return result
+        route = 'fallback_missing'
+    return _read_primary(route, func, *args)
+
+
+def get_replica_lag():
+    """
+    Return the last known lag of the replica in seconds, or None.
+    """
+    return _lag
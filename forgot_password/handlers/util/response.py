@@ -0,0 +1,178 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import zlib
+
+import skygear
+from werkzeug.http import quote_etag
+
+from .cache import TTLCache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Types of template parameters that can be part of a cache key
+CACHEABLE_TYPES = (str, int, float, bool, type(None))
+
+# Bodies smaller than this number of bytes are not compressed
+COMPRESSION_MIN_SIZE = 1024
+
+_rendered_cache = TTLCache(256, 3600)
+
+
+def _gzip_compress(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def get_encoders():
+    """
+    Return the supported content encodings and their compress functions,
+    in the order of preference.
+    """
+    encoders = []
+    if brotli:
+        encoders.append(('br', brotli.compress))
+    encoders.append(('gzip', _gzip_compress))
+    return encoders
+
+
+_encoders = dict(get_encoders())
+_encoding_preference = [name for name, _ in get_encoders()]
+
+
+class RenderedPage:
+    """
+    A rendered HTML body, holding its ETag and compressed variants which
+    are computed on first use.
+    """
+    def __init__(self, body):
+        self._body = body
+        self._data = body.encode('utf-8')
+        self._etag = None
+        self._encoded = {}
+
+    @property
+    def body(self):
+        return self._body
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def etag(self):
+        if self._etag is None:
+            self._etag = hashlib.sha1(self._data).hexdigest()
+        return self._etag
+
+    def encode(self, encoding):
+        """
+        Return the body compressed with the content encoding.
+        """
+        if encoding not in self._encoded:
+            self._encoded[encoding] = _encoders[encoding](self._data)
+        return self._encoded[encoding]
+
+
+def get_rendered_cache():
+    return _rendered_cache
+
+
+def _cache_key(template, kwargs):
+    """
+    Return the cache key of rendering the template with the parameters,
+    or None if the rendered content cannot be cached.
+    """
+    variables = template.get_variables()
+    if variables is None:
+        return None
+
+    params = tuple(sorted(
+        (name, kwargs.get(name))
+        for name in variables
+    ))
+    for _, value in params:
+        if not isinstance(value, CACHEABLE_TYPES):
+            return None
+    return (template.name, params)
+
+
+def render_cached(template, **kwargs):
+    """
+    Render the template, reusing the rendered page of earlier calls
+    with the same values of the parameters referenced by the template.
+
+    Return a RenderedPage.
+    """
+    key = _cache_key(template, kwargs)
+    page = _rendered_cache.get(key) if key else None
+    if page is None:
+        page = RenderedPage(template.render(**kwargs))
+        if key:
+            _rendered_cache.set(key, page)
+    return page
+
+
+def negotiate_encoding(request, size):
+    """
+    Return the content encoding to use for a body of the specified size
+    according to the Accept-Encoding header, or None if the body should
+    not be compressed.
+    """
+    if request is None or size < COMPRESSION_MIN_SIZE:
+        return None
+    return request.accept_encodings.best_match(_encoding_preference)
+
+
+def html_response(request, page, status=200, cache_control=None):
+    """
+    Return an HTML response of the rendered page, compressed according to
+    the Accept-Encoding header of the request.
+
+    If `cache_control` is specified, ETag and Cache-Control headers are
+    added, and a 304 response is returned if the request has a matching
+    If-None-Match header and the response status is 200.
+    """
+    encoding = negotiate_encoding(request, len(page.data))
+    headers = [('Vary', 'Accept-Encoding')]
+    if encoding:
+        data = page.encode(encoding)
+        headers.append(('Content-Encoding', encoding))
+    else:
+        data = page.data
+
+    if cache_control:
+        etag = '{}-{}'.format(page.etag, encoding) if encoding \
+            else page.etag
+        headers.append(('ETag', quote_etag(etag)))
+        headers.append(('Cache-Control', cache_control))
+        if status == 200 and request is not None \
+                and request.if_none_match.contains(etag):
+            return skygear.Response(status=304, headers=headers)
+
+    return skygear.Response(data, status=status, content_type='text/html',
+                            headers=headers)
+
+
+def cached_html_response(request, template, status=200,
+                         cache_control='no-cache', **kwargs):
+    """
+    Return an HTML response of the template rendered with `render_cached`.
+    """
+    page = render_cached(template, **kwargs)
+    return html_response(request, page, status=status,
+                         cache_control=cache_control)
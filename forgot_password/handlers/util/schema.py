@@ -11,9 +11,9 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-from skygear.container import SkygearContainer
 from skygear.error import SkygearException
-from skygear.options import options as skyoptions
+
+from .container import send_action
 
 
 def schema_add_key_verified_flags(flag_names):
@@ -26,14 +26,9 @@ def schema_add_key_verified_flags(flag_names):
     if not flag_names:
         return
 
-    container = SkygearContainer(
-        api_key=skyoptions.masterkey
-    )
-
     # Fetch schema first. If no changes are required, we will not try
     # to update the schema.
-    resp = container.send_action("schema:fetch", {
-    }, plugin_request=True)
+    resp = send_action("schema:fetch", {})
     if "error" in resp:
         raise SkygearException.from_dict(resp["error"])
 
@@ -52,13 +47,13 @@ def schema_add_key_verified_flags(flag_names):
         for flag_name in flag_names
     ]
 
-    resp = container.send_action("schema:create", {
+    resp = send_action("schema:create", {
         "record_types": {
             'user': {
                 'fields': fields
             }
         }
-    }, plugin_request=True)
+    })
     if "error" in resp:
         raise SkygearException.from_dict(resp["error"])
 
@@ -67,15 +62,9 @@ def schema_add_key_verified_acl(flag_names):
     """
     Add field ACL to disallow owner from modifying verified flags.
     """
-    container = SkygearContainer(
-        api_key=skyoptions.masterkey
-    )
-
     # Fetch the current field ACL. If no changes are required, we will
     # not try to update the field ACL.
-    resp = container.send_action("schema:field_access:get",
-                                 {},
-                                 plugin_request=True)
+    resp = send_action("schema:field_access:get", {})
     if "error" in resp:
         raise SkygearException.from_dict(resp["error"])
 
@@ -105,8 +94,8 @@ def schema_add_key_verified_acl(flag_names):
         return
 
     # Update the field ACL.
-    resp = container.send_action("schema:field_access:update", {
+    resp = send_action("schema:field_access:update", {
         "access": new_acls
-    }, plugin_request=True)
+    })
     if "error" in resp:
         raise SkygearException.from_dict(resp["error"])
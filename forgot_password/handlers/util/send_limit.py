@@ -0,0 +1,164 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import logging
+import math
+import time
+
+from sqlalchemy.sql import text
+
+from .db import conn
+
+logger = logging.getLogger(__name__)
+try:
+    # Available in py-skygear v1.6
+    from skygear.utils.logging import setLoggerTag
+    setLoggerTag(logger, 'auth_plugin')
+except ImportError:
+    pass
+
+
+TABLE_NAME = '_forgot_password_send_limit'
+
+CREATE_TABLE_SQL = text('''
+CREATE TABLE IF NOT EXISTS {table} (
+    key text PRIMARY KEY,
+    window_start bigint NOT NULL,
+    count integer NOT NULL,
+    previous_count integer NOT NULL
+)
+'''.format(table=TABLE_NAME))
+
+# Count a hit in the current window of the key. When the window has moved
+# on, the count of the previous window is kept for the sliding estimate.
+HIT_SQL = text('''
+INSERT INTO {table} AS r (key, window_start, count, previous_count)
+VALUES (:key, :window_start, 1, 0)
+ON CONFLICT (key) DO UPDATE SET
+    previous_count = CASE
+        WHEN r.window_start = excluded.window_start THEN r.previous_count
+        WHEN r.window_start = excluded.window_start - :window THEN r.count
+        ELSE 0
+    END,
+    count = CASE
+        WHEN r.window_start = excluded.window_start THEN r.count + 1
+        ELSE 1
+    END,
+    window_start = excluded.window_start
+RETURNING count, previous_count
+'''.format(table=TABLE_NAME))
+
+PURGE_SQL = text('''
+DELETE FROM {table} WHERE window_start < :window_start
+'''.format(table=TABLE_NAME))
+
+
+class SendLimitExceeded(Exception):
+    def __init__(self, key, retry_after):
+        self.key = key
+        self.retry_after = retry_after
+        super().__init__('too many requests, retry in {} seconds'
+                         .format(retry_after))
+
+
+class SlidingWindowLimiter:
+    """
+    Limit the number of sends per key within a sliding window, shared by
+    all plugin instances through a database table with one row per key.
+
+    The number of sends in the window is estimated from the counts of
+    the current and previous fixed windows, weighting the previous count
+    by how much of it overlaps the sliding window.
+    """
+    def __init__(self, window=3600, timer=time.time):
+        self.window = window
+        self._timer = timer
+
+    def create_table(self, c):
+        c.execute(CREATE_TABLE_SQL)
+
+    def purge(self, c):
+        """
+        Delete keys that have no sends in the current or previous window.
+        """
+        window_start = self._window_start(self._timer()) - self.window
+        c.execute(PURGE_SQL, window_start=window_start)
+
+    def _window_start(self, now):
+        return int(now // self.window * self.window)
+
+    def hit(self, c, key, limit):
+        """
+        Count a send for the key and raise SendLimitExceeded if more than
+        `limit` sends are estimated in the sliding window.
+        """
+        now = self._timer()
+        window_start = self._window_start(now)
+        row = c.execute(HIT_SQL, key=key, window_start=window_start,
+                        window=self.window).fetchone()
+        count, previous_count = row[0], row[1]
+
+        overlap = 1 - (now - window_start) / self.window
+        estimate = count + previous_count * overlap
+        if estimate > limit:
+            retry_after = window_start + self.window - now
+            if count <= limit and previous_count:
+                # The estimate drops below the limit as the previous
+                # window slides out.
+                retry_after = min(
+                    retry_after,
+                    (estimate - limit) / previous_count * self.window)
+            logger.info('Send limit of `%s` exceeded.', key)
+            raise SendLimitExceeded(key, math.ceil(retry_after))
+        return estimate
+
+
+def normalize_email(email):
+    return email.strip().lower()
+
+
+class SendLimits:
+    """
+    Limits of forgot password and verification requests.
+    """
+    def __init__(self, window=3600, per_email=0, per_verify_key=0,
+                 timer=time.time):
+        self.limiter = SlidingWindowLimiter(window, timer=timer)
+        self.per_email = per_email
+        self.per_verify_key = per_verify_key
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(window=settings.window,
+                   per_email=settings.per_email,
+                   per_verify_key=settings.per_verify_key)
+
+    @property
+    def enabled(self):
+        return bool(self.per_email or self.per_verify_key)
+
+    def _check(self, key, limit):
+        if not limit:
+            return
+        # A rejected send rolls back the transaction, so that it is not
+        # counted against the limit.
+        with conn() as c:
+            self.limiter.hit(c, key, limit)
+
+    def check_forgot_password(self, email):
+        self._check('email:{}'.format(normalize_email(email)),
+                    self.per_email)
+
+    def check_verify_request(self, auth_id, record_key):
+        self._check('verify:{}:{}'.format(auth_id, record_key),
+                    self.per_verify_key)
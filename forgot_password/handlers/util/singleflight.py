@@ -0,0 +1,112 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import time
+
+from ...deadline import DeadlineExceeded, remaining
+from .cache import TTLCache
+from .metrics import registry
+
+COALESCED_CALLS = registry.counter(
+    'forgot_password_coalesced_calls_total',
+    'Number of calls answered with the result of another call.',
+    ('name', 'source'))
+
+_MISSING = object()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one call, whose result
+    or error is shared by all of the callers.
+
+    With a `window`, the result of a successful call is also returned to
+    calls made within `window` seconds after it, without calling again.
+    Errors are never remembered, so a failed call can be retried at once.
+    """
+    def __init__(self, name, window=0, cache_size=10000,
+                 timer=time.monotonic):
+        self.name = name
+        self._window = window
+        self._results = TTLCache(cache_size, window, timer=timer)
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    @property
+    def window(self):
+        return self._window
+
+    @property
+    def results(self):
+        return self._results
+
+    def call(self, key, func, *args, **kwargs):
+        """
+        Call `func` with the arguments unless a call with the same key is
+        in progress or has succeeded within the window, in which case the
+        result of that call is returned.
+        """
+        with self._lock:
+            if self._window:
+                result = self._results.get(key, _MISSING)
+                if result is not _MISSING:
+                    COALESCED_CALLS.inc(self.name, 'window')
+                    return result
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            COALESCED_CALLS.inc(self.name, 'in_flight')
+            return self._wait(call)
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as ex:
+            call.error = ex
+            raise
+        else:
+            call.result = result
+            if self._window:
+                self._results.set(key, result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _wait(self, call):
+        # Waiting callers are bound by their own request deadline
+        timeout = remaining()
+        if timeout is not None:
+            timeout = max(timeout, 0)
+        if not call.done.wait(timeout):
+            raise DeadlineExceeded(self.name)
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def forget(self, key):
+        """
+        Forget the remembered result of the key.
+        """
+        self._results.discard(key)
@@ -0,0 +1,121 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from ..attempt import (AttemptGuard, AttemptRejected, get_request_caller,
+                       parse_trusted_proxies)
+from ..cache import TTLCache
+
+
+class MockTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_expire(self):
+        timer = MockTimer()
+        cache = TTLCache(10, 5, timer=timer)
+        cache.set('key', 'value')
+        assert cache.get('key') == 'value'
+        timer.now = 5
+        assert cache.get('key') is None
+        assert 'key' not in cache
+
+    def test_evict_oldest(self):
+        cache = TTLCache(2, 60)
+        cache.set('a')
+        cache.set('b')
+        cache.set('c')
+        assert 'a' not in cache
+        assert 'b' in cache
+        assert 'c' in cache
+
+    def test_increment_keeps_expiry(self):
+        timer = MockTimer()
+        cache = TTLCache(10, 5, timer=timer)
+        assert cache.increment('key') == 1
+        timer.now = 4
+        assert cache.increment('key') == 2
+        timer.now = 5
+        assert cache.increment('key') == 1
+
+
+class TestAttemptGuard(unittest.TestCase):
+    def test_reject_known_bad_key(self):
+        guard = AttemptGuard()
+        guard.check('caller', 'key')
+        guard.record_failure('caller', 'key')
+        with self.assertRaises(AttemptRejected):
+            guard.check('another-caller', 'key')
+        guard.check('caller', 'another-key')
+
+    def test_reject_caller_with_too_many_failures(self):
+        guard = AttemptGuard(max_failures=2)
+        guard.record_failure('caller')
+        guard.check('caller')
+        guard.record_failure('caller')
+        with self.assertRaises(AttemptRejected):
+            guard.check('caller')
+        guard.check('another-caller')
+
+
+class TestRequestCaller(unittest.TestCase):
+    def get_request(self, **headers):
+        # Built the way py-skygear builds the requests of HTTP handlers
+        builder = EnvironBuilder(
+            method='POST',
+            path='/reset-password',
+            headers={k.replace('_', '-'): v for k, v in headers.items()},
+            data=b'')
+        return Request(builder.get_environ(), populate_request=False,
+                       shallow=False)
+
+    def test_rightmost_hop_forwarded_by_skygear_server(self):
+        request = self.get_request(X_Forwarded_For='198.51.100.1, 203.0.113.9',
+                                   X_Real_IP='198.51.100.2')
+        assert get_request_caller(request) == '203.0.113.9'
+        assert AttemptGuard().get_caller(request) == '203.0.113.9'
+
+    def test_rightmost_untrusted_hop(self):
+        trusted = AttemptGuard(trusted_proxies='10.0.0.0/8, 127.0.0.1')
+        request = self.get_request(
+            X_Forwarded_For='198.51.100.1, 203.0.113.9, 10.0.0.2')
+        assert trusted.get_caller(request) == '203.0.113.9'
+
+    def test_all_hops_trusted(self):
+        request = self.get_request(X_Forwarded_For='10.0.0.3, 10.0.0.2')
+        trusted_proxies = parse_trusted_proxies(['10.0.0.0/8', '127.0.0.1'])
+        assert get_request_caller(request, trusted_proxies) == '10.0.0.3'
+
+    def test_no_forwarded_for(self):
+        request = self.get_request(X_Real_IP='203.0.113.9')
+        assert get_request_caller(request) is None
+
+    def test_failures_counted_per_forwarded_caller(self):
+        guard = AttemptGuard(max_failures=1)
+        caller = guard.get_caller(
+            self.get_request(X_Forwarded_For='203.0.113.9'))
+        guard.record_failure(caller)
+        with self.assertRaises(AttemptRejected):
+            guard.check(guard.get_caller(
+                self.get_request(X_Forwarded_For='203.0.113.9')))
+        guard.check(guard.get_caller(
+            self.get_request(X_Forwarded_For='203.0.113.10')))
@@ -0,0 +1,188 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import smtplib
+import socket
+import unittest
+from argparse import Namespace
+
+from .. import circuit
+from ..circuit import CircuitBreaker, CircuitOpenError
+from ..email import is_smtp_failure
+
+
+class MockTimer:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def fail():
+    raise Exception('connection refused')
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.timer = MockTimer()
+        self.breaker = CircuitBreaker('smtp:localhost:25',
+                                      failure_threshold=2,
+                                      reset_timeout=30,
+                                      timer=self.timer)
+
+    def open_circuit(self):
+        for i in range(2):
+            with self.assertRaises(Exception):
+                self.breaker.call(fail)
+        assert self.breaker.state == circuit.STATE_OPEN
+
+    def test_open_after_consecutive_failures(self):
+        with self.assertRaises(Exception):
+            self.breaker.call(fail)
+        self.breaker.call(lambda: None)
+        with self.assertRaises(Exception):
+            self.breaker.call(fail)
+        assert self.breaker.state == circuit.STATE_CLOSED
+
+        with self.assertRaises(Exception):
+            self.breaker.call(fail)
+        self.timer.now = 10
+        with self.assertRaises(CircuitOpenError) as cm:
+            self.breaker.call(lambda: None)
+        assert cm.exception.retry_after == 20
+
+    def test_half_open_trial_success(self):
+        self.open_circuit()
+        self.timer.now = 30
+        assert self.breaker.state == circuit.STATE_HALF_OPEN
+
+        self.breaker.before_call()
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.before_call()
+        self.breaker.record_success()
+        assert self.breaker.state == circuit.STATE_CLOSED
+
+    def test_half_open_trial_failure(self):
+        self.open_circuit()
+        self.timer.now = 30
+        with self.assertRaises(Exception):
+            self.breaker.call(fail)
+        assert self.breaker.state == circuit.STATE_OPEN
+
+    def test_ignore_errors_not_failures(self):
+        def refuse():
+            raise ValueError('invalid recipient')
+
+        def is_failure(ex):
+            return not isinstance(ex, ValueError)
+
+        for i in range(5):
+            with self.assertRaises(ValueError):
+                self.breaker.call(refuse, is_failure=is_failure)
+        assert self.breaker.state == circuit.STATE_CLOSED
+
+        # An ignored error gives back the half open trial
+        self.open_circuit()
+        self.timer.now = 30
+        with self.assertRaises(ValueError):
+            self.breaker.call(refuse, is_failure=is_failure)
+        self.breaker.call(lambda: None)
+        assert self.breaker.state == circuit.STATE_CLOSED
+
+    def test_slow_call_counts_as_failure(self):
+        breaker = CircuitBreaker('twilio:AC123', failure_threshold=1,
+                                 latency_threshold=5, timer=self.timer)
+
+        def slow():
+            self.timer.now += 10
+
+        breaker.call(slow)
+        assert breaker.state == circuit.STATE_OPEN
+
+
+class TestCallWithCircuitBreaker(unittest.TestCase):
+    def tearDown(self):
+        circuit.configure_circuit_breakers(None)
+
+    def test_disabled(self):
+        circuit.configure_circuit_breakers(Namespace(failure_threshold=0))
+        for i in range(10):
+            with self.assertRaises(Exception):
+                circuit.call_with_circuit_breaker('smtp:localhost:25', fail)
+        assert circuit.get_circuit_states() == {}
+
+    def test_share_breaker_by_name(self):
+        circuit.configure_circuit_breakers(Namespace(
+            failure_threshold=1, latency_threshold=0, reset_timeout=30,
+            half_open_max=1))
+        with self.assertRaises(Exception):
+            circuit.call_with_circuit_breaker('smtp:localhost:25', fail)
+        with self.assertRaises(CircuitOpenError):
+            circuit.call_with_circuit_breaker('smtp:localhost:25', fail)
+        assert circuit.call_with_circuit_breaker('nexmo:key', len, 'a') == 1
+        assert circuit.get_circuit_states() == {
+            'nexmo:key': circuit.STATE_CLOSED,
+            'smtp:localhost:25': circuit.STATE_OPEN,
+        }
+
+
+class TestCircuitBreakerBlock(unittest.TestCase):
+    def setUp(self):
+        circuit.configure_circuit_breakers(Namespace(
+            failure_threshold=1, latency_threshold=0, reset_timeout=0,
+            half_open_max=1))
+        self.addCleanup(circuit.configure_circuit_breakers, None)
+
+    def test_open_circuit_skips_block(self):
+        with self.assertRaises(Exception):
+            with circuit.circuit_breaker('twilio:AC123') as call:
+                call(fail)
+
+        # The reset timeout is over, but the trial is taken
+        breaker = circuit.get_circuit_breaker('twilio:AC123')
+        breaker.before_call()
+        acquired = []
+        with self.assertRaises(CircuitOpenError):
+            with circuit.circuit_breaker('twilio:AC123'):
+                acquired.append(True)
+        assert acquired == []
+
+    def test_release_trial_if_not_called(self):
+        with self.assertRaises(Exception):
+            with circuit.circuit_breaker('twilio:AC123') as call:
+                call(fail)
+
+        with self.assertRaises(ValueError):
+            with circuit.circuit_breaker('twilio:AC123'):
+                raise ValueError('rate limit exceeded')
+        with circuit.circuit_breaker('twilio:AC123') as call:
+            assert call(len, 'a') == 1
+        assert circuit.get_circuit_states() == {
+            'twilio:AC123': circuit.STATE_CLOSED,
+        }
+
+
+class TestSMTPFailure(unittest.TestCase):
+    def test_relay_failures(self):
+        assert is_smtp_failure(socket.timeout())
+        assert is_smtp_failure(ConnectionRefusedError())
+        assert is_smtp_failure(smtplib.SMTPServerDisconnected())
+        assert is_smtp_failure(smtplib.SMTPAuthenticationError(535, b''))
+        assert is_smtp_failure(smtplib.SMTPDataError(451, b'local error'))
+
+    def test_message_errors(self):
+        assert not is_smtp_failure(smtplib.SMTPRecipientsRefused(
+            {'a@example.com': (550, b'no such user')}))
+        assert not is_smtp_failure(smtplib.SMTPDataError(554, b'rejected'))
+        assert not is_smtp_failure(ValueError())
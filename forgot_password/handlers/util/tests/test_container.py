@@ -0,0 +1,64 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import MagicMock, patch
+
+import requests
+from skygear.container import SkygearContainer
+from skygear.transmitter.http import HttpTransport
+
+from .. import container as container_util
+from ..container import PooledHttpTransport
+
+
+class TestPooledHttpTransport(unittest.TestCase):
+    def test_retry_idempotent_action(self):
+        transport = PooledHttpTransport(max_retries=2)
+        response = MagicMock()
+        response.json.return_value = {'result': []}
+        transport.session.post = MagicMock(side_effect=[
+            requests.ConnectionError(),
+            response,
+        ])
+        resp = transport.send_action('record:fetch', {}, 'http://skygear/')
+        assert resp == {'result': []}
+        assert transport.session.post.call_count == 2
+
+    def test_no_retry_non_idempotent_action(self):
+        transport = PooledHttpTransport(max_retries=2)
+        transport.session.post = MagicMock(
+            side_effect=requests.ConnectionError())
+        with self.assertRaises(requests.ConnectionError):
+            transport.send_action('auth:reset_password', {}, 'http://sky/')
+        assert transport.session.post.call_count == 1
+
+
+@patch.object(container_util.skyoptions, 'masterkey', 'secret', create=True)
+class TestSharedContainer(unittest.TestCase):
+    def setUp(self):
+        container_util.configure_container(None)
+
+    def tearDown(self):
+        container_util.configure_container(None)
+
+    @patch.object(SkygearContainer, 'transport', HttpTransport('0.0.0.0'))
+    def test_container_is_shared(self):
+        container = container_util.get_container()
+        assert container is container_util.get_container()
+        assert isinstance(container.transport, PooledHttpTransport)
+
+    @patch.object(SkygearContainer, 'transport', MagicMock())
+    def test_keep_non_http_transport(self):
+        container = container_util.get_container()
+        assert container.transport is SkygearContainer.transport
@@ -0,0 +1,122 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch
+
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
+
+from .. import db as db_util
+
+METADATA = sa.MetaData()
+CODES = sa.Table('codes', METADATA,
+                 sa.Column('id', sa.Integer, primary_key=True))
+
+
+class TestRequestConnection(unittest.TestCase):
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite://', poolclass=StaticPool)
+        METADATA.create_all(self.engine)
+        self.connections = []
+
+        def skygear_conn():
+            self.connections.append(None)
+            return self.engine.begin()
+
+        patcher = patch.object(db_util, 'skygear_conn', skygear_conn)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def add_code(self, code_id):
+        with db_util.conn() as c:
+            c.execute(CODES.insert().values(id=code_id))
+
+    def get_codes(self):
+        with self.engine.connect() as c:
+            return [row.id for row in c.execute(CODES.select())]
+
+    def test_connection_per_call_outside_request(self):
+        self.add_code(1)
+        self.add_code(2)
+        assert len(self.connections) == 2
+        assert self.get_codes() == [1, 2]
+
+    def test_share_connection_in_request(self):
+        with db_util.request_connection():
+            with db_util.conn() as outer:
+                with db_util.conn() as inner:
+                    assert inner is outer
+            self.add_code(1)
+            self.add_code(2)
+        assert len(self.connections) == 1
+        assert self.get_codes() == [1, 2]
+
+    def test_no_connection_if_unused(self):
+        with db_util.request_connection():
+            pass
+        assert self.connections == []
+
+    def test_nested_request_uses_enclosing_connection(self):
+        with db_util.request_connection():
+            self.add_code(1)
+            with db_util.request_connection():
+                self.add_code(2)
+        assert len(self.connections) == 1
+        assert self.get_codes() == [1, 2]
+
+    def test_roll_back_request_on_error(self):
+        with self.assertRaises(ValueError):
+            with db_util.request_connection():
+                self.add_code(1)
+                raise ValueError()
+        assert self.get_codes() == []
+
+    def test_new_connection_after_error_in_block(self):
+        with db_util.request_connection():
+            with self.assertRaises(ValueError):
+                with db_util.conn() as c:
+                    c.execute(CODES.insert().values(id=1))
+                    raise ValueError()
+            self.add_code(2)
+        assert len(self.connections) == 2
+        assert self.get_codes() == [2]
+
+    def test_release_connection(self):
+        with self.assertRaises(ValueError):
+            with db_util.request_connection():
+                self.add_code(1)
+                db_util.release_connection()
+                self.add_code(2)
+                raise ValueError()
+        assert len(self.connections) == 2
+        assert self.get_codes() == [1]
+
+    def test_no_release_within_block(self):
+        with db_util.request_connection():
+            with db_util.conn() as c:
+                db_util.release_connection()
+                c.execute(CODES.insert().values(id=1))
+        assert len(self.connections) == 1
+        assert self.get_codes() == [1]
+
+    def test_with_request_connection(self):
+        @db_util.with_request_connection
+        def add_codes(*code_ids):
+            for code_id in code_ids:
+                self.add_code(code_id)
+            return len(code_ids)
+
+        assert add_codes(1, 2) == 2
+        assert len(self.connections) == 1
+        assert self.get_codes() == [1, 2]
@@ -15,6 +15,7 @@ import re
 import unittest
 from unittest.mock import patch
 
+from .. import email
 from ..email import Mailer
 
 
@@ -32,7 +33,7 @@ class MockProvider2:
 
 class TestSendMailSenderName(unittest.TestCase):
 
-    @patch('pyzmail.send_mail2')
+    @patch.object(email, 'send_mail2')
     def test_sender_and_reply_to_name(self, mock):
         mailer = Mailer()
 
@@ -58,7 +59,7 @@ class TestSendMailSenderName(unittest.TestCase):
         assert args[1] == 'no-reply@skygeario.com'
         assert args[2] == ['user@skygeario.com']
 
-    @patch('pyzmail.send_mail2')
+    @patch.object(email, 'send_mail2')
     def test_no_sender_and_reply_to_name(self, mock):
         mailer = Mailer()
 
@@ -84,7 +85,7 @@ class TestSendMailSenderName(unittest.TestCase):
         assert args[1] == 'no-reply@skygeario.com'
         assert args[2] == ['user@skygeario.com']
 
-    @patch('pyzmail.send_mail2')
+    @patch.object(email, 'send_mail2')
     def test_no_reply(self, mock):
         mailer = Mailer()
 
@@ -110,7 +111,7 @@ class TestSendMailSenderName(unittest.TestCase):
         assert args[1] == 'no-reply@skygeario.com'
         assert args[2] == ['user@skygeario.com']
 
-    @patch('pyzmail.send_mail2')
+    @patch.object(email, 'send_mail2')
     def test_none_sender_and_reply_to_name(self, mock):
         mailer = Mailer()
 
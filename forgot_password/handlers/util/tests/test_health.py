@@ -0,0 +1,88 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch
+
+from ....template import StringTemplate, TemplateProvider
+from ...health import (get_health_report, retry_template_warm_up,
+                       warm_up_templates)
+from .. import metrics
+from ..health import HealthState, get_health_state
+
+
+class BrokenTemplate(StringTemplate):
+    def get(self):
+        raise Exception('download failed')
+
+
+class TestHealthState(unittest.TestCase):
+    def test_ready_when_required_components_ok(self):
+        state = HealthState()
+        state.register('templates', required=True)
+        state.register('provider:smtp')
+        assert not state.is_ready()
+
+        state.set_ok('templates')
+        state.set_error('provider:smtp', 'connection refused')
+        assert state.is_ready()
+
+        state.set_error('templates', 'download failed')
+        assert not state.is_ready()
+        components = state.get_components()
+        assert components['templates']['failures'] == 1
+        assert components['provider:smtp']['message'] == 'connection refused'
+
+
+class TestHealthReport(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(get_health_state(), '_components', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        get_health_state().register('templates', required=True)
+
+    def test_warm_up_templates(self):
+        templates = TemplateProvider(StringTemplate('a', 'Hello'))
+        warm_up_templates([templates])
+        assert get_health_report()['ready']
+
+        templates.add_template(BrokenTemplate('b', 'Hello'))
+        warm_up_templates([templates])
+        report = get_health_report()
+        assert not report['ready']
+        assert 'download failed' in report['components']['templates'][
+            'message']
+
+    def test_retry_template_warm_up(self):
+        template = BrokenTemplate('a', 'Hello')
+        templates = TemplateProvider(template)
+        retry_template_warm_up([templates])
+        assert get_health_state().get_status('templates') == 'pending'
+
+        warm_up_templates([templates])
+        assert not get_health_report()['ready']
+
+        # The download succeeds later
+        templates.add_template(StringTemplate('a', 'Hello'))
+        retry_template_warm_up([templates])
+        assert get_health_report()['ready']
+
+    def test_provider_health(self):
+        with self.assertRaises(Exception):
+            with metrics.observe_provider_send('twilio', 'phone'):
+                raise Exception('invalid credentials')
+        assert get_health_state().get_status('provider:twilio') == 'error'
+
+        with metrics.observe_provider_send('twilio', 'phone'):
+            pass
+        assert get_health_state().get_status('provider:twilio') == 'ok'
@@ -0,0 +1,59 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import MagicMock
+
+from sqlalchemy.exc import OperationalError
+
+from ....deadline import DeadlineExceeded, request_deadline
+from ..lock import (LOCK_NOT_AVAILABLE, acquire_advisory_lock,
+                    advisory_lock_id)
+
+
+class TestAdvisoryLock(unittest.TestCase):
+    def get_connection(self, acquired):
+        c = MagicMock()
+        c.execute.return_value.scalar.return_value = acquired
+        return c
+
+    def test_lock_id(self):
+        lock_id = advisory_lock_id('verify', 'user-1', 'email')
+        assert lock_id == advisory_lock_id('verify', 'user-1', 'email')
+        assert lock_id != advisory_lock_id('verify', 'user-1', 'phone')
+        assert -2 ** 63 <= lock_id < 2 ** 63
+
+    def test_acquire_without_waiting(self):
+        c = self.get_connection(True)
+        assert acquire_advisory_lock(c, 'test', 'key') is False
+        assert c.execute.call_count == 1
+
+    def test_wait_for_lock(self):
+        c = self.get_connection(False)
+        with request_deadline(5):
+            assert acquire_advisory_lock(c, 'test', 'key') is True
+        # try lock, set lock_timeout, then wait for the lock
+        assert c.execute.call_count == 3
+        assert 'set_config' in str(c.execute.call_args_list[1][0][0])
+
+    def test_lock_timeout(self):
+        c = self.get_connection(False)
+        error = MagicMock(pgcode=LOCK_NOT_AVAILABLE)
+        c.execute.side_effect = [
+            c.execute.return_value,
+            None,
+            OperationalError('SELECT', {}, error),
+        ]
+        with request_deadline(5):
+            with self.assertRaises(DeadlineExceeded):
+                acquire_advisory_lock(c, 'test', 'key')
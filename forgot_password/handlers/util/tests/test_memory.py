@@ -0,0 +1,50 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import tracemalloc
+import unittest
+from unittest.mock import patch
+
+from .. import memory
+from ..memory import MemoryTracker
+
+
+def allocate():
+    return [bytearray(1024) for i in range(1000)]
+
+
+class TestMemoryTracker(unittest.TestCase):
+    def setUp(self):
+        if not tracemalloc.is_tracing():
+            self.addCleanup(tracemalloc.stop)
+        self.tracker = MemoryTracker()
+        self.tracker.start()
+
+    def test_report_growth(self):
+        report = self.tracker.report()
+        assert report['growth'] == []
+        assert report['traced_memory']['current'] > 0
+
+        allocated = allocate()
+        report = self.tracker.report(limit=5)
+        assert len(allocated) == 1000
+        assert len(report['top']) <= 5
+        assert any(stat['file'] == __file__ and stat['size_diff'] > 1000000
+                   for stat in report['growth'])
+
+    def test_report_cache_sizes(self):
+        with patch.dict(memory._caches, clear=True):
+            memory.register_cache('cache', lambda: 3)
+            memory.register_cache('broken', lambda: 1 / 0)
+            report = self.tracker.report()
+        assert report['caches'] == {'cache': 3, 'broken': None}
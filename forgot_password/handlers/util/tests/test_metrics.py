@@ -0,0 +1,94 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from skygear.utils.http import Response
+
+from .. import metrics
+from ..metrics import Counter, Histogram, MetricsRegistry
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_render_counter(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('calls_total', 'Number of calls.',
+                                   ('name',))
+        counter.inc('a"b')
+        counter.inc('a"b', amount=2)
+        assert registry.render() == \
+            '# HELP calls_total Number of calls.\n' \
+            '# TYPE calls_total counter\n' \
+            'calls_total{name="a\\"b"} 3\n'
+
+    def test_render_histogram(self):
+        histogram = Histogram('latency_seconds', 'Latency.', ('name',),
+                              buckets=(0.1, 1))
+        histogram.observe(0.05, 'op')
+        histogram.observe(0.5, 'op')
+        histogram.observe(5, 'op')
+        assert histogram.get_count('op') == 3
+        lines = histogram.render().split('\n')
+        assert lines[2:] == [
+            'latency_seconds_bucket{name="op",le="0.1"} 1',
+            'latency_seconds_bucket{name="op",le="1"} 2',
+            'latency_seconds_bucket{name="op",le="+Inf"} 3',
+            'latency_seconds_sum{name="op"} 5.55',
+            'latency_seconds_count{name="op"} 3',
+        ]
+
+    def test_wrong_labels(self):
+        counter = Counter('calls_total', 'Number of calls.', ('name',))
+        with self.assertRaises(ValueError):
+            counter.inc()
+
+
+class TestInstrument(unittest.TestCase):
+    def setUp(self):
+        metrics.registry.clear()
+
+    def tearDown(self):
+        metrics.registry.clear()
+
+    def test_count_op(self):
+        @metrics.instrument('op', 'test:op')
+        def op(value):
+            if not value:
+                raise Exception('value must be set')
+            return value
+
+        assert op(value='value') == 'value'
+        with self.assertRaises(Exception):
+            op(value=None)
+        assert metrics.REQUESTS.get('op', 'test:op', 'ok') == 1
+        assert metrics.REQUESTS.get('op', 'test:op', 'error') == 1
+        assert metrics.REQUEST_DURATION.get_count('op', 'test:op') == 2
+
+    def test_count_handler_error_response(self):
+        @metrics.instrument('handler', 'test:handler')
+        def handler(request):
+            return Response(status=400)
+
+        handler(None)
+        assert metrics.REQUESTS.get('handler', 'test:handler', 'error') == 1
+
+    def test_observe_provider_send(self):
+        with metrics.observe_provider_send('smtp', 'email'):
+            pass
+        with self.assertRaises(Exception):
+            with metrics.observe_provider_send('smtp', 'email'):
+                raise Exception('connection refused')
+        assert metrics.PROVIDER_SENDS.get('smtp', 'email', 'ok') == 1
+        assert metrics.PROVIDER_SENDS.get('smtp', 'email', 'error') == 1
+        assert 'forgot_password_provider_send_duration_seconds_count' \
+            '{provider="smtp",key="email"} 2' in metrics.render_metrics()
@@ -0,0 +1,74 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import shutil
+import tempfile
+import unittest
+
+from ..profiler import SamplingProfiler
+
+
+class MockTimer:
+    def __init__(self):
+        self.now = 1000
+
+    def __call__(self):
+        return self.now
+
+
+def busy():
+    return sum(i * i for i in range(1000))
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_not_sampled(self):
+        profiler = SamplingProfiler(self.directory, sample_rate=0)
+        with profiler.profile('user:verify_request'):
+            busy()
+        profiler.dump()
+        assert profiler.get_latest_profile('user:verify_request') is None
+
+    def test_dump_on_interval(self):
+        timer = MockTimer()
+        profiler = SamplingProfiler(self.directory, sample_rate=1,
+                                    interval=60, timer=timer)
+        with profiler.profile('user:verify_request'):
+            busy()
+        assert profiler.get_profile_paths('user:verify_request') == []
+
+        timer.now += 60
+        with profiler.profile('user:verify_request'):
+            with profiler.profile('nested'):
+                busy()
+        assert len(profiler.get_profile_paths('user:verify_request')) == 1
+        assert profiler.get_profile_paths('nested') == []
+
+        profile = profiler.get_latest_profile('user:verify_request')
+        assert 'busy' in profile['stats']
+
+    def test_rotate(self):
+        timer = MockTimer()
+        profiler = SamplingProfiler(self.directory, sample_rate=1,
+                                    keep=2, timer=timer)
+        for i in range(3):
+            timer.now += 1
+            with profiler.profile('user:verify_code'):
+                busy()
+            profiler.dump()
+        paths = profiler.get_profile_paths('user:verify_code')
+        assert len(paths) == 2
+        assert paths[-1].endswith('-1003000.prof')
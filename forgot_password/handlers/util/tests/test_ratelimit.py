@@ -0,0 +1,81 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from argparse import Namespace
+from unittest.mock import patch
+
+from .. import ratelimit
+from ..ratelimit import RateLimitExceeded, TokenBucket
+
+
+class MockClock:
+    def __init__(self):
+        self.now = 0
+        self.slept = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_wait(self):
+        clock = MockClock()
+        bucket = TokenBucket('smtp:localhost:25', rate=2, burst=2,
+                             max_wait=1, timer=clock, sleep=clock.sleep)
+        bucket.acquire()
+        bucket.acquire()
+        assert clock.slept == []
+        assert bucket.utilization == 1
+
+        bucket.acquire()
+        assert clock.slept == [0.5]
+
+    def test_reject_beyond_max_wait(self):
+        clock = MockClock()
+        bucket = TokenBucket('sms', rate=1, burst=1, max_wait=1,
+                             timer=clock, sleep=clock.sleep)
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 1
+        with self.assertRaises(RateLimitExceeded) as cm:
+            bucket.reserve()
+        assert cm.exception.wait == 2
+
+        clock.now = 10
+        assert bucket.reserve() == 0
+
+
+class TestAcquire(unittest.TestCase):
+    def tearDown(self):
+        ratelimit.configure_rate_limits(None)
+
+    def test_unlimited_by_default(self):
+        ratelimit.configure_rate_limits(None)
+        ratelimit.acquire('smtp', 'smtp:localhost:25')
+        assert ratelimit.get_utilization() == {}
+
+    def test_share_bucket_by_name(self):
+        ratelimit.configure_rate_limits(Namespace(
+            smtp_rate=1, smtp_burst=2, sms_rate=0, sms_burst=1, max_wait=0))
+        with patch('time.sleep') as mock:
+            ratelimit.acquire('smtp', 'smtp:localhost:25')
+            ratelimit.acquire('smtp', 'smtp:localhost:25')
+            ratelimit.acquire('sms', 'twilio:AC123')
+            with self.assertRaises(RateLimitExceeded):
+                ratelimit.acquire('smtp', 'smtp:localhost:25')
+        assert not mock.called
+        assert list(ratelimit.get_utilization()) == ['smtp:localhost:25']
@@ -0,0 +1,138 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import contextlib
+import unittest
+from argparse import Namespace
+from unittest.mock import MagicMock, patch
+
+import sqlalchemy as sa
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+
+from .. import replica as replica_util
+from ..health import get_health_state
+
+METADATA = sa.MetaData()
+USERS = sa.Table('users', METADATA,
+                 sa.Column('id', sa.String, primary_key=True),
+                 sa.Column('email', sa.String))
+
+
+def create_engine(*user_ids):
+    engine = sa.create_engine('sqlite://', poolclass=StaticPool)
+    METADATA.create_all(engine)
+    with engine.begin() as c:
+        for user_id in user_ids:
+            c.execute(USERS.insert().values(id=user_id, email=user_id))
+    return engine
+
+
+def get_user(c, user_id):
+    return c.execute(USERS.select().where(USERS.c.id == user_id)).fetchone()
+
+
+class TestReplicaRead(unittest.TestCase):
+    def setUp(self):
+        self.primary = create_engine('old-user', 'new-user')
+        self.replica = create_engine('old-user')
+
+        @contextlib.contextmanager
+        def conn():
+            self.primary_reads += 1
+            with self.primary.begin() as c:
+                yield c
+
+        self.primary_reads = 0
+        stack = contextlib.ExitStack()
+        self.addCleanup(stack.close)
+        stack.enter_context(patch.object(replica_util, 'conn', conn))
+        self.addCleanup(replica_util.configure_replica, None)
+        replica_util.configure_replica(Namespace(max_lag=0))
+        replica_util._engine = self.replica
+        get_health_state().clear()
+
+    def test_no_replica(self):
+        replica_util.configure_replica(None)
+        assert replica_util.replica_read(get_user, 'old-user').id == \
+            'old-user'
+        assert self.primary_reads == 1
+
+    def test_read_from_replica(self):
+        assert replica_util.replica_read(get_user, 'old-user').id == \
+            'old-user'
+        assert self.primary_reads == 0
+
+    def test_fallback_when_missing(self):
+        assert replica_util.replica_read(get_user, 'new-user').id == \
+            'new-user'
+        assert self.primary_reads == 1
+        assert replica_util.replica_read(get_user, 'new-user',
+                                         fallback=False) is None
+        assert self.primary_reads == 1
+
+    def test_fallback_on_error(self):
+        replica_util._engine = MagicMock()
+        replica_util._engine.begin.side_effect = \
+            OperationalError('SELECT', {}, Exception('down'))
+        assert replica_util.replica_read(get_user, 'old-user').id == \
+            'old-user'
+        assert self.primary_reads == 1
+        assert get_health_state().get_status('replica') == 'error'
+
+
+class TestReplicaLag(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+        self.addCleanup(replica_util.configure_replica, None)
+        replica_util.configure_replica(
+            Namespace(max_lag=5, lag_check_interval=10))
+        patcher = patch.object(replica_util, '_timer',
+                               side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_connection(self, lag, version=(10, 5)):
+        c = MagicMock()
+        c.dialect.server_version_info = version
+        c.execute.return_value.scalar.return_value = lag
+        return c
+
+    def test_check_lag(self):
+        assert not replica_util._check_lag(self.get_connection(1))
+        assert replica_util.get_replica_lag() == 1.0
+
+        # The lag is not queried again within the check interval
+        c = self.get_connection(30)
+        assert not replica_util._check_lag(c)
+        assert not c.execute.called
+
+        self.now = 10
+        assert replica_util._check_lag(c)
+        assert replica_util.get_replica_lag() == 30.0
+
+    def test_lag_query_by_server_version(self):
+        c = self.get_connection(1, version=(9, 4, 19))
+        replica_util._check_lag(c)
+        assert c.execute.call_args[0][0] is replica_util.LEGACY_LAG_SQL
+
+        self.now = 10
+        c = self.get_connection(1, version=(10, 5))
+        replica_util._check_lag(c)
+        assert c.execute.call_args[0][0] is replica_util.LAG_SQL
+
+    def test_lag_check_disabled(self):
+        replica_util.configure_replica(Namespace(max_lag=0))
+        c = self.get_connection(30)
+        assert not replica_util._check_lag(c)
+        assert not c.execute.called
@@ -0,0 +1,101 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import gzip
+import unittest
+from unittest.mock import patch
+
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from ....template import StringTemplate
+from .. import response as response_util
+from ..cache import TTLCache
+
+
+def make_request(headers=None):
+    builder = EnvironBuilder(method='GET', path='/', headers=headers)
+    return Request(builder.get_environ())
+
+
+class TestCachedResponse(unittest.TestCase):
+    def setUp(self):
+        patcher = patch.object(response_util, '_rendered_cache',
+                               TTLCache(10, 60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_template_variables(self):
+        template = StringTemplate('error', '<p>{{ error }}</p>')
+        assert template.get_variables() == frozenset(['error'])
+
+    def test_template_variables_with_include(self):
+        template = StringTemplate('error', '{% include "base.html" %}')
+        with patch.object(template, 'get_source',
+                          wraps=template.get_source) as mock:
+            assert template.get_variables() is None
+            assert template.get_variables() is None
+            assert mock.call_count == 1
+
+    def test_render_cached_by_referenced_params(self):
+        template = StringTemplate('error', '<p>{{ error }}</p>')
+        with patch.object(template, 'render',
+                          wraps=template.render) as mock:
+            response_util.render_cached(template, error='a', other=1)
+            response_util.render_cached(template, error='a', other=2)
+            assert mock.call_count == 1
+            page = response_util.render_cached(template, error='b')
+            assert mock.call_count == 2
+        assert page.body == '<p>b</p>'
+
+    def test_uncacheable_params(self):
+        template = StringTemplate('error', '<p>{{ error }}</p>')
+        response_util.render_cached(template, error=Exception('a'))
+        assert len(response_util.get_rendered_cache()) == 0
+
+    def test_not_modified(self):
+        template = StringTemplate('success', '<p>OK</p>')
+        resp = response_util.cached_html_response(make_request(), template)
+        assert resp.status_code == 200
+        etag = resp.headers['ETag']
+
+        request = make_request({'If-None-Match': etag})
+        resp = response_util.cached_html_response(request, template)
+        assert resp.status_code == 304
+
+        resp = response_util.cached_html_response(request, template,
+                                                  status=400)
+        assert resp.status_code == 400
+
+
+class TestCompressedResponse(unittest.TestCase):
+    body = '<p>{}</p>'.format('x' * response_util.COMPRESSION_MIN_SIZE)
+
+    def test_gzip(self):
+        page = response_util.RenderedPage(self.body)
+        request = make_request({'Accept-Encoding': 'gzip'})
+        resp = response_util.html_response(request, page)
+        assert resp.headers['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(resp.get_data()) == page.data
+
+    def test_no_accept_encoding(self):
+        page = response_util.RenderedPage(self.body)
+        resp = response_util.html_response(make_request(), page)
+        assert 'Content-Encoding' not in resp.headers
+        assert resp.get_data() == page.data
+
+    def test_below_threshold(self):
+        page = response_util.RenderedPage('<p>OK</p>')
+        request = make_request({'Accept-Encoding': 'gzip'})
+        resp = response_util.html_response(request, page)
+        assert 'Content-Encoding' not in resp.headers
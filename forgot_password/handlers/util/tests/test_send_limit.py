@@ -0,0 +1,92 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from unittest.mock import patch
+
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
+
+from .. import send_limit
+from ..send_limit import (SendLimitExceeded, SendLimits,
+                          SlidingWindowLimiter)
+
+
+class MockTimer:
+    def __init__(self):
+        self.now = 3600 * 100
+
+    def __call__(self):
+        return self.now
+
+
+class TestSlidingWindowLimiter(unittest.TestCase):
+    def setUp(self):
+        # SQLite supports the same upsert syntax as PostgreSQL.
+        self.engine = sa.create_engine('sqlite://', poolclass=StaticPool)
+        self.timer = MockTimer()
+        self.limiter = SlidingWindowLimiter(3600, timer=self.timer)
+        with self.engine.begin() as c:
+            self.limiter.create_table(c)
+
+    def hit(self, key='email:user@example.com', limit=2):
+        with self.engine.begin() as c:
+            return self.limiter.hit(c, key, limit)
+
+    def test_limit_within_window(self):
+        self.hit()
+        self.hit()
+        with self.assertRaises(SendLimitExceeded) as cm:
+            self.hit()
+        assert cm.exception.retry_after == 3600
+        self.hit(key='email:other@example.com')
+
+    def test_slide_previous_window(self):
+        self.hit()
+        self.hit()
+
+        # Half of the previous window still overlaps the sliding window.
+        self.timer.now += 3600 + 1800
+        assert self.hit() == 2
+        with self.assertRaises(SendLimitExceeded) as cm:
+            self.hit()
+        assert cm.exception.retry_after == 1800
+
+        self.timer.now += 3600
+        assert self.hit() == 1.5
+
+    def test_purge(self):
+        self.hit()
+        self.timer.now += 3600 * 2
+        with self.engine.begin() as c:
+            self.limiter.purge(c)
+            rows = c.execute(sa.text('SELECT * FROM {}'.format(
+                send_limit.TABLE_NAME))).fetchall()
+        assert rows == []
+
+
+class TestSendLimits(unittest.TestCase):
+    @patch.object(send_limit, 'conn')
+    def test_disabled(self, mock):
+        limits = SendLimits()
+        assert not limits.enabled
+        limits.check_forgot_password('user@example.com')
+        limits.check_verify_request('user-id', 'email')
+        assert not mock.called
+
+    def test_normalize_email(self):
+        limits = SendLimits(per_email=1)
+        with patch.object(limits.limiter, 'hit') as mock, \
+                patch.object(send_limit, 'conn'):
+            limits.check_forgot_password(' User@Example.com ')
+        assert mock.call_args[0][1:] == ('email:user@example.com', 1)
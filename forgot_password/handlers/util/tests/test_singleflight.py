@@ -0,0 +1,138 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from ....deadline import DeadlineExceeded, request_deadline
+from ..singleflight import COALESCED_CALLS, SingleFlight
+
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.now = 0
+
+    def timer(self):
+        return self.now
+
+    def test_collapse_concurrent_calls(self):
+        flight = SingleFlight('test-collapse')
+        started = threading.Event()
+        release = threading.Event()
+        func = MagicMock(return_value={'status': 'OK'})
+
+        def slow_func():
+            started.set()
+            release.wait(5)
+            return func()
+
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(flight.call('key', slow_func)))
+        leader.start()
+        started.wait(5)
+        followers = [
+            threading.Thread(
+                target=lambda: results.append(flight.call('key', func)))
+            for _ in range(3)
+        ]
+        for thread in followers:
+            thread.start()
+        for _ in range(500):
+            if COALESCED_CALLS.get('test-collapse', 'in_flight') >= 3:
+                break
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        assert results == [{'status': 'OK'}] * 4
+        assert func.call_count == 1
+
+    def test_share_error_with_waiters(self):
+        flight = SingleFlight('test')
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def failing_func():
+            started.set()
+            release.wait(5)
+            raise ValueError('send failed')
+
+        def call():
+            try:
+                flight.call('key', failing_func)
+            except ValueError as ex:
+                errors.append(ex)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=call)
+        follower.start()
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        assert len(errors) == 2
+        assert len(flight.results) == 0
+
+    def test_remember_success_within_window(self):
+        flight = SingleFlight('test', window=30, timer=self.timer)
+        func = MagicMock(return_value={'status': 'OK'})
+        assert flight.call('a@example.com', func) == {'status': 'OK'}
+        self.now = 29
+        assert flight.call('a@example.com', func) == {'status': 'OK'}
+        assert flight.call('b@example.com', func) == {'status': 'OK'}
+        assert func.call_count == 2
+        self.now = 30
+        flight.call('a@example.com', func)
+        assert func.call_count == 3
+
+    def test_no_window(self):
+        flight = SingleFlight('test')
+        func = MagicMock(return_value={'status': 'OK'})
+        flight.call('key', func)
+        flight.call('key', func)
+        assert func.call_count == 2
+
+    def test_do_not_remember_error(self):
+        flight = SingleFlight('test', window=30, timer=self.timer)
+        func = MagicMock(side_effect=[ValueError(), {'status': 'OK'}])
+        with self.assertRaises(ValueError):
+            flight.call('key', func)
+        assert flight.call('key', func) == {'status': 'OK'}
+
+    def test_waiter_deadline(self):
+        flight = SingleFlight('test')
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_func():
+            started.set()
+            release.wait(5)
+
+        leader = threading.Thread(target=flight.call,
+                                  args=('key', slow_func))
+        leader.start()
+        started.wait(5)
+        try:
+            with request_deadline(0.01):
+                with self.assertRaises(DeadlineExceeded):
+                    flight.call('key', slow_func)
+        finally:
+            release.set()
+            leader.join(5)
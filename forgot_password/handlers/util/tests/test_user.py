@@ -0,0 +1,131 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+from collections import namedtuple
+from unittest.mock import patch
+
+from skygear.error import ResourceNotFound, SkygearException
+
+from .. import user as user_util
+from ..metrics import LEGACY_CODE_CHECKS
+
+
+User = namedtuple('User', ['id', 'email', 'password', 'last_login_at'])
+
+
+def mock_fetch(action_name, params):
+    result = []
+    for record_id in params['ids']:
+        if record_id == 'user/missing':
+            result.append({
+                '_id': record_id,
+                '_type': 'error',
+                'code': ResourceNotFound,
+                'message': 'record not found',
+            })
+        else:
+            result.append({'_id': record_id, '_type': 'record'})
+    return {'result': result}
+
+
+class TestFetchUserRecords(unittest.TestCase):
+    @patch.object(user_util, 'send_action', side_effect=mock_fetch)
+    def test_fetch_in_chunks(self, mock):
+        auth_ids = ['user{}'.format(i) for i in range(5)]
+        records = user_util.fetch_user_records(auth_ids, chunk_size=2)
+        assert mock.call_count == 3
+        assert [r.id.key for r in records] == auth_ids
+
+    @patch.object(user_util, 'send_action', side_effect=mock_fetch)
+    def test_fetch_per_item_error(self, mock):
+        records = user_util.fetch_user_records(['user1', 'missing'])
+        assert records[0].id.key == 'user1'
+        assert isinstance(records[1], SkygearException)
+        assert records[1].code == ResourceNotFound
+
+    @patch.object(user_util, 'send_action', side_effect=mock_fetch)
+    def test_fetch_single_not_found(self, mock):
+        assert user_util.fetch_user_record('missing') is None
+
+
+@patch.object(user_util.skyoptions, 'masterkey', 'secret', create=True)
+class TestResetCode(unittest.TestCase):
+    user = User('user1', 'user@example.com', 'hashed', None)
+
+    def test_validate_code(self):
+        code = user_util.generate_code(self.user, 1000)
+        assert len(code) == user_util.CODE_LENGTH
+        assert user_util.validate_code(self.user, code, 1000)
+        assert not user_util.validate_code(self.user, code, 1001)
+        assert not user_util.validate_code(
+            self.user, 'x' * user_util.CODE_LENGTH, 1000)
+
+    def test_code_invalidated_by_password_change(self):
+        code = user_util.generate_code(self.user, 1000)
+        user = self.user._replace(password='changed')
+        assert not user_util.validate_code(user, code, 1000)
+
+    def test_check_code_signature(self):
+        code = user_util.generate_code(self.user, 1000)
+        assert user_util.check_code_signature('user1', code, 1000)
+        assert not user_util.check_code_signature('user2', code, 1000)
+        assert not user_util.check_code_signature('user1', code, 1001)
+        garbage = 'x' * user_util.SIGNATURE_LENGTH + code[8:]
+        assert not user_util.check_code_signature('user1', garbage, 1000)
+
+    @patch.object(user_util, 'get_user')
+    def test_invalid_signature_skips_database(self, mock):
+        code = 'x' * user_util.CODE_LENGTH
+        expire_at = 2 ** 40
+        assert user_util.get_user_and_validate_code(
+            None, 'user1', code, expire_at) is None
+        assert not mock.called
+
+    @patch.object(user_util, '_legacy_code_deadline', 1000)
+    def test_validate_legacy_code_before_deadline(self):
+        code = user_util.generate_legacy_code(self.user, 1000)
+        assert user_util.validate_code(self.user, code, 1000)
+
+    @patch.object(user_util, '_legacy_code_deadline', 2 ** 40)
+    def test_legacy_code_has_no_signature(self):
+        code = user_util.generate_legacy_code(self.user, 1000)
+        assert not user_util.check_code_signature('user1', code, 1000)
+        assert user_util.precheck_code('user1', code, 2 ** 40)
+        assert not user_util.precheck_code('user1', 'x' * 16, 2 ** 40)
+
+    @patch.object(user_util, 'get_user')
+    @patch.object(user_util, '_legacy_code_deadline', 2 ** 40)
+    def test_count_legacy_code_checks(self, mock):
+        mock.return_value = self.user
+        LEGACY_CODE_CHECKS.clear()
+        code = user_util.generate_legacy_code(self.user, 2 ** 40)
+        assert user_util.get_user_and_validate_code(
+            None, 'user1', code, 2 ** 40) == self.user
+        assert user_util.get_user_and_validate_code(
+            None, 'user1', 'x' * 8, 2 ** 40) is None
+        assert LEGACY_CODE_CHECKS.get('valid') == 1
+        assert LEGACY_CODE_CHECKS.get('invalid') == 1
+
+    @patch.object(user_util, '_legacy_code_deadline', 999)
+    def test_reject_legacy_code_after_deadline(self):
+        code = user_util.generate_legacy_code(self.user, 1000)
+        assert not user_util.validate_code(self.user, code, 1000)
+
+    @patch.object(user_util, '_legacy_code_deadline', None)
+    def test_accept_legacy_codes_until_configured_time(self):
+        code = user_util.generate_legacy_code(self.user, 1000)
+        user_util.accept_legacy_codes(0)
+        assert not user_util.validate_code(self.user, code, 1000)
+        user_util.accept_legacy_codes(1000)
+        assert user_util.validate_code(self.user, code, 1000)
@@ -0,0 +1,75 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import datetime
+import re
+import unittest
+from unittest.mock import patch
+
+from skygear.models import Record, RecordID
+
+from .. import verify_code as verify_code_util
+
+
+@patch.object(verify_code_util.skyoptions, 'masterkey', 'secret',
+              create=True)
+class TestStatelessCode(unittest.TestCase):
+    def generate(self, code_format='numeric', record_value='a@example.com',
+                 version=1, window=100):
+        return verify_code_util.generate_stateless_code(
+            code_format, 'user-1', 'email', record_value, version, window)
+
+    def check(self, code, now, lifetime=3600, record_value='a@example.com',
+              version=1):
+        return verify_code_util.check_stateless_code(
+            'numeric', code, 'user-1', 'email', record_value, version,
+            lifetime, now=now)
+
+    def test_code_format(self):
+        assert re.match(r'^[0-9]{6}$', self.generate('numeric'))
+        assert re.match(r'^[0-9a-z]{8}$', self.generate('complex'))
+        assert self.generate() == self.generate()
+        assert self.generate() != self.generate(window=101)
+        assert self.generate() != self.generate(record_value='b@example.com')
+        assert self.generate() != self.generate(version=2)
+
+    def test_code_window(self):
+        assert verify_code_util.get_code_window(3600, now=1800 * 10) == 10
+        assert verify_code_util.get_code_window(3600, now=1800 * 11 - 1) \
+            == 10
+        assert verify_code_util.get_code_window(0, now=1800 * 10) == 0
+
+    def test_check_code_within_lifetime(self):
+        issued_at = 1800 * 10 + 900
+        code = self.generate(
+            window=verify_code_util.get_code_window(3600, now=issued_at))
+        assert self.check(code, now=issued_at)
+        assert self.check(' {} '.format(code), now=issued_at)
+        assert self.check(code, now=issued_at + 2699)
+        assert not self.check(code, now=issued_at + 2700)
+        assert not self.check(code, now=issued_at,
+                              record_value='b@example.com')
+        assert not self.check(code, now=issued_at, version=2)
+
+    def test_check_code_without_expiry(self):
+        code = self.generate(window=0)
+        assert self.check(code, now=10 ** 9, lifetime=0)
+
+    def test_record_version(self):
+        updated_at = datetime.datetime(2018, 9, 4, 10, 0, 0, 123456,
+                                       tzinfo=datetime.timezone.utc)
+        user_record = Record(RecordID('user', 'user-1'), 'user-1', None,
+                             updated_at=updated_at)
+        assert verify_code_util.get_record_version(user_record) == \
+            1536055200123
+        assert verify_code_util.get_record_version({}) == 0
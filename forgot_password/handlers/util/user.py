@@ -12,38 +12,147 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import hashlib
+import hmac
 from datetime import datetime
 
 from skygear.container import SkygearContainer
 from skygear.encoding import deserialize_record, serialize_record
-from skygear.error import SkygearException
+from skygear.error import ResourceNotFound, SkygearException
 from skygear.options import options as skyoptions
 from skygear.utils.db import get_table, has_table
 from sqlalchemy.sql import select
 
+from ...timing import timed
+from .container import send_action
+from .metrics import LEGACY_CODE_CHECKS
+
+RECORD_CHUNK_SIZE = 100
+
+SIGNATURE_LENGTH = 8
+CODE_LENGTH = SIGNATURE_LENGTH + 16
+LEGACY_CODE_LENGTH = 8
+
+_code_hmac = None
+_code_hmac_key = None
+_legacy_code_deadline = None
+
+
+def _get_code_hmac():
+    """
+    Return the HMAC state keyed with the master key. The state is computed
+    once and cloned for every code.
+    """
+    global _code_hmac, _code_hmac_key
+    masterkey = skyoptions.masterkey
+    if _code_hmac is None or _code_hmac_key != masterkey:
+        _code_hmac = hmac.new(masterkey.encode('utf-8'),
+                              digestmod=hashlib.sha256)
+        _code_hmac_key = masterkey
+    return _code_hmac
+
+
+def _code_fields(user, expire_at):
+    fields = [user.id, user.email, str(expire_at)]
+    if user.password:
+        fields.append(user.password)
+    if user.last_login_at:
+        fields.append(str(user.last_login_at))
+    return fields
+
+
+def _hmac_hexdigest(domain, fields):
+    m = _get_code_hmac().copy()
+    m.update(domain)
+    m.update('\0'.join(fields).encode('utf-8'))
+    return m.hexdigest()
+
+
+def generate_signature(user_id, expire_at):
+    """
+    Generate the signature part of a code. The signature only depends on
+    the user ID and expiry, so it can be checked without the database.
+    """
+    digest = _hmac_hexdigest(b'signature\0', [user_id, str(expire_at)])
+    return digest[:SIGNATURE_LENGTH]
+
 
 def generate_code(user, expire_at):
     """
     Generate a code that the user has to enter in order to reset
     password. The code is generated from user information. The code
     is invalidated when the password or last login date changes.
+
+    The code is prefixed with a signature of the user ID and expiry.
     """
+    digest = _hmac_hexdigest(b'code\0', _code_fields(user, expire_at))
+    return generate_signature(user.id, expire_at) + \
+        digest[:CODE_LENGTH - SIGNATURE_LENGTH]
 
+
+def generate_legacy_code(user, expire_at):
+    """
+    Generate a code in the format used before HMAC codes were introduced.
+    """
     encoding = 'utf-8'
 
     m = hashlib.sha1()
     m.update(skyoptions.masterkey.encode(encoding))
-    m.update(user.id.encode(encoding))
-    m.update(user.email.encode(encoding))
-    m.update(str(expire_at).encode(encoding))
-    if user.password:
-        m.update(user.password.encode(encoding))
-    if user.last_login_at:
-        m.update(str(user.last_login_at).encode(encoding))
+    for field in _code_fields(user, expire_at):
+        m.update(field.encode(encoding))
 
-    return m.hexdigest()[:8]
+    return m.hexdigest()[:LEGACY_CODE_LENGTH]
 
 
+def accept_legacy_codes(until):
+    """
+    Accept codes in the legacy format that expire no later than the Unix
+    timestamp `until`. The timestamp is configured rather than computed at
+    start, so that restarting the plugin does not extend it. Legacy codes
+    are not accepted if it is not set.
+    """
+    global _legacy_code_deadline
+    _legacy_code_deadline = until or None
+
+
+def _is_legacy_code_accepted(code, expire_at):
+    return len(code) == LEGACY_CODE_LENGTH \
+        and _legacy_code_deadline is not None \
+        and expire_at <= _legacy_code_deadline
+
+
+def check_code_signature(user_id, code, expire_at):
+    """
+    Return whether the signature part of the code is valid, without
+    looking up the user from the database. Legacy codes have no signature
+    and never pass the check.
+    """
+    code = str(code)
+    if len(code) != CODE_LENGTH:
+        return False
+    expected = generate_signature(str(user_id), expire_at)
+    return hmac.compare_digest(code[:SIGNATURE_LENGTH].encode('utf-8'),
+                               expected.encode('utf-8'))
+
+
+def validate_code(user, code, expire_at):
+    """
+    Return whether the code is valid for the user, comparing in constant
+    time.
+    """
+    code = str(code)
+    if _is_legacy_code_accepted(code, expire_at):
+        valid = hmac.compare_digest(
+            code.encode('utf-8'),
+            generate_legacy_code(user, expire_at).encode('utf-8'))
+        LEGACY_CODE_CHECKS.inc('valid' if valid else 'invalid')
+        return valid
+    if len(code) != CODE_LENGTH:
+        return False
+    return hmac.compare_digest(
+        code.encode('utf-8'), generate_code(user, expire_at).encode('utf-8'))
+
+
+@timed('db:get_user')
 def get_user(c, user_id):
     """
     Get user information from the database with the specified user ID.
@@ -60,6 +169,7 @@ def get_user(c, user_id):
     return result.fetchone()
 
 
+@timed('db:get_user_record')
 def get_user_record(c, user_id):
     """
     Get user record from the database with the specified user ID.
@@ -73,6 +183,7 @@ def get_user_record(c, user_id):
     return result.fetchone()
 
 
+@timed('db:get_user_from_email')
 def get_user_from_email(c, email):
     """
     Get user information from the database with the specified user email.
@@ -89,19 +200,38 @@ def get_user_from_email(c, email):
     return result.fetchone()
 
 
-def get_user_and_validate_code(c, user_id, code, expire_at):
+def precheck_code(user_id, code, expire_at):
     """
-    Get user information from the database with the specified user ID and
-    verification code.
+    Return whether the code can be valid for the specified user ID and
+    expiry. Only the expiry and the code signature are checked, so invalid
+    codes are rejected without querying the database.
+
+    Legacy codes cannot be checked without the database, so they pass
+    while they are accepted and are counted by `validate_code`. Callers
+    count the failures of the database check as failed attempts.
     """
     if not user_id or not code:
-        return None
+        return False
 
     if datetime.utcnow().timestamp() > expire_at:
+        return False
+
+    if _is_legacy_code_accepted(str(code), expire_at):
+        return True
+
+    return check_code_signature(user_id, code, expire_at)
+
+
+def get_user_and_validate_code(c, user_id, code, expire_at):
+    """
+    Get user information from the database with the specified user ID and
+    verification code.
+    """
+    if not precheck_code(user_id, code, expire_at):
         return None
 
     user = get_user(c, user_id)
-    if code != generate_code(user, expire_at):
+    if not user or not validate_code(user, code, expire_at):
         return None
     return user
 
@@ -111,13 +241,10 @@ def set_new_password(user_id, new_password):
     Set the password of a user to a new password
     with auth:reset_password
     """
-    container = SkygearContainer(
-        api_key=skyoptions.masterkey
-    )
-    resp = container.send_action("auth:reset_password", {
+    resp = send_action("auth:reset_password", {
         "auth_id": user_id,
         "password": new_password,
-    }, plugin_request=True)
+    })
     try:
         if "error" in resp:
             raise SkygearException.from_dict(resp["error"])
@@ -125,39 +252,87 @@ def set_new_password(user_id, new_password):
         raise SkygearContainer("container.send_action is buggy")
 
 
-def fetch_user_record(auth_id):
-    """
-    Fetch the user record from Skygear Record API. The returned value
-    is a user record in Record class.
-    """
-    container = SkygearContainer(
-        api_key=skyoptions.masterkey
-    )
-
-    resp = container.send_action("record:fetch", {
-        "ids": ['user/{}'.format(auth_id)]
-    }, plugin_request=True)
+def _send_record_action(action_name, params):
+    resp = send_action(action_name, params)
     try:
         if "error" in resp:
             raise SkygearException.from_dict(resp["error"])
     except (ValueError, TypeError, KeyError):
         raise SkygearContainer("container.send_action is buggy")
-    return deserialize_record(resp['result'][0])
+    return resp['result']
+
+
+def _chunks(items, chunk_size):
+    for i in range(0, len(items), chunk_size):
+        yield items[i:i + chunk_size]
+
+
+def _is_error_item(item):
+    return item.get('_type') == 'error'
+
+
+def fetch_user_records(auth_ids, chunk_size=RECORD_CHUNK_SIZE):
+    """
+    Fetch user records from Skygear Record API, sending one `record:fetch`
+    action for every `chunk_size` records.
+
+    Return a list in the same order as `auth_ids`. Each item is either a
+    user record in Record class or a SkygearException if the record cannot
+    be fetched.
+    """
+    results = []
+    for chunk in _chunks(list(auth_ids), chunk_size):
+        items = _send_record_action("record:fetch", {
+            "ids": ['user/{}'.format(auth_id) for auth_id in chunk]
+        })
+        for item in items:
+            if _is_error_item(item):
+                results.append(SkygearException.from_dict(item))
+            else:
+                results.append(deserialize_record(item))
+    return results
+
+
+def fetch_user_record(auth_id):
+    """
+    Fetch the user record from Skygear Record API. The returned value
+    is a user record in Record class, or None if the record is not found.
+    """
+    result = fetch_user_records([auth_id])[0]
+    if isinstance(result, SkygearException):
+        if result.code == ResourceNotFound:
+            return None
+        raise result
+    return result
+
+
+def save_user_records(user_records, chunk_size=RECORD_CHUNK_SIZE):
+    """
+    Save user records to Skygear Record API, sending one non-atomic
+    `record:save` action for every `chunk_size` records.
+
+    Return a list in the same order as `user_records`. Each item is either
+    the saved user record in Record class or a SkygearException if the record
+    cannot be saved.
+    """
+    results = []
+    for chunk in _chunks(list(user_records), chunk_size):
+        items = _send_record_action("record:save", {
+            "records": [serialize_record(record) for record in chunk]
+        })
+        for item in items:
+            if _is_error_item(item):
+                results.append(SkygearException.from_dict(item))
+            else:
+                results.append(deserialize_record(item))
+    return results
 
 
 def save_user_record(user_record):
     """
     Save the user record to Skygear Record API.
     """
-    container = SkygearContainer(
-        api_key=skyoptions.masterkey
-    )
-
-    resp = container.send_action("record:save", {
-        "records": [serialize_record(user_record)]
-    }, plugin_request=True)
-    try:
-        if "error" in resp:
-            raise SkygearException.from_dict(resp["error"])
-    except (ValueError, TypeError, KeyError):
-        raise SkygearContainer("container.send_action is buggy")
+    result = save_user_records([user_record])[0]
+    if isinstance(result, SkygearException):
+        raise result
+    return result
@@ -11,14 +11,21 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import hashlib
+import hmac
 import random
 import string
+import time
 import uuid
 
+from skygear.options import options as skyoptions
 from skygear.utils.db import get_table
-from sqlalchemy.sql import and_, desc, func, select
+from sqlalchemy.sql import and_, desc, false, func, select
 
+from ...timing import timed
 
+
+@timed('db:get_verify_code')
 def get_verify_code(c, auth_id, code):
     """
     Get a previously created verify code from database.
@@ -35,6 +42,24 @@ def get_verify_code(c, auth_id, code):
     return result.fetchone()
 
 
+@timed('db:get_outstanding_verify_code')
+def get_outstanding_verify_code(c, auth_id, record_key, record_value):
+    """
+    Get the newest verify code of the user data that is not consumed yet.
+    """
+    code_table = get_table('_verify_code')
+    stmt = select([code_table]) \
+        .where(and_(code_table.c.auth_id == auth_id,
+                    code_table.c.record_key == record_key,
+                    code_table.c.record_value == record_value,
+                    code_table.c.consumed == false())) \
+        .order_by(desc(code_table.c.created_at)) \
+        .limit(1)
+    result = c.execute(stmt)
+    return result.fetchone()
+
+
+@timed('db:add_verify_code')
 def add_verify_code(c, auth_id, record_key, record_value, code):
     """
     Create a new verify code into the database.
@@ -52,14 +77,18 @@ def add_verify_code(c, auth_id, record_key, record_value, code):
     c.execute(code_table.insert().values(**values))
 
 
+@timed('db:set_code_consumed')
 def set_code_consumed(c, code_id):
     """
-    Mark the specified verify code as consumed.
+    Mark the specified verify code as consumed. Return whether the code
+    was consumed by this call, which is False if it has been consumed
+    already, such as by a concurrent request.
     """
     code_table = get_table('_verify_code')
     stmt = code_table.update().values(consumed=True) \
-        .where(code_table.c.id == code_id)
-    c.execute(stmt)
+        .where(code_table.c.id == code_id) \
+        .where(code_table.c.consumed == false())
+    return c.execute(stmt).rowcount > 0
 
 
 def generate_code(code_format):
@@ -77,6 +106,77 @@ def generate_code(code_format):
         ])
 
 
+def get_record_version(user_record):
+    """
+    Return the version of the user record that stateless codes are derived
+    from, which changes whenever the record is saved. It is the time the
+    record was last saved, in milliseconds.
+    """
+    updated_at = getattr(user_record, 'updated_at', None)
+    if updated_at is None:
+        return 0
+    return int(updated_at.timestamp() * 1000)
+
+
+def _stateless_digest(auth_id, record_key, record_value, version, window):
+    message = '\0'.join([auth_id, record_key, str(record_value), str(version),
+                         str(window)])
+    return hmac.new(skyoptions.masterkey.encode('utf-8'),
+                    b'verify\0' + message.encode('utf-8'),
+                    hashlib.sha256).digest()
+
+
+def get_code_window(lifetime, now=None):
+    """
+    Return the time window of a stateless code issued now. Windows are half
+    of the code lifetime long, so that a code can be accepted in its own and
+    the next window without living longer than `lifetime` seconds.
+    """
+    if not lifetime:
+        return 0
+    now = time.time() if now is None else now
+    return int(now // max(lifetime / 2, 1))
+
+
+def generate_stateless_code(code_format, auth_id, record_key, record_value,
+                            version, window):
+    """
+    Generate a verify code derived from the user data, the version of the
+    user record and the time window, in the specified code format, so that
+    it need not be stored.
+    """
+    digest = _stateless_digest(auth_id, record_key, record_value, version,
+                               window)
+    value = int.from_bytes(digest[:8], 'big')
+    if code_format == 'numeric':
+        return '{:06d}'.format(value % 10 ** 6)
+
+    alphabet = string.digits + string.ascii_lowercase
+    chars = []
+    for _ in range(8):
+        value, index = divmod(value, len(alphabet))
+        chars.append(alphabet[index])
+    return ''.join(chars)
+
+
+def check_stateless_code(code_format, code, auth_id, record_key,
+                         record_value, version, lifetime, now=None):
+    """
+    Return whether the code is a stateless code of the user data and the
+    version of the user record that has not expired, comparing in constant
+    time.
+    """
+    window = get_code_window(lifetime, now)
+    windows = [window, window - 1] if lifetime else [window]
+    code = str(code).strip().encode('utf-8')
+    valid = False
+    for w in windows:
+        expected = generate_stateless_code(code_format, auth_id, record_key,
+                                           record_value, version, w)
+        valid |= hmac.compare_digest(code, expected.encode('utf-8'))
+    return valid
+
+
 def verified_flag_name(record_key):
     """
     Return the name for verified flag for the corresponding record key.
@@ -23,14 +23,28 @@ from skygear.error import NotAuthenticated, SkygearException
 from skygear.models import Record
 from skygear.options import options as skyoptions
 from skygear.utils.context import current_context, current_user_id
-from skygear.utils.db import conn
 
+from ..deadline import with_request_deadline
 from ..providers import get_provider_class
 from ..template import FileTemplate, StringTemplate, TemplateProvider
+from .util.attempt import AttemptGuard, AttemptRejected
+from .util.db import (conn, own_conn, release_connection,
+                      with_request_connection)
+from .util.health import get_health_state
+from .util.lock import acquire_advisory_lock
+from .util.metrics import instrument, observe_provider_send
+from .util.replica import replica_read
+from .util.response import (RenderedPage, cached_html_response,
+                            html_response)
 from .util.schema import (schema_add_key_verified_acl,
                           schema_add_key_verified_flags)
+from .util.send_limit import SendLimitExceeded, SendLimits
+from .util.singleflight import SingleFlight
 from .util.user import fetch_user_record, get_user, save_user_record
-from .util.verify_code import (add_verify_code, generate_code, get_verify_code,
+from .util.verify_code import (add_verify_code, check_stateless_code,
+                               generate_code, generate_stateless_code,
+                               get_code_window, get_outstanding_verify_code,
+                               get_record_version, get_verify_code,
                                set_code_consumed, verified_flag_name)
 
 logger = logging.getLogger(__name__)
@@ -45,7 +59,15 @@ except ImportError:
 USER_VERIFIED_FLAG_NAME = 'is_verified'
 
 
-def register(settings, test_provider_settings):  # noqa
+def register(settings, test_provider_settings, attempt_guard=None,  # noqa
+             send_limits=None, flight=None):
+    """
+    Register ops, hooks and handlers of user verification, returning the
+    template provider of the verification pages.
+    """
+    attempt_guard = attempt_guard or AttemptGuard()
+    send_limits = send_limits or SendLimits()
+    flight = flight or SingleFlight('user:verify_request')
     providers = {}
     templates = TemplateProvider()
     for record_key, key_settings in settings.keys.items():
@@ -72,17 +94,36 @@ def register(settings, test_provider_settings):  # noqa
     )
 
     @skygear.op('user:verify_code')
+    @instrument('op', 'user:verify_code')
+    @with_request_deadline
+    @with_request_connection
     def verify_code_lambda(code):
         """
         This lambda checks the user submitted code.
         """
-        if not current_user_id():
+        auth_id = current_user_id()
+        if not auth_id:
             raise SkygearException("You must log in to perform this action.",
                                    code=NotAuthenticated)
+
+        attempt_key = ('verify', auth_id, code)
+        try:
+            attempt_guard.check(auth_id, attempt_key)
+        except AttemptRejected as ex:
+            raise SkygearException(str(ex), skyerror.PermissionDenied)
+
         thelambda = VerifyCodeLambda(settings)
-        return thelambda(current_user_id(), code)
+        try:
+            return thelambda(auth_id, code)
+        except SkygearException as ex:
+            if ex.code == skyerror.InvalidArgument:
+                attempt_guard.record_failure(auth_id, attempt_key)
+            raise
 
     @skygear.op('user:verify_request')
+    @instrument('op', 'user:verify_request')
+    @with_request_deadline
+    @with_request_connection
     def verify_request_lambda(record_key):
         """
         This lambda allows client to request verification
@@ -91,10 +132,20 @@ def register(settings, test_provider_settings):  # noqa
         if not current_user_id():
             raise SkygearException("You must log in to perform this action.",
                                    code=NotAuthenticated)
-        thelambda = VerifyRequestLambda(settings, providers)
+
+        try:
+            send_limits.check_verify_request(current_user_id(), record_key)
+        except SendLimitExceeded as ex:
+            raise SkygearException(str(ex), skyerror.PermissionDenied,
+                                   info={'retry_after': ex.retry_after})
+
+        thelambda = VerifyRequestLambda(settings, providers, flight=flight)
         return thelambda(current_user_id(), record_key)
 
     @skygear.before_save('user', async_=False)
+    @instrument('hook', 'user:before_save:verify')
+    @with_request_deadline
+    @with_request_connection
     def before_user_save_hook(record, original_record, db):
         """
         Checks the user record for data changes so that verified flag
@@ -104,21 +155,28 @@ def register(settings, test_provider_settings):  # noqa
         return record
 
     @skygear.after_save('user', async_=True)
+    @instrument('hook', 'user:after_save:verify')
+    @with_request_deadline
+    @with_request_connection
     def after_user_save_hook(record, original_record, db):
         """
         Performs action upon saving user record such as sending verifications.
         """
         send_signup_verification(settings, providers,
-                                 record, original_record, db)
+                                 record, original_record, db, flight=flight)
         send_update_verification(settings, providers,
-                                 record, original_record, db)
+                                 record, original_record, db, flight=flight)
 
     @skygear.handler('user:verify-code:form', method=['GET', 'POST'])
+    @instrument('handler', 'user:verify-code:form')
+    @with_request_deadline
+    @with_request_connection
     def verify_code_handler(request):
         """
         HTML handler to allow verification through browser.
         """
-        thehandler = VerifyCodeFormHandler(settings, providers, templates)
+        thehandler = VerifyCodeFormHandler(settings, providers, templates,
+                                           attempt_guard=attempt_guard)
         return thehandler(request)
 
     @skygear.event('before-plugins-ready')
@@ -130,12 +188,20 @@ def register(settings, test_provider_settings):  # noqa
         managed_flags = [verified_flag_name(k) for k in settings.keys.keys()]
         if settings.auto_update:
             managed_flags.append(USER_VERIFIED_FLAG_NAME)
-        if settings.modify_schema:
-            schema_add_key_verified_flags(managed_flags)
-        if settings.modify_acl:
-            schema_add_key_verified_acl(managed_flags)
+        try:
+            if settings.modify_schema:
+                schema_add_key_verified_flags(managed_flags)
+            if settings.modify_acl:
+                schema_add_key_verified_acl(managed_flags)
+        except Exception as ex:
+            get_health_state().set_error('schema', ex)
+            raise
+        get_health_state().set_ok('schema')
 
     @skygear.op('user:verify_request:test', key_required=True)
+    @instrument('op', 'user:verify_request:test')
+    @with_request_deadline
+    @with_request_connection
     def test_verify_request_lambda(record_key,
                                    record_value,
                                    provider_settings={},
@@ -215,6 +281,9 @@ def register(settings, test_provider_settings):  # noqa
         thelambda = VerifyRequestTestLambda(settings, _providers)
         return thelambda(record_key, record_value)
 
+    get_health_state().register('schema', required=True)
+    return templates
+
 
 def get_provider(provider_settings, key, **kwargs):
     """
@@ -244,6 +313,21 @@ def should_user_be_verified(settings, user_record):
         return verified_keys == set(criteria)
 
 
+def get_stateless_keys(settings):
+    """
+    Return the record keys verified with stateless codes.
+    """
+    return [k for k, v in settings.keys.items() if v.stateless]
+
+
+def has_stored_keys(settings):
+    """
+    Return whether any record key is verified with codes stored in the
+    database.
+    """
+    return any(not v.stateless for v in settings.keys.values())
+
+
 class VerifyCodeLambda:
     """
     This lambda handles the client submission for verification code.
@@ -252,17 +336,59 @@ class VerifyCodeLambda:
         self.settings = settings
 
     def __call__(self, auth_id, code_str):
+        self.verify(auth_id, code_str)
+
+    def get_code(self, auth_id, code_str):
+        """
+        Return the stored code of the user, or None if it is not found or
+        no record key uses stored codes.
+
+        The code is read from the primary, as a code consumed within the
+        replication lag would otherwise look unconsumed.
+        """
+        if not has_stored_keys(self.settings):
+            return None
         with conn() as c:
-            code = get_verify_code(c, auth_id, code_str)
-            if not code or code.consumed:
-                msg = 'the code `{}` is not valid ' \
-                      'for user `{}`'.format(code_str, auth_id)
-                raise SkygearException(msg, skyerror.InvalidArgument)
+            return get_verify_code(c, auth_id, code_str)
 
+    def verify(self, auth_id, code_str):
+        """
+        Verify the user data with the code, returning the record key
+        verified.
+        """
+        return self.verify_code(auth_id, code_str,
+                                self.get_code(auth_id, code_str))
+
+    def verify_code(self, auth_id, code_str, code):
+        """
+        Verify the user data with the code, given the stored code returned
+        by `get_code`, returning the record key verified.
+
+        The stored code is checked first. Stateless codes are then checked
+        against the current data of each record key using them.
+        """
+        if code and not code.consumed:
+            self.verify_stored_code(auth_id, code)
+            return code.record_key
+
+        if get_stateless_keys(self.settings):
+            record_key = self.verify_stateless_code(auth_id, code_str)
+            if record_key:
+                return record_key
+
+        msg = 'the code `{}` is not valid ' \
+              'for user `{}`'.format(code_str, auth_id)
+        raise SkygearException(msg, skyerror.InvalidArgument)
+
+    def fetch_user_record(self, auth_id):
         user_record = fetch_user_record(auth_id)
         if not user_record:
             msg = 'user `{}` not found'.format(auth_id)
             raise SkygearException(msg, skyerror.ResourceNotFound)
+        return user_record
+
+    def verify_stored_code(self, auth_id, code):
+        user_record = self.fetch_user_record(auth_id)
 
         if user_record.get(code.record_key) != code.record_value:
             msg = 'the user data has since been modified, ' \
@@ -277,20 +403,50 @@ class VerifyCodeLambda:
                 raise SkygearException(msg, skyerror.InvalidArgument)
 
         with conn() as c:
-            set_code_consumed(c, code.id)
+            if not set_code_consumed(c, code.id):
+                msg = 'the code has been used'
+                raise SkygearException(msg, skyerror.InvalidArgument)
 
         user_record[verified_flag_name(code.record_key)] = True
         save_user_record(user_record)
 
+    def verify_stateless_code(self, auth_id, code_str):
+        """
+        Verify the record key whose stateless code matches. A code can only
+        be used once because it changes whenever the user record is saved,
+        including when the data is verified.
+        """
+        user_record = self.fetch_user_record(auth_id)
+        for record_key in get_stateless_keys(self.settings):
+            flag_name = verified_flag_name(record_key)
+            record_value = user_record.get(record_key)
+            if not record_value or user_record.get(flag_name):
+                continue
+
+            key_settings = self.settings.keys[record_key]
+            if check_stateless_code(key_settings.code_format, code_str,
+                                    auth_id, record_key, record_value,
+                                    get_record_version(user_record),
+                                    key_settings.expiry):
+                user_record[flag_name] = True
+                save_user_record(user_record)
+                return record_key
+        return None
+
 
 class VerifyRequestLambda:
     """
     This lambda handles the client request for verification. Usually
     a email or SMS will be sent.
+
+    Concurrent requests for the same user and record key are collapsed by
+    the flight within a process, and by an advisory lock across processes
+    if `VERIFY_LOCK` is `advisory`.
     """
-    def __init__(self, settings, providers):
+    def __init__(self, settings, providers, flight=None):
         self.settings = settings
         self.providers = providers
+        self.flight = flight
 
     def is_valid_record_key(self, record_key):
         return record_key not in self.settings.keys
@@ -326,7 +482,9 @@ class VerifyRequestLambda:
             record_key, user, user_record, code_str
         )
         value_to_verify = user_record.get(record_key)
-        provider.send(value_to_verify, template_params)
+        release_connection()
+        with observe_provider_send(provider.settings.name, record_key):
+            provider.send(value_to_verify, template_params)
 
     def __call__(self, auth_id, record_key):
         if self.is_valid_record_key(record_key):
@@ -335,34 +493,131 @@ class VerifyRequestLambda:
             )
             raise SkygearException(msg, skyerror.InvalidArgument)
 
-        with conn() as c:
-            user = get_user(c, auth_id)
-            if not user:
-                msg = 'user `{}` not found'.format(auth_id)
-                raise SkygearException(msg, skyerror.ResourceNotFound)
+        if self.flight is None:
+            return self.request_verification(auth_id, record_key)
+        return self.flight.call((auth_id, record_key),
+                                self.request_verification,
+                                auth_id, record_key)
+
+    def request_verification(self, auth_id, record_key):
+        if self.settings.lock != 'advisory':
+            return self.issue_verification(auth_id, record_key)
+
+        # The lock is held on a connection of its own, as the connection of
+        # the request is released before sending.
+        with own_conn() as lock_conn:
+            waited = acquire_advisory_lock(lock_conn, 'verify:lock',
+                                           'verify', auth_id, record_key)
+            return self.issue_verification(auth_id, record_key,
+                                           waited=waited)
+
+    def issue_verification(self, auth_id, record_key, waited=False):
+        """
+        Send a verification of the record key to the user, subject to the
+        resend policy of the key. If the request waited for another request
+        of the same user and key, nothing is sent if that request has left
+        an outstanding code.
+        """
+        user = replica_read(get_user, auth_id)
+        if not user:
+            msg = 'user `{}` not found'.format(auth_id)
+            raise SkygearException(msg, skyerror.ResourceNotFound)
 
         user_record = fetch_user_record(auth_id)
         if not user_record:
             msg = 'user `{}` not found'.format(auth_id)
             raise SkygearException(msg, skyerror.ResourceNotFound)
 
-        value_to_verify = user_record.get(record_key)
-        if not value_to_verify:
+        if not user_record.get(record_key):
             msg = 'there is nothing to verify for record_key `{}` ' \
                   'with auth_id `{}`'.format(record_key, auth_id)
             raise SkygearException(msg, skyerror.InvalidArgument)
 
-        code_str = self.get_code(record_key)
+        if self.settings.keys[record_key].stateless:
+            self.issue_stateless_verification(auth_id, record_key, user,
+                                              user_record, waited=waited)
+        else:
+            self.issue_stored_verification(auth_id, record_key, user,
+                                           user_record, waited=waited)
 
-        with conn() as c:
-            add_verify_code(c, auth_id, record_key, value_to_verify,
-                            code_str)
+    def issue_stateless_verification(self, auth_id, record_key, user,
+                                     user_record, waited=False):
+        """
+        Send a stateless code derived from the current user record.
+        """
+        # The request waited for has sent a code
+        if waited:
+            return
 
-            logger.info('Added new verify code `{}` for user `{}`.'.format(
-                code_str, auth_id
-            ))
+        # Saving the user record changes its version, which renews the
+        # code and invalidates codes sent before.
+        key_settings = self.settings.keys[record_key]
+        user_record = save_user_record(user_record)
+        code_str = generate_stateless_code(
+            key_settings.code_format, auth_id, record_key,
+            user_record.get(record_key), get_record_version(user_record),
+            get_code_window(key_settings.expiry))
         self.call_provider(record_key, user, user_record, code_str)
 
+    def issue_stored_verification(self, auth_id, record_key, user,
+                                  user_record, waited=False):
+        """
+        Send the outstanding code or a new stored code, subject to the
+        resend policy of the record key.
+        """
+        key_settings = self.settings.keys[record_key]
+        value_to_verify = user_record.get(record_key)
+        with conn() as c:
+            code, age = self.get_outstanding_code(c, auth_id, record_key,
+                                                  value_to_verify,
+                                                  force=waited)
+            if code and (waited or age < key_settings.resend_cooldown):
+                logger.info('Skipped resending verify code for user `{}`.'
+                            .format(auth_id))
+                return
+
+            if code and age < self.get_reuse_window(record_key):
+                code_str = code.code
+                logger.info('Resending verify code `{}` for user `{}`.'
+                            .format(code_str, auth_id))
+            else:
+                code_str = self.get_code(record_key)
+                add_verify_code(c, auth_id, record_key, value_to_verify,
+                                code_str)
+
+                logger.info('Added new verify code `{}` for user `{}`.'
+                            .format(code_str, auth_id))
+        self.call_provider(record_key, user, user_record, code_str)
+
+    def get_reuse_window(self, record_key):
+        """
+        Return the number of seconds an outstanding code is sent again
+        instead of a new code. It never exceeds the expiry of the code.
+        """
+        key_settings = self.settings.keys[record_key]
+        if key_settings.expiry:
+            return min(key_settings.reuse_window, key_settings.expiry)
+        return key_settings.reuse_window
+
+    def get_outstanding_code(self, c, auth_id, record_key, record_value,
+                             force=False):
+        """
+        Return the newest unconsumed code of the user data and its age in
+        seconds, if the resend policy of the record key needs it or `force`
+        is set.
+        """
+        key_settings = self.settings.keys[record_key]
+        if not force and not key_settings.resend_cooldown and \
+                not self.get_reuse_window(record_key):
+            return None, None
+
+        code = get_outstanding_verify_code(c, auth_id, record_key,
+                                           record_value)
+        if not code:
+            return None, None
+        age = (datetime.datetime.now() - code.created_at).total_seconds()
+        return code, age
+
 
 class VerifyRequestTestLambda(VerifyRequestLambda):
 
@@ -411,7 +666,8 @@ def update_flags(settings, record, original_record, db):
     return record
 
 
-def send_signup_verification(settings, providers, record, original_record, db):
+def send_signup_verification(settings, providers, record, original_record, db,
+                             flight=None):
     """
     Send sign up verification according to developer-specified settings.
     """
@@ -423,11 +679,13 @@ def send_signup_verification(settings, providers, record, original_record, db):
 
     for record_key in settings.keys.keys():
         if record.get(record_key, None):
-            thelambda = VerifyRequestLambda(settings, providers)
+            thelambda = VerifyRequestLambda(settings, providers,
+                                            flight=flight)
             thelambda(record.id.key, record_key)
 
 
-def send_update_verification(settings, providers, record, original_record, db):
+def send_update_verification(settings, providers, record, original_record, db,
+                             flight=None):
     """
     Send update verification according to developer-specified settings.
     """
@@ -440,7 +698,7 @@ def send_update_verification(settings, providers, record, original_record, db):
     def is_changed(x, y):
         return x.get(record_key, None) != y.get(record_key, None)
 
-    thelambda = VerifyRequestLambda(settings, providers)
+    thelambda = VerifyRequestLambda(settings, providers, flight=flight)
     for record_key in settings.keys.keys():
         if is_changed(record, original_record):
             thelambda(record.id.key, record_key)
@@ -464,14 +722,28 @@ def response_url_redirect(url, **kwargs):
                             headers=[('Location', new_url.geturl())])
 
 
+class FailedAttempt(Exception):
+    """
+    Raised for a form submission that counts as a failed attempt.
+    """
+    pass
+
+
+def is_failed_attempt(ex):
+    return isinstance(ex, FailedAttempt) or \
+        (isinstance(ex, SkygearException) and
+         ex.code == skyerror.InvalidArgument)
+
+
 class VerifyCodeFormHandler:
     """
     Handler for serving browser-based verify code submission.
     """
-    def __init__(self, settings, providers, templates):
+    def __init__(self, settings, providers, templates, attempt_guard=None):
         self.settings = settings
         self.providers = providers
         self.templates = templates
+        self.attempt_guard = attempt_guard or AttemptGuard()
 
     def get_success_template(self, record_key):
         template_name = '{}_success_html'.format(record_key)
@@ -496,16 +768,16 @@ class VerifyCodeFormHandler:
         }
         return response_url_redirect(url, **filtered_kwargs)
 
-    def response_success(self, record_key, **kwargs):
+    def response_success(self, record_key, request=None, **kwargs):
         key_settings = self.settings.keys[record_key]
         if key_settings.success_redirect:
             return self.response_redirect(key_settings.success_redirect,
                                           **kwargs)
 
-        body = self.get_success_template(record_key).render(**kwargs)
-        return skygear.Response(body, content_type='text/html')
+        template = self.get_success_template(record_key)
+        return cached_html_response(request, template, **kwargs)
 
-    def response_error(self, record_key=None, **kwargs):
+    def response_error(self, record_key=None, request=None, **kwargs):
         error_redirect = None
         if record_key:
             key_settings = self.settings.keys[record_key]
@@ -522,30 +794,45 @@ class VerifyCodeFormHandler:
             return self.response_redirect(error_redirect, **kwargs)
 
         body = template.render(**kwargs)
-        return skygear.Response(body, status=400, content_type='text/html')
+        return html_response(request, RenderedPage(body), status=400)
+
+    def get_attempt_key(self, auth_id, code_str):
+        if not auth_id:
+            raise FailedAttempt('missing auth_id')
+
+        if not code_str:
+            raise FailedAttempt('missing code_str')
+
+        return ('verify', auth_id, code_str)
+
+    def get_code(self, thelambda, auth_id, code_str):
+        code = thelambda.get_code(auth_id, code_str)
+        if not code and not get_stateless_keys(self.settings):
+            raise FailedAttempt('code not found')
+        return code
 
     def __call__(self, request):
         auth_id = request.values.get('auth_id')
         code_str = request.values.get('code')
+        caller = self.attempt_guard.get_caller(request)
 
         code = None
+        attempt_key = None
         try:
-            if not auth_id:
-                raise Exception('missing auth_id')
-
-            if not code_str:
-                raise Exception('missing code_str')
-
-            with conn() as c:
-                code = get_verify_code(c, auth_id, code_str)
-                if not code:
-                    raise Exception('code not found')
+            self.attempt_guard.check(caller)
+            attempt_key = self.get_attempt_key(auth_id, code_str)
+            self.attempt_guard.check(caller, attempt_key)
 
             thelambda = VerifyCodeLambda(self.settings)
-            thelambda(auth_id, code_str)
-            return self.response_success(code.record_key)
+            code = self.get_code(thelambda, auth_id, code_str)
+            record_key = thelambda.verify_code(auth_id, code_str, code)
+            return self.response_success(record_key, request=request)
 
         except Exception as ex:
             logger.exception('error occurred fixme')
+            if is_failed_attempt(ex):
+                self.attempt_guard.record_failure(caller, attempt_key)
             record_key = code.record_key if code else None
-            return self.response_error(record_key=record_key, error=ex)
+            return self.response_error(record_key=record_key,
+                                       request=request,
+                                       error=ex)
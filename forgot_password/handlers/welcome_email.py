@@ -23,9 +23,12 @@ from skygear.error import SkygearException
 from skygear.models import Record, RecordID
 from skygear.utils.context import current_context
 
+from ..deadline import DeadlineExceeded, with_request_deadline
 from ..template import FileTemplate
 from .template_mail import TemplateMailSender
 from .util import user as user_util
+from .util.db import with_request_connection
+from .util.metrics import instrument
 
 logger = logging.getLogger(__name__)
 try:
@@ -71,6 +74,9 @@ def register_hooks_and_ops(**kwargs):
 
 def register_hooks(mail_sender, settings, welcome_email_settings):
     @skygear.after_save('user', async_=True)
+    @instrument('hook', 'user:after_save:welcome_email')
+    @with_request_deadline
+    @with_request_connection
     def user_after_save(record, original_record, db):
         if original_record:
             # ignore for old users
@@ -124,6 +130,9 @@ def register_hooks(mail_sender, settings, welcome_email_settings):
 
 def register_ops(mail_sender, settings, welcome_email_settings):
     @skygear.op('user:welcome-email:test', key_required=True)
+    @instrument('op', 'user:welcome-email:test')
+    @with_request_deadline
+    @with_request_connection
     def test_welcome_email(email,
                            text_template=None,
                            html_template=None,
@@ -179,6 +188,8 @@ def register_ops(mail_sender, settings, welcome_email_settings):
                              text_template_string=text_template,
                              html_template_string=html_template,
                              template_params=template_params)
+        except DeadlineExceeded:
+            raise
         except Exception as ex:
             logger.exception('An error occurred when '
                              'testing welcome email: {}'.format(str(ex)))
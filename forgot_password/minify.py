@@ -0,0 +1,56 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import re
+
+# Segments kept as authored: Jinja tags, whitespace-sensitive elements and
+# HTML comments (which are removed unless they are conditional comments).
+_PRESERVED_PATTERN = re.compile(
+    r'({#.*?#}|{%.*?%}|{{.*?}}'
+    r'|<(pre|textarea|script|style)\b.*?</\2\s*>'
+    r'|<!--.*?-->)',
+    re.DOTALL | re.IGNORECASE
+)
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+
+def _is_removable_comment(segment):
+    return segment.startswith('<!--') and not segment.startswith('<!--[') \
+        and not segment.startswith('<!--<![')
+
+
+def minify_html(source):
+    """
+    Minify an HTML template source by removing HTML comments and
+    collapsing whitespace.
+
+    Jinja tags and the content of `pre`, `textarea`, `script` and `style`
+    elements are kept unchanged.
+    """
+    result = []
+    text = []
+    pos = 0
+    for match in _PRESERVED_PATTERN.finditer(source):
+        text.append(source[pos:match.start()])
+        pos = match.end()
+
+        segment = match.group(1)
+        if _is_removable_comment(segment):
+            continue
+
+        result.append(_WHITESPACE_PATTERN.sub(' ', ''.join(text)))
+        result.append(segment)
+        text = []
+    text.append(source[pos:])
+    result.append(_WHITESPACE_PATTERN.sub(' ', ''.join(text)))
+    return ''.join(result).strip()
@@ -11,6 +11,8 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import hashlib
+
 _providers = {}
 
 
@@ -31,3 +33,13 @@ def get_provider_class(name):
             msg += ' No providers are configured.'
         raise KeyError(msg)
     return _providers[name]
+
+
+def get_account_name(provider, credential):
+    """
+    Return the name of a provider account, such as for its circuit breaker
+    and rate limit. The account is identified by a short hash of its
+    credential, so that the name can be reported without leaking it.
+    """
+    digest = hashlib.sha256(credential.encode('utf-8')).hexdigest()
+    return '{}:{}'.format(provider, digest[:8])
@@ -1,8 +1,13 @@
+import functools
 import logging
 
 import nexmo
+import requests
 
-from .. import register_provider_class
+from .. import get_account_name, register_provider_class
+from ...deadline import DeadlineExceeded, get_timeout
+from ...handlers.util import ratelimit
+from ...handlers.util.circuit import circuit_breaker
 from ...template import FileTemplate
 
 
@@ -15,6 +20,14 @@ except ImportError:
     pass
 
 
+def is_nexmo_failure(ex):
+    """
+    Return whether an error sending SMS is a failure of Nexmo, rather than
+    one caused by the message, such as an invalid phone number.
+    """
+    return isinstance(ex, (nexmo.ServerError, requests.RequestException))
+
+
 class NexmoProvider:
     def __init__(self, key, settings, template=None, **kwargs):
         self.settings = settings
@@ -50,9 +63,15 @@ class NexmoProvider:
     def api_secret(self):
         return getattr(self.settings, 'nexmo_api_secret')
 
-    @property
-    def _client(self):
-        return nexmo.Client(key=self.api_key, secret=self.api_secret)
+    def _get_client(self, timeout=None):
+        client = nexmo.Client(key=self.api_key, secret=self.api_secret)
+        # The client has no timeout option, but newer versions send
+        # requests with a session that can be given a default timeout.
+        session = getattr(client, 'session', None)
+        if timeout and isinstance(session, requests.Session):
+            session.request = functools.partial(session.request,
+                                                timeout=timeout)
+        return client
 
     def _message(self, recipient, template_params):
         return {
@@ -63,7 +82,15 @@ class NexmoProvider:
 
     def send(self, recipient, template_params=None):
         msg = self._message(recipient, template_params or {})
-        response = self._client.send_message(msg)
+        account = get_account_name('nexmo', self.api_key)
+        try:
+            with circuit_breaker(account) as call:
+                ratelimit.acquire('sms', account)
+                client = self._get_client(get_timeout(account))
+                response = call(client.send_message, msg,
+                                is_failure=is_nexmo_failure)
+        except requests.Timeout:
+            raise DeadlineExceeded(account)
         response = response['messages'][0]
         success = (response['status'] == '0')
         if success:
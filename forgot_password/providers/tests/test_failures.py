@@ -0,0 +1,43 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import nexmo
+import requests
+from twilio.base.exceptions import TwilioRestException
+
+from .. import get_account_name
+from ..nexmo import is_nexmo_failure
+from ..twilio import is_twilio_failure
+
+
+class TestProviderFailures(unittest.TestCase):
+    def test_twilio_failure(self):
+        assert is_twilio_failure(requests.Timeout())
+        assert is_twilio_failure(requests.ConnectionError())
+        assert is_twilio_failure(TwilioRestException(503, '/Messages'))
+        assert not is_twilio_failure(TwilioRestException(400, '/Messages'))
+
+    def test_nexmo_failure(self):
+        assert is_nexmo_failure(requests.Timeout())
+        assert is_nexmo_failure(nexmo.ServerError('500 response'))
+        assert not is_nexmo_failure(nexmo.ClientError('400 response'))
+
+    def test_account_name_hides_credential(self):
+        name = get_account_name('twilio', 'AC0123456789abcdef')
+        assert name.startswith('twilio:')
+        assert 'AC0123456789abcdef' not in name
+        assert len(name) == len('twilio:') + 8
+        assert name == get_account_name('twilio', 'AC0123456789abcdef')
+        assert name != get_account_name('twilio', 'AC0123456789abcdee')
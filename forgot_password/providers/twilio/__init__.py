@@ -1,8 +1,14 @@
 import logging
 
+import requests
+from twilio.base.exceptions import TwilioRestException
+from twilio.http.http_client import TwilioHttpClient
 from twilio.rest import Client
 
-from .. import register_provider_class
+from .. import get_account_name, register_provider_class
+from ...deadline import DeadlineExceeded, get_timeout
+from ...handlers.util import ratelimit
+from ...handlers.util.circuit import circuit_breaker
 from ...template import FileTemplate
 
 
@@ -15,6 +21,16 @@ except ImportError:
     pass
 
 
+def is_twilio_failure(ex):
+    """
+    Return whether an error sending SMS is a failure of Twilio, rather than
+    one caused by the message, such as an invalid phone number.
+    """
+    if isinstance(ex, TwilioRestException):
+        return ex.status >= 500
+    return isinstance(ex, requests.RequestException)
+
+
 class TwilioProvider:
     def __init__(self, key, settings, template=None, **kwargs):
         self.key = key
@@ -50,9 +66,9 @@ class TwilioProvider:
     def auth_token(self):
         return getattr(self.settings, 'twilio_auth_token')
 
-    @property
-    def _client(self):
-        return Client(self.account_sid, self.auth_token)
+    def _get_client(self, timeout=None):
+        return Client(self.account_sid, self.auth_token,
+                      http_client=TwilioHttpClient(timeout=timeout))
 
     def _message(self, recipient, template_params):
         return {
@@ -63,7 +79,15 @@ class TwilioProvider:
 
     def send(self, recipient, template_params=None):
         msg = self._message(recipient, template_params or {})
-        self._client.messages.create(**msg)
+        account = get_account_name('twilio', self.account_sid)
+        try:
+            with circuit_breaker(account) as call:
+                ratelimit.acquire('sms', account)
+                client = self._get_client(get_timeout(account))
+                call(client.messages.create, is_failure=is_twilio_failure,
+                     **msg)
+        except requests.Timeout:
+            raise DeadlineExceeded(account)
         logger.info('Sent SMS to `%s`. msg=%s', recipient, msg)
 
 
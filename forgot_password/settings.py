@@ -13,6 +13,9 @@
 # limitations under the License.
 
 
+import os
+import tempfile
+
 from skygear.options import options as skyoptions
 from skygear.settings import SettingsParser
 
@@ -40,6 +43,13 @@ def get_settings_parser():
         resolve=False,
         default=False
     )
+    parser.add_setting(
+        'minify_html',
+        atype=bool,
+        required=False,
+        resolve=False,
+        default=False
+    )
     parser.add_setting(
         'sender_name',
         resolve=False,
@@ -70,6 +80,20 @@ def get_settings_parser():
         required=False,
         default=43200
     )
+    parser.add_setting(
+        'legacy_codes_until',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=0
+    )
+    parser.add_setting(
+        'dedup_window',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=0
+    )
     parser.add_setting('success_redirect', resolve=False, required=False)
     parser.add_setting('error_redirect', resolve=False, required=False)
     parser.add_setting('email_text_url', resolve=False, required=False)
@@ -93,6 +117,347 @@ def get_smtp_settings_parser():
     return parser
 
 
+def get_container_settings_parser():
+    parser = SettingsParser('FORGOT_PASSWORD_CONTAINER')
+
+    parser.add_setting(
+        'pool_size',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=10
+    )
+    parser.add_setting(
+        'timeout',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=60
+    )
+    parser.add_setting(
+        'max_retries',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=2
+    )
+
+    return parser
+
+
+def get_attempt_settings_parser():
+    parser = SettingsParser('FORGOT_PASSWORD_ATTEMPT')
+
+    parser.add_setting(
+        'cache_size',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=10000
+    )
+    parser.add_setting(
+        'cache_ttl',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=60
+    )
+    parser.add_setting(
+        'max_failures',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=20
+    )
+    parser.add_setting(
+        'failure_window',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=300
+    )
+    parser.add_setting(
+        'trusted_proxies',
+        atype=str,
+        resolve=False,
+        required=False,
+        default=''
+    )
+
+    return parser
+
+
+def get_metrics_settings_parser():
+    parser = SettingsParser('FORGOT_PASSWORD_METRICS')
+
+    parser.add_setting(
+        'enable',
+        atype=bool,
+        resolve=False,
+        required=False,
+        default=False
+    )
+
+    return parser
+
+
+def get_timing_settings_parser():
+    parser = SettingsParser('FORGOT_PASSWORD_TIMING')
+
+    parser.add_setting(
+        'enable',
+        atype=bool,
+        resolve=False,
+        required=False,
+        default=False
+    )
+    parser.add_setting(
+        'min_duration',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=0
+    )
+
+    return parser
+
+
+def get_profile_settings_parser():
+    parser = SettingsParser('FORGOT_PASSWORD_PROFILE')
+
+    parser.add_setting(
+        'sample_rate',
+        atype=float,
+        resolve=False,
+        required=False,
+        default=0.0
+    )
+    parser.add_setting(
+        'directory',
+        resolve=False,
+        required=False,
+        default=os.path.join(tempfile.gettempdir(), 'forgot_password_profile')
+    )
+    parser.add_setting(
+        'interval',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=300
+    )
+    parser.add_setting(
+        'keep',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=12
+    )
+
+    return parser
+
+
+def get_memory_settings_parser():
+    parser = SettingsParser('FORGOT_PASSWORD_MEMORY')
+
+    parser.add_setting(
+        'enable',
+        atype=bool,
+        resolve=False,
+        required=False,
+        default=False
+    )
+    parser.add_setting(
+        'frames',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=1
+    )
+
+    return parser
+
+
+def get_health_settings_parser():
+    parser = SettingsParser('FORGOT_PASSWORD_HEALTH')
+
+    parser.add_setting(
+        'enable',
+        atype=bool,
+        resolve=False,
+        required=False,
+        default=False
+    )
+    parser.add_setting(
+        'template_retry_interval',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=60
+    )
+
+    return parser
+
+
+def get_rate_limit_settings_parser():
+    parser = SettingsParser('FORGOT_PASSWORD_RATE_LIMIT')
+
+    parser.add_setting(
+        'smtp_rate',
+        atype=float,
+        resolve=False,
+        required=False,
+        default=0.0
+    )
+    parser.add_setting(
+        'smtp_burst',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=10
+    )
+    parser.add_setting(
+        'sms_rate',
+        atype=float,
+        resolve=False,
+        required=False,
+        default=0.0
+    )
+    parser.add_setting(
+        'sms_burst',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=10
+    )
+    parser.add_setting(
+        'max_wait',
+        atype=float,
+        resolve=False,
+        required=False,
+        default=1.0
+    )
+
+    return parser
+
+
+def get_send_limit_settings_parser():
+    parser = SettingsParser('FORGOT_PASSWORD_SEND_LIMIT')
+
+    parser.add_setting(
+        'window',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=3600
+    )
+    parser.add_setting(
+        'per_email',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=0
+    )
+    parser.add_setting(
+        'per_verify_key',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=0
+    )
+
+    return parser
+
+
+def get_circuit_settings_parser():
+    parser = SettingsParser('FORGOT_PASSWORD_CIRCUIT')
+
+    parser.add_setting(
+        'failure_threshold',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=5
+    )
+    parser.add_setting(
+        'latency_threshold',
+        atype=float,
+        resolve=False,
+        required=False,
+        default=0.0
+    )
+    parser.add_setting(
+        'reset_timeout',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=30
+    )
+    parser.add_setting(
+        'half_open_max',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=1
+    )
+
+    return parser
+
+
+def get_replica_settings_parser():
+    parser = SettingsParser('FORGOT_PASSWORD_REPLICA')
+
+    parser.add_setting(
+        'url',
+        atype=str,
+        resolve=False,
+        required=False
+    )
+    parser.add_setting(
+        'pool_size',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=5
+    )
+    parser.add_setting(
+        'max_lag',
+        atype=float,
+        resolve=False,
+        required=False,
+        default=5.0
+    )
+    parser.add_setting(
+        'lag_check_interval',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=5
+    )
+
+    return parser
+
+
+def get_deadline_settings_parser():
+    parser = SettingsParser('FORGOT_PASSWORD_DEADLINE')
+
+    parser.add_setting(
+        'request_timeout',
+        atype=float,
+        resolve=False,
+        required=False,
+        default=30.0
+    )
+    parser.add_setting(
+        'io_timeout',
+        atype=float,
+        resolve=False,
+        required=False,
+        default=10.0
+    )
+
+    return parser
+
+
 def get_welcome_email_settings_parser():
     parser = SettingsParser('FORGOT_PASSWORD_WELCOME_EMAIL')
 
@@ -251,6 +616,13 @@ def get_verify_settings_parser():
         resolve=False,
         required=False
     )
+    parser.add_setting(
+        'lock',
+        atype=str,
+        resolve=False,
+        required=False,
+        default='process'
+    )
     return parser
 
 
@@ -274,6 +646,27 @@ def get_verify_settings_parser_for_key(key):
         required=False,
         default=60*60*24  # 1 day
     )
+    parser.add_setting(
+        'stateless',
+        atype=bool,
+        resolve=False,
+        required=False,
+        default=False
+    )
+    parser.add_setting(
+        'resend_cooldown',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=0
+    )
+    parser.add_setting(
+        'reuse_window',
+        atype=int,
+        resolve=False,
+        required=False,
+        default=0
+    )
     parser.add_setting(
         'success_redirect',
         atype=str,
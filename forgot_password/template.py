@@ -15,15 +15,35 @@
 
 import logging
 import os
+import shutil
+import socket
 import tempfile
 from pathlib import Path
 from urllib.error import URLError
-from urllib.request import urlretrieve
+from urllib.request import urlopen
 
 import jinja2
+from jinja2 import meta
+
+from .deadline import DeadlineExceeded, get_timeout
+from .minify import minify_html
+from .timing import span
 
 logger = logging.getLogger(__name__)
 
+HTML_TEMPLATE_EXTENSIONS = ('.html', '.htm')
+
+_minify_html = False
+
+
+def enable_html_minification(enabled=True):
+    """
+    Enable or disable minifying HTML file templates when they are loaded.
+    """
+    global _minify_html
+    _minify_html = enabled
+    FileTemplate.reset_jinja_env()
+
 
 class TemplateNotFound(Exception):
     def __init__(self, template_name):
@@ -61,9 +81,30 @@ class FileTemplateDownloadError(Exception):
                                                        self.reason)
 
 
+class MinifyingLoader(jinja2.BaseLoader):
+    """
+    Jinja loader minifying the source of HTML templates loaded by the
+    wrapped loader, before the templates are compiled.
+    """
+    def __init__(self, loader):
+        self._loader = loader
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = \
+            self._loader.get_source(environment, template)
+        if template.lower().endswith(HTML_TEMPLATE_EXTENSIONS):
+            source = minify_html(source)
+        return source, filename, uptodate
+
+    def list_templates(self):
+        return self._loader.list_templates()
+
+
 class BaseTemplate:
     def __init__(self, name):
         self._name = name
+        self._variables = None
+        self._variables_parsed = False
 
     @property
     def name(self):
@@ -76,15 +117,45 @@ class BaseTemplate:
         """
         return None
 
+    def get_source(self):
+        """
+        Get the template source.
+        This method is expected to be overridden by subclasses.
+        """
+        return None
+
+    def get_variables(self):
+        """
+        Get the names of the variables referenced by the template, or None
+        if they cannot be determined because the template includes or
+        extends other templates.
+        """
+        if not self._variables_parsed:
+            source = self.get_source()
+            if not source:
+                self._variables = frozenset()
+            else:
+                ast = jinja2.Environment().parse(source)
+                if not list(meta.find_referenced_templates(ast)):
+                    self._variables = frozenset(
+                        meta.find_undeclared_variables(ast))
+            self._variables_parsed = True
+        return self._variables
+
     def render(self, **kwargs):
         """
         Render template content.
         """
-        template_content = self.get()
-        return template_content.render(**kwargs) if template_content else None
+        with span('render:{}'.format(self.name)):
+            template_content = self.get()
+            if not template_content:
+                return None
+            return template_content.render(**kwargs)
 
 
 class FileTemplate(BaseTemplate):
+    _jinja_env = None
+
     @classmethod
     def get_download_dir_path(cls):
         return Path(tempfile.gettempdir()).joinpath('forgot_password',
@@ -92,12 +163,25 @@ class FileTemplate(BaseTemplate):
 
     @classmethod
     def get_jinja_env(cls):
-        return jinja2.Environment(loader=jinja2.ChoiceLoader([
-            jinja2.FileSystemLoader(str(cls.get_download_dir_path())),
-            jinja2.FileSystemLoader(
-                os.path.abspath("templates/forgot_password")),
-            jinja2.PackageLoader('forgot_password', 'templates'),
-        ]))
+        """
+        Get the Jinja environment shared by file templates, so that compiled
+        templates are cached between renders.
+        """
+        if FileTemplate._jinja_env is None:
+            loader = jinja2.ChoiceLoader([
+                jinja2.FileSystemLoader(str(cls.get_download_dir_path())),
+                jinja2.FileSystemLoader(
+                    os.path.abspath("templates/forgot_password")),
+                jinja2.PackageLoader(__package__, 'templates'),
+            ])
+            if _minify_html:
+                loader = MinifyingLoader(loader)
+            FileTemplate._jinja_env = jinja2.Environment(loader=loader)
+        return FileTemplate._jinja_env
+
+    @classmethod
+    def reset_jinja_env(cls):
+        FileTemplate._jinja_env = None
 
     def __init__(self, name, file_name, download_url=None, required=True):
         super(FileTemplate, self).__init__(name)
@@ -126,20 +210,37 @@ class FileTemplate(BaseTemplate):
 
         dir_path.mkdir(parents=True, exist_ok=True)
 
+        operation = 'template:{}'.format(self.file_name)
         try:
             logger.info('Downloading {} from {}'.format(self.file_name,
                                                         self.download_url))
-            urlretrieve(self.download_url, str(file_path))
+            timeout = get_timeout(operation)
+            with urlopen(self.download_url, timeout=timeout) as response, \
+                    file_path.open('wb') as f:
+                shutil.copyfileobj(response, f)
+        except socket.timeout:
+            self._discard(file_path)
+            raise DeadlineExceeded(operation)
         except URLError as ex:
+            self._discard(file_path)
+            if isinstance(ex.reason, socket.timeout):
+                raise DeadlineExceeded(operation)
             logger.error('Failed to download {} from {}: {}'.format(
                 self.file_name, self.download_url, ex.reason))
             raise FileTemplateDownloadError(self.file_name,
                                             self.download_url,
                                             ex.reason)
 
-    def get(self):
+    def _discard(self, file_path):
         """
-        Get the template content.
+        Remove a partially downloaded template file.
+        """
+        if file_path.exists():
+            file_path.unlink()
+
+    def download_if_missing(self):
+        """
+        Download template file from the URL if it is not downloaded yet.
         """
         dir_path = self.get_download_dir_path()
         file_path = dir_path.joinpath(self.file_name)
@@ -147,6 +248,25 @@ class FileTemplate(BaseTemplate):
         if self.download_url and not file_path.exists():
             self.download()
 
+    def get_source(self):
+        """
+        Get the template source.
+        """
+        self.download_if_missing()
+
+        env = self.get_jinja_env()
+        try:
+            source, _, _ = env.loader.get_source(env, self.file_name)
+            return source
+        except jinja2.TemplateNotFound:
+            return None
+
+    def get(self):
+        """
+        Get the template content.
+        """
+        self.download_if_missing()
+
         try:
             return self.get_jinja_env().get_template(self.file_name)
         except jinja2.TemplateNotFound:
@@ -168,6 +288,12 @@ class StringTemplate(BaseTemplate):
     def content(self):
         return self._content
 
+    def get_source(self):
+        """
+        Get the template source.
+        """
+        return self.content
+
     def get(self):
         """
         Get the template content.
@@ -183,6 +309,10 @@ class TemplateProvider:
         for each_template in args:
             self.add_template(each_template)
 
+    @property
+    def templates(self):
+        return list(self._templates.values())
+
     def add_template(self, template):
         name = template.name
         self._templates[name] = template
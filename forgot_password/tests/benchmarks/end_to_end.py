@@ -0,0 +1,236 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+End-to-end benchmark of the forgot password and verification flows.
+
+The registered ops and handlers run in-process against a local SMTP sink,
+an SQLite database standing in for the `_user`, `user` and `_verify_code`
+tables, and a fake container answering server actions.
+
+Run with `python -m forgot_password.tests.benchmarks.end_to_end`.
+"""
+import argparse
+import contextlib
+import os
+import sys
+from datetime import datetime
+from unittest.mock import patch
+
+from skygear.container import SkygearContainer
+from skygear.options import options as skyoptions
+from skygear.registry import get_registry
+from skygear.utils.context import start_context
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Request
+
+from ... import settings as settings_module
+from ...handlers import register_handlers
+from ...handlers.util import container as container_util
+from ...handlers.util import user as user_util
+from ..db_fixtures import add_users, create_database, patch_database
+from .fixtures import FakeTransport, SMTPSink
+from .stats import dump_results, format_results, measure
+
+
+def get_environ(smtp_sink):
+    return {
+        'FORGOT_PASSWORD_APP_NAME': 'benchmark',
+        'FORGOT_PASSWORD_URL_PREFIX': 'http://localhost:3000',
+        'SMTP_HOST': smtp_sink.host,
+        'SMTP_PORT': str(smtp_sink.port),
+        'VERIFY_URL_PREFIX': 'http://localhost:3000',
+        'VERIFY_KEYS': 'email',
+        'VERIFY_KEYS_EMAIL_PROVIDER': 'smtp',
+        'VERIFY_KEYS_EMAIL_PROVIDER_SMTP_HOST': smtp_sink.host,
+        'VERIFY_KEYS_EMAIL_PROVIDER_SMTP_PORT': str(smtp_sink.port),
+    }
+
+
+def register(smtp_sink):
+    """
+    Register the ops and handlers of the plugin with settings pointing to
+    the local stand-ins.
+    """
+    with patch.dict(os.environ, get_environ(smtp_sink)):
+        register_handlers(
+            settings=settings_module.get_settings_parser().parse_settings(),
+            smtp_settings=settings_module.get_smtp_settings_parser()
+            .parse_settings(),
+            container_settings=settings_module
+            .get_container_settings_parser().parse_settings(),
+            attempt_settings=settings_module
+            .get_attempt_settings_parser().parse_settings(),
+            metrics_settings=settings_module
+            .get_metrics_settings_parser().parse_settings(),
+            timing_settings=settings_module
+            .get_timing_settings_parser().parse_settings(),
+            profile_settings=settings_module
+            .get_profile_settings_parser().parse_settings(),
+            memory_settings=settings_module
+            .get_memory_settings_parser().parse_settings(),
+            health_settings=settings_module
+            .get_health_settings_parser().parse_settings(),
+            rate_limit_settings=settings_module
+            .get_rate_limit_settings_parser().parse_settings(),
+            send_limit_settings=settings_module
+            .get_send_limit_settings_parser().parse_settings(),
+            circuit_settings=settings_module
+            .get_circuit_settings_parser().parse_settings(),
+            deadline_settings=settings_module
+            .get_deadline_settings_parser().parse_settings(),
+            replica_settings=settings_module
+            .get_replica_settings_parser().parse_settings(),
+            welcome_email_settings=settings_module
+            .get_welcome_email_settings_parser().parse_settings(),
+            verify_settings=settings_module
+            .get_verify_settings_parser().parse_settings(),
+            verify_test_provider_settings={},
+        )
+
+
+def make_request(method, values):
+    if method == 'GET':
+        builder = EnvironBuilder(method=method, path='/reset-password',
+                                 query_string=values)
+    else:
+        builder = EnvironBuilder(method=method, path='/reset-password',
+                                 data=values)
+    return Request(builder.get_environ())
+
+
+def call_op(name, user_id=None, **kwargs):
+    func = get_registry().get_func('op', name)
+    with start_context({'user_id': user_id}):
+        return func(**kwargs)
+
+
+def call_handler(name, request):
+    func = get_registry().get_handler(name, request.method)
+    response = func(request)
+    if response.status_code >= 400:
+        raise Exception('{} returned {}'.format(name, response.status_code))
+    return response
+
+
+def get_reset_values(engine, tables, user_ids):
+    expire_at = round(datetime.utcnow().timestamp()) + 3600
+    values = []
+    with engine.begin() as c:
+        for user_id in user_ids:
+            user = user_util.get_user(c, user_id)
+            values.append({
+                'code': user_util.generate_code(user, expire_at),
+                'user_id': user_id,
+                'expire_at': str(expire_at),
+                'password': 'new-password',
+                'confirm': 'new-password',
+            })
+    return values
+
+
+def get_verify_codes(engine, tables):
+    code_table = tables['_verify_code']
+    with engine.begin() as c:
+        rows = c.execute(code_table.select()
+                         .where(code_table.c.consumed.is_(False))
+                         .order_by(code_table.c.created_at))
+        return [(row.auth_id, row.code) for row in rows]
+
+
+def run(iterations, user_count):
+    """
+    Run every stage `iterations` times and return the list of
+    StageResult.
+    """
+    smtp_sink = SMTPSink().start()
+    engine, tables = create_database()
+    transport = FakeTransport()
+    user_ids = add_users(engine, tables, user_count)
+    transport.add_user_records(user_ids)
+
+    def users():
+        return [user_ids[i % user_count] for i in range(iterations)]
+
+    results = []
+    with contextlib.ExitStack() as stack:
+        stack.callback(smtp_sink.stop)
+        # Drop the container created with the fake transport when done
+        stack.callback(container_util.configure_container, None)
+        stack.enter_context(patch.object(skyoptions, 'masterkey',
+                                         'benchmark-master-key', create=True))
+        stack.enter_context(patch.object(skyoptions, 'appname',
+                                         'benchmark', create=True))
+        stack.enter_context(patch.object(SkygearContainer, 'transport',
+                                         transport))
+        stack.enter_context(patch_database(engine, tables))
+        register(smtp_sink)
+        container_util.configure_container(None)
+
+        results.append(measure(
+            'user:forgot-password',
+            lambda user_id: call_op('user:forgot-password',
+                                    email='{}@example.com'.format(user_id)),
+            [(user_id,) for user_id in users()]
+        ))
+
+        reset_values = get_reset_values(engine, tables, users())
+        results.append(measure(
+            'reset-password (GET)',
+            lambda values: call_handler('reset-password',
+                                        make_request('GET', values)),
+            [(values,) for values in reset_values]
+        ))
+        results.append(measure(
+            'reset-password (POST)',
+            lambda values: call_handler('reset-password',
+                                        make_request('POST', values)),
+            [(values,) for values in reset_values]
+        ))
+
+        results.append(measure(
+            'user:verify_request',
+            lambda user_id: call_op('user:verify_request', user_id=user_id,
+                                    record_key='email'),
+            [(user_id,) for user_id in users()]
+        ))
+
+        results.append(measure(
+            'user:verify_code',
+            lambda user_id, code: call_op('user:verify_code',
+                                          user_id=user_id, code=code),
+            get_verify_codes(engine, tables)
+        ))
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--iterations', type=int, default=200,
+                        help='number of calls for each stage')
+    parser.add_argument('--users', type=int, default=50,
+                        help='number of users in the database')
+    parser.add_argument('--json', metavar='PATH',
+                        help='write results in JSON to the file')
+    args = parser.parse_args(argv)
+
+    results = run(args.iterations, args.users)
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as fp:
+            dump_results(results, fp)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Local stand-ins of the services used by the plugin, for benchmarks.
+"""
+import copy
+import socketserver
+import threading
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, *lines):
+        # Write multi-line replies at once to avoid delayed ACK stalls
+        self.wfile.write(b''.join(
+            line.encode('ascii') + b'\r\n' for line in lines
+        ))
+
+    def handle(self):
+        self.reply('220 localhost SMTP sink')
+        in_data = False
+        for line in self.rfile:
+            if in_data:
+                if line.rstrip(b'\r\n') == b'.':
+                    in_data = False
+                    self.server.add_message()
+                    self.reply('250 OK')
+                continue
+
+            command = line[:4].upper()
+            if command == b'EHLO':
+                self.reply('250-localhost', '250 8BITMIME')
+            elif command == b'DATA':
+                in_data = True
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+            elif command == b'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    SMTP server accepting and discarding all messages.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), _SMTPSinkHandler)
+        self._lock = threading.Lock()
+        self._thread = None
+        self.message_count = 0
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def add_message(self):
+        with self._lock:
+            self.message_count += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeTransport:
+    """
+    Transport answering the server actions sent by the plugin from an
+    in-memory record store.
+    """
+    def __init__(self):
+        self.records = {}
+        self.action_count = 0
+
+    def add_user_records(self, user_ids):
+        for user_id in user_ids:
+            record_id = 'user/{}'.format(user_id)
+            self.records[record_id] = {
+                '_id': record_id,
+                '_type': 'record',
+                '_access': None,
+                'email': '{}@example.com'.format(user_id),
+            }
+
+    def send_action(self, action_name, payload, url=None, timeout=None):
+        self.action_count += 1
+        if action_name == 'record:fetch':
+            return {'result': [
+                copy.deepcopy(self.records[record_id])
+                if record_id in self.records
+                else {'_id': record_id, '_type': 'error', 'code': 110}
+                for record_id in payload['ids']
+            ]}
+        if action_name == 'record:save':
+            for record in payload['records']:
+                self.records[record['_id']] = record
+            return {'result': payload['records']}
+        return {'result': 'OK'}
@@ -0,0 +1,86 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import math
+import time
+
+
+def percentile(sorted_values, fraction):
+    """
+    Return the value at the fraction of the sorted values, using the
+    nearest-rank method.
+    """
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class StageResult:
+    def __init__(self, name, latencies):
+        self.name = name
+        self.latencies = sorted(latencies)
+
+    @property
+    def count(self):
+        return len(self.latencies)
+
+    @property
+    def ops_per_sec(self):
+        total = sum(self.latencies)
+        return self.count / total if total else None
+
+    @property
+    def p50(self):
+        return percentile(self.latencies, 0.5)
+
+    @property
+    def p99(self):
+        return percentile(self.latencies, 0.99)
+
+    def as_dict(self):
+        return {
+            'name': self.name,
+            'count': self.count,
+            'ops_per_sec': self.ops_per_sec,
+            'p50_ms': self.p50 * 1000,
+            'p99_ms': self.p99 * 1000,
+        }
+
+
+def measure(name, func, args_list):
+    """
+    Call the function once for each item of `args_list` and return the
+    StageResult of the call latencies.
+    """
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - start)
+    return StageResult(name, latencies)
+
+
+def format_results(results):
+    lines = ['{:<32} {:>8} {:>12} {:>10} {:>10}'.format(
+        'stage', 'count', 'ops/sec', 'p50 ms', 'p99 ms')]
+    for result in results:
+        lines.append('{:<32} {:>8} {:>12.1f} {:>10.3f} {:>10.3f}'.format(
+            result.name, result.count, result.ops_per_sec,
+            result.p50 * 1000, result.p99 * 1000))
+    return '\n'.join(lines)
+
+
+def dump_results(results, fp):
+    json.dump([result.as_dict() for result in results], fp, indent=2)
@@ -0,0 +1,158 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Microbenchmarks of the helpers on the hot path.
+
+Requires pytest-benchmark. Write machine-readable results with
+`pytest forgot_password/tests/benchmarks --benchmark-json=results.json`,
+or skip them with `--benchmark-skip`.
+"""
+from collections import namedtuple
+from unittest.mock import patch
+
+import pytest
+from skygear.models import Record, RecordID
+
+from ...handlers import reset_password
+from ...handlers.util import email as email_util
+from ...handlers.util import user as user_util
+from ...handlers.util import verify_code as verify_code_util
+from ...handlers.util.email import Mailer
+from ...template import FileTemplate, StringTemplate
+
+pytest.importorskip('pytest_benchmark')
+
+User = namedtuple('User', ['id', 'email', 'password', 'last_login_at'])
+
+USER = User('5b3d4b4e-8f0c-4e0e-9a0f-3c2b1a7e6d5f',
+            'user@example.com',
+            '$2a$10$KssILxWNR6k62B7yiX0GAe2Q7wwHlrzhF3LqtVvpyvHZf0MwvNfVu',
+            '2018-09-04 10:00:00.000000')
+USER_RECORD_ID = RecordID('user', USER.id)
+USER_RECORD = Record(USER_RECORD_ID, USER.id, None,
+                     data={'name': 'Jane Doe', 'email': USER.email})
+EXPIRE_AT = 1536069600
+
+TEMPLATE_PARAMS = {
+    'appname': 'My App',
+    'link': 'https://myapp.skygeario.com/reset-password?code=0123456789abcdef'
+            '01234567&user_id={}&expire_at={}'.format(USER.id, EXPIRE_AT),
+    'url_prefix': 'https://myapp.skygeario.com',
+    'email': USER.email,
+    'user_id': USER.id,
+    'code': '0123456789abcdef01234567',
+    'user': USER,
+    'user_record': USER_RECORD,
+    'expire_at': EXPIRE_AT,
+}
+
+# A branded HTML email of about 15KB, similar to the templates used by apps
+BRANDED_HTML_ROW = '''
+<tr>
+  <td style="padding: 16px 24px; font-family: Helvetica, Arial, sans-serif;
+             font-size: 14px; line-height: 20px; color: #333333;">
+    <p>Hello {{ user_record.name }},</p>
+    <p>Someone requested to reset the password of your {{ appname }}
+       account {{ user.email }}. Click the link below to continue.</p>
+    <a href="{{ link }}" style="display: inline-block; padding: 8px 16px;
+       background-color: #1a73e8; color: #ffffff;">Reset Password</a>
+  </td>
+</tr>
+'''
+BRANDED_HTML_TEMPLATE = '<!DOCTYPE html><html><body><table>{}</table>' \
+    '</body></html>'.format(BRANDED_HTML_ROW * 24)
+TEXT_BODY = 'Dear {},\n\n{}\n'.format(USER.email, 'x' * 600)
+
+
+@pytest.fixture(autouse=True)
+def masterkey():
+    with patch.object(user_util.skyoptions, 'masterkey',
+                      'benchmark-master-key', create=True):
+        yield
+
+
+def test_render_file_template(benchmark):
+    template = FileTemplate('reset_password_form', 'reset_password.html')
+    body = benchmark(template.render, **TEMPLATE_PARAMS)
+    assert USER.id in body
+
+
+def test_render_branded_html_template(benchmark):
+    template = StringTemplate('reset_email_html', BRANDED_HTML_TEMPLATE)
+    body = benchmark(template.render, **TEMPLATE_PARAMS)
+    assert len(body) > 10000
+
+
+@patch.object(email_util, 'send_mail2')
+def test_compose_mail(mock, benchmark):
+    mailer = Mailer(smtp_host='localhost')
+    html_body = StringTemplate('reset_email_html', BRANDED_HTML_TEMPLATE) \
+        .render(**TEMPLATE_PARAMS)
+    benchmark(mailer.send_mail,
+              ('My App', 'no-reply@skygeario.com'),
+              USER.email,
+              'Reset password instructions',
+              TEXT_BODY,
+              html_body,
+              ('My App Support', 'support@skygeario.com'))
+    assert mock.called
+
+
+def test_reset_password_generate_code(benchmark):
+    code = benchmark(user_util.generate_code, USER, EXPIRE_AT)
+    assert len(code) == user_util.CODE_LENGTH
+
+
+def test_reset_password_generate_legacy_code(benchmark):
+    code = benchmark(user_util.generate_legacy_code, USER, EXPIRE_AT)
+    assert code
+
+
+@pytest.mark.parametrize('generate', [user_util.generate_code,
+                                      user_util.generate_legacy_code],
+                         ids=['hmac', 'legacy'])
+@patch.object(user_util, '_legacy_code_deadline', EXPIRE_AT)
+def test_reset_password_validate_code(benchmark, generate):
+    code = generate(USER, EXPIRE_AT)
+    assert benchmark(user_util.validate_code, USER, code, EXPIRE_AT)
+
+
+def test_reset_password_check_code_signature(benchmark):
+    code = user_util.generate_code(USER, EXPIRE_AT)
+    assert benchmark(user_util.check_code_signature, USER.id, code,
+                     EXPIRE_AT)
+
+
+@pytest.mark.parametrize('code_format', ['numeric', 'complex'])
+def test_verify_generate_code(benchmark, code_format):
+    code = benchmark(verify_code_util.generate_code, code_format)
+    assert code
+
+
+@pytest.mark.parametrize('code_format', ['numeric', 'complex'])
+def test_verify_check_stateless_code(benchmark, code_format):
+    window = verify_code_util.get_code_window(86400)
+    code = verify_code_util.generate_stateless_code(
+        code_format, USER.id, 'email', USER.email, 1, window)
+    assert benchmark(verify_code_util.check_stateless_code, code_format,
+                     code, USER.id, 'email', USER.email, 1, 86400)
+
+
+def test_response_url_redirect(benchmark):
+    resp = benchmark(reset_password.response_url_redirect,
+                     'https://myapp.skygeario.com/reset/success?ref=email',
+                     code=TEMPLATE_PARAMS['code'],
+                     user_id=USER.id,
+                     expire_at=EXPIRE_AT)
+    assert resp.status_code == 302
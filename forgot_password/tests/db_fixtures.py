@@ -0,0 +1,110 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+In-memory SQLite stand-in of the Skygear database, for tests.
+"""
+import contextlib
+from unittest.mock import patch
+
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
+
+from ..handlers.util import db as db_util
+from ..handlers.util import user as user_util
+from ..handlers.util import verify_code as verify_code_util
+
+
+def create_database():
+    """
+    Create an in-memory SQLite database with the tables queried by the
+    plugin. Return the engine and the tables by name.
+    """
+    engine = sa.create_engine(
+        'sqlite://',
+        connect_args={'check_same_thread': False},
+        poolclass=StaticPool
+    )
+    metadata = sa.MetaData()
+    tables = {
+        '_user': sa.Table(
+            '_user', metadata,
+            sa.Column('id', sa.String, primary_key=True),
+            sa.Column('email', sa.String),
+            sa.Column('password', sa.String),
+            sa.Column('last_login_at', sa.DateTime),
+        ),
+        'user': sa.Table(
+            'user', metadata,
+            sa.Column('_id', sa.String, primary_key=True),
+            sa.Column('email', sa.String),
+            sa.Column('email_verified', sa.Boolean),
+        ),
+        '_verify_code': sa.Table(
+            '_verify_code', metadata,
+            sa.Column('id', sa.String, primary_key=True),
+            sa.Column('auth_id', sa.String, index=True),
+            sa.Column('record_key', sa.String),
+            sa.Column('record_value', sa.String),
+            sa.Column('code', sa.String),
+            sa.Column('consumed', sa.Boolean),
+            sa.Column('created_at', sa.DateTime),
+        ),
+    }
+    metadata.create_all(engine)
+    return engine, tables
+
+
+def add_users(engine, tables, count):
+    """
+    Add users to the database. Return the list of user IDs.
+    """
+    user_ids = ['user-{}'.format(i) for i in range(count)]
+    with engine.begin() as c:
+        c.execute(tables['_user'].insert(), [{
+            'id': user_id,
+            'email': '{}@example.com'.format(user_id),
+            'password': '$2a$10$' + user_id,
+            'last_login_at': None,
+        } for user_id in user_ids])
+        c.execute(tables['user'].insert(), [{
+            '_id': user_id,
+            'email': '{}@example.com'.format(user_id),
+            'email_verified': False,
+        } for user_id in user_ids])
+    return user_ids
+
+
+@contextlib.contextmanager
+def patch_database(engine, tables):
+    """
+    Make the plugin query the specified database instead of the Skygear
+    database.
+    """
+    @contextlib.contextmanager
+    def conn():
+        with engine.begin() as c:
+            yield c
+
+    def get_table(name):
+        return tables[name]
+
+    def has_table(name):
+        return name in tables
+
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(patch.object(db_util, 'skygear_conn', conn))
+        for module in [user_util, verify_code_util]:
+            stack.enter_context(patch.object(module, 'get_table', get_table))
+        stack.enter_context(patch.object(user_util, 'has_table', has_table))
+        yield
@@ -0,0 +1,39 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+from .benchmarks import end_to_end
+from .benchmarks.stats import percentile
+
+
+class TestStats(unittest.TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        assert percentile(values, 0.5) == 50
+        assert percentile(values, 0.99) == 99
+        assert percentile([1], 0.99) == 1
+
+
+class TestEndToEndBenchmark(unittest.TestCase):
+    def test_run(self):
+        results = end_to_end.run(iterations=2, user_count=2)
+        assert [result.name for result in results] == [
+            'user:forgot-password',
+            'reset-password (GET)',
+            'reset-password (POST)',
+            'user:verify_request',
+            'user:verify_code',
+        ]
+        for result in results:
+            assert result.count == 2
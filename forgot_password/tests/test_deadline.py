@@ -0,0 +1,123 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import socket
+import tempfile
+import unittest
+from argparse import Namespace
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+from urllib.error import URLError
+
+import requests
+from skygear import error as skyerror
+
+from .. import deadline, template
+from ..deadline import DeadlineExceeded
+from ..handlers.util import container as container_util
+from ..handlers.util import email as email_util
+from ..handlers.util.circuit import configure_circuit_breakers
+from ..handlers.util.email import Mailer
+
+
+class TestDeadline(unittest.TestCase):
+    def setUp(self):
+        deadline.configure_deadlines(Namespace(request_timeout=30,
+                                               io_timeout=10))
+        self.addCleanup(deadline.configure_deadlines, None)
+        self.now = 1000.0
+        patcher = patch.object(deadline.time, 'monotonic',
+                               side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_no_deadline(self):
+        assert deadline.remaining() is None
+        assert deadline.get_timeout('smtp') == 10
+        assert deadline.get_timeout('smtp', 5) == 5
+        deadline.configure_deadlines(None)
+        assert deadline.get_timeout('smtp') is None
+
+    def test_remaining_budget(self):
+        with deadline.request_deadline():
+            self.now += 25
+            assert deadline.remaining() == 5
+            assert deadline.get_timeout('smtp') == 5
+        assert deadline.remaining() is None
+
+    def test_nested_deadline_never_extends(self):
+        with deadline.request_deadline(5):
+            with deadline.request_deadline(60):
+                assert deadline.remaining() == 5
+            with deadline.request_deadline(2):
+                assert deadline.remaining() == 2
+            assert deadline.remaining() == 5
+
+    def test_deadline_passed(self):
+        with deadline.request_deadline():
+            self.now += 30
+            with self.assertRaises(DeadlineExceeded) as cm:
+                deadline.get_timeout('smtp')
+        assert cm.exception.code == skyerror.PluginTimeout
+        assert cm.exception.info == {'operation': 'smtp', 'retryable': True}
+
+    def test_with_request_deadline(self):
+        @deadline.with_request_deadline
+        def handler():
+            return deadline.remaining()
+
+        assert handler() == 30
+        assert deadline.remaining() is None
+
+
+class TestOutboundTimeouts(unittest.TestCase):
+    def setUp(self):
+        deadline.configure_deadlines(Namespace(request_timeout=30,
+                                               io_timeout=10))
+        self.addCleanup(deadline.configure_deadlines, None)
+        configure_circuit_breakers(None)
+        self.addCleanup(configure_circuit_breakers, None)
+
+    @patch.object(email_util, 'send_mail2')
+    def test_smtp_timeout(self, mock):
+        mock.side_effect = socket.timeout()
+        mailer = Mailer(smtp_host='smtp.example.com')
+        with self.assertRaises(DeadlineExceeded) as cm:
+            mailer.send_mail('no-reply@example.com', 'user@example.com',
+                             'Subject', 'Text')
+        assert cm.exception.operation == 'smtp:smtp.example.com:25'
+        assert mock.call_args[1]['timeout'] == 10
+
+    def test_template_download_timeout(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            file_template = template.FileTemplate(
+                'remote', 'remote.txt',
+                download_url='http://example.com/remote.txt')
+            with patch.object(file_template, 'get_download_dir_path',
+                              return_value=Path(tmpdir)), \
+                    patch.object(template, 'urlopen',
+                                 side_effect=URLError(socket.timeout())) \
+                    as mock:
+                with self.assertRaises(DeadlineExceeded):
+                    file_template.download()
+            assert mock.call_args[1]['timeout'] == 10
+            assert not Path(tmpdir).joinpath('remote.txt').exists()
+
+    def test_container_timeout(self):
+        container = MagicMock()
+        container.send_action.side_effect = requests.Timeout()
+        with patch.object(container_util, 'get_container',
+                          return_value=container):
+            with self.assertRaises(DeadlineExceeded):
+                container_util.send_action('record:fetch', {})
+        assert container.send_action.call_args[1]['timeout'] == 10
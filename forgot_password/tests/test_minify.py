@@ -0,0 +1,44 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import unittest
+
+import jinja2
+
+from ..minify import minify_html
+from ..template import MinifyingLoader
+
+
+class TestMinifyHTML(unittest.TestCase):
+    def test_collapse_whitespace_and_remove_comments(self):
+        source = '<head>\n  <!-- comment -->\n  <title>A</title>\n</head>\n'
+        assert minify_html(source) == '<head> <title>A</title> </head>'
+
+    def test_keep_conditional_comment(self):
+        source = '<!--[if IE]><p>IE</p><![endif]-->'
+        assert minify_html(source) == source
+
+    def test_keep_pre_and_jinja(self):
+        source = '<pre>\n  a\n    b</pre>\n\n{{ "a   b" }}  {%  if x %}'
+        assert minify_html(source) == \
+            '<pre>\n  a\n    b</pre> {{ "a   b" }} {%  if x %}'
+
+
+class TestMinifyingLoader(unittest.TestCase):
+    def test_only_minify_html(self):
+        env = jinja2.Environment(loader=MinifyingLoader(jinja2.DictLoader({
+            'a.html': '<p>\n  {{ name }}\n</p>',
+            'a.txt': 'Dear\n  {{ name }}',
+        })))
+        assert env.get_template('a.html').render(name='x') == '<p> x </p>'
+        assert env.get_template('a.txt').render(name='x') == 'Dear\n  x'
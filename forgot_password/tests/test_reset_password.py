@@ -0,0 +1,73 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import contextlib
+import unittest
+from unittest.mock import patch
+
+from skygear import error as skyerror
+from skygear.error import SkygearException
+
+from ..handlers import reset_password as reset_password_handlers
+from ..handlers.util import user as user_util
+from ..handlers.util.attempt import AttemptGuard
+from .db_fixtures import add_users, create_database, patch_database
+
+
+class TestResetPasswordOp(unittest.TestCase):
+    def setUp(self):
+        self.engine, self.tables = create_database()
+        self.user_id = add_users(self.engine, self.tables, 1)[0]
+        self.ops = {}
+
+        def op(name, *args, **kwargs):
+            def register(func):
+                self.ops[name] = func
+                return func
+            return register
+
+        stack = contextlib.ExitStack()
+        self.addCleanup(stack.close)
+        stack.enter_context(patch_database(self.engine, self.tables))
+        stack.enter_context(patch.object(reset_password_handlers.skygear,
+                                         'op', op))
+        stack.enter_context(patch.object(user_util.skyoptions, 'masterkey',
+                                         'secret', create=True))
+        self.set_new_password = stack.enter_context(
+            patch.object(user_util, 'set_new_password'))
+
+    def test_failures_do_not_lock_out_user(self):
+        reset_password_handlers.register_op(
+            attempt_guard=AttemptGuard(max_failures=2))
+        reset_password = self.ops['user:reset-password']
+        expire_at = 2000000000
+
+        for i in range(5):
+            with self.assertRaises(SkygearException) as cm:
+                reset_password(self.user_id, 'bad-code-{}'.format(i),
+                               expire_at, 'new-password')
+            assert cm.exception.code == skyerror.ResourceNotFound
+
+        # A bad code is remembered
+        with self.assertRaises(SkygearException) as cm:
+            reset_password(self.user_id, 'bad-code-0', expire_at,
+                           'new-password')
+        assert cm.exception.code == skyerror.PermissionDenied
+
+        with self.engine.begin() as c:
+            user = user_util.get_user(c, self.user_id)
+        code = user_util.generate_code(user, expire_at)
+        assert reset_password(self.user_id, code, expire_at,
+                              'new-password') == {'status': 'OK'}
+        self.set_new_password.assert_called_once_with(self.user_id,
+                                                      'new-password')
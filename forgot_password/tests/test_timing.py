@@ -0,0 +1,64 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import unittest
+from argparse import Namespace
+from unittest.mock import patch
+
+from skygear.utils.context import start_context
+
+from .. import timing
+from ..template import StringTemplate
+
+
+class TestTiming(unittest.TestCase):
+    def setUp(self):
+        timing.configure_timing(Namespace(enable=True, min_duration=0))
+        self.addCleanup(timing.configure_timing, None)
+
+    def test_disabled(self):
+        timing.configure_timing(None)
+        assert timing.begin_request('op', 'test:op') is None
+        assert timing.span('db:get_user') is timing.span('render:a')
+
+    def test_log_stages(self):
+        template = StringTemplate('greeting', 'Hello {{ name }}')
+
+        @timing.timed('db:get_user')
+        def get_user():
+            return 'user'
+
+        with start_context({'request_id': 'request-id'}), \
+                patch.object(timing.logger, 'info') as mock:
+            request_timing = timing.begin_request('op', 'test:op')
+            assert timing.begin_request('op', 'nested:op') is None
+            get_user()
+            get_user()
+            template.render(name='user')
+            timing.end_request(request_timing, 'ok')
+
+        assert timing.current_request_timing() is None
+        log = json.loads(mock.call_args[0][0])
+        assert log['correlation_id'] == 'request-id'
+        assert log['name'] == 'test:op'
+        assert log['outcome'] == 'ok'
+        assert log['stages']['db:get_user']['count'] == 2
+        assert log['stages']['render:greeting']['count'] == 1
+
+    def test_skip_fast_request(self):
+        timing.configure_timing(Namespace(enable=True, min_duration=60000))
+        with patch.object(timing.logger, 'info') as mock:
+            request_timing = timing.begin_request('op', 'test:op')
+            timing.end_request(request_timing, 'ok')
+        assert not mock.called
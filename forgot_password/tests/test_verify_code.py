@@ -0,0 +1,273 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import contextlib
+import datetime
+import threading
+import time
+import unittest
+from argparse import Namespace
+from unittest.mock import MagicMock, patch
+
+from skygear.error import SkygearException
+
+from ..deadline import DeadlineExceeded
+from skygear.models import Record, RecordID
+
+from ..handlers import verify_code as verify_code_handlers
+from ..handlers.util.db import request_connection
+from ..handlers.util.singleflight import COALESCED_CALLS, SingleFlight
+from ..handlers.verify_code import (VerifyCodeFormHandler, VerifyCodeLambda,
+                                    VerifyRequestLambda)
+from .db_fixtures import add_users, create_database, patch_database
+
+
+class TestVerifyRequestLambda(unittest.TestCase):
+    def setUp(self):
+        self.engine, self.tables = create_database()
+        self.user_id = add_users(self.engine, self.tables, 1)[0]
+        self.email = '{}@example.com'.format(self.user_id)
+        self.provider = MagicMock()
+        self.provider.settings.name = 'mock'
+        self.updated_at = datetime.datetime(2018, 9, 4, 10, 0, 0)
+        self.user_record = Record(RecordID('user', self.user_id),
+                                  self.user_id, None,
+                                  updated_at=self.updated_at,
+                                  data={'email': self.email})
+        stack = contextlib.ExitStack()
+        self.addCleanup(stack.close)
+        stack.enter_context(patch_database(self.engine, self.tables))
+        stack.enter_context(patch.object(
+            verify_code_handlers, 'fetch_user_record',
+            side_effect=lambda auth_id: self.user_record))
+        stack.enter_context(patch.object(verify_code_handlers,
+                                         'save_user_record',
+                                         side_effect=self.save_user_record))
+        stack.enter_context(patch.object(verify_code_handlers.skyoptions,
+                                         'appname', 'test', create=True))
+        stack.enter_context(patch.object(verify_code_handlers.skyoptions,
+                                         'masterkey', 'secret', create=True))
+
+    def save_user_record(self, user_record):
+        self.updated_at += datetime.timedelta(seconds=1)
+        self.user_record = Record(user_record.id, user_record.owner_id,
+                                  user_record.acl,
+                                  updated_at=self.updated_at,
+                                  data=dict(user_record.data))
+        return self.user_record
+
+    def get_settings(self, resend_cooldown=0, reuse_window=0, expiry=3600,
+                     lock='process', stateless=False):
+        key_settings = Namespace(code_format='numeric',
+                                 expiry=expiry,
+                                 stateless=stateless,
+                                 resend_cooldown=resend_cooldown,
+                                 reuse_window=reuse_window)
+        return Namespace(url_prefix='http://skygear.test/',
+                         keys={'email': key_settings},
+                         lock=lock)
+
+    def get_lambda(self, flight=None, **kwargs):
+        return VerifyRequestLambda(self.get_settings(**kwargs),
+                                   {'email': self.provider},
+                                   flight=flight)
+
+    def add_code(self, code, age, consumed=False):
+        created_at = datetime.datetime.now() - \
+            datetime.timedelta(seconds=age)
+        with self.engine.begin() as c:
+            c.execute(self.tables['_verify_code'].insert().values(
+                id=code, auth_id=self.user_id, record_key='email',
+                record_value=self.email, code=code, consumed=consumed,
+                created_at=created_at))
+
+    def get_codes(self):
+        with self.engine.begin() as c:
+            rows = c.execute(self.tables['_verify_code'].select())
+            return sorted(row.code for row in rows)
+
+    def get_sent_codes(self):
+        return [call[0][1]['code']
+                for call in self.provider.send.call_args_list]
+
+    def test_always_send_new_code_by_default(self):
+        self.add_code('111111', age=1)
+        self.get_lambda()(self.user_id, 'email')
+        codes = self.get_codes()
+        assert len(codes) == 2
+        assert self.get_sent_codes() == [c for c in codes if c != '111111']
+
+    def test_skip_within_cooldown(self):
+        self.add_code('111111', age=10)
+        self.get_lambda(resend_cooldown=60)(self.user_id, 'email')
+        assert self.get_codes() == ['111111']
+        assert not self.provider.send.called
+
+    def test_reuse_outstanding_code(self):
+        self.add_code('111111', age=120)
+        self.get_lambda(resend_cooldown=60,
+                        reuse_window=600)(self.user_id, 'email')
+        assert self.get_codes() == ['111111']
+        assert self.get_sent_codes() == ['111111']
+
+    def test_new_code_after_reuse_window(self):
+        self.add_code('111111', age=700)
+        self.get_lambda(resend_cooldown=60,
+                        reuse_window=600)(self.user_id, 'email')
+        assert len(self.get_codes()) == 2
+        assert self.get_sent_codes() != ['111111']
+
+    def test_reuse_window_never_exceeds_expiry(self):
+        self.add_code('111111', age=120)
+        self.get_lambda(reuse_window=600, expiry=100)(self.user_id, 'email')
+        assert len(self.get_codes()) == 2
+
+    def test_ignore_consumed_code(self):
+        self.add_code('111111', age=10, consumed=True)
+        self.get_lambda(resend_cooldown=60)(self.user_id, 'email')
+        assert len(self.get_codes()) == 2
+        assert self.provider.send.called
+
+    def test_keep_code_if_send_fails(self):
+        self.provider.send.side_effect = DeadlineExceeded('twilio:AC123')
+        with self.assertRaises(DeadlineExceeded):
+            with request_connection():
+                self.get_lambda()(self.user_id, 'email')
+        assert self.get_codes() == self.get_sent_codes()
+
+    def test_collapse_concurrent_requests(self):
+        flight = SingleFlight('test-verify')
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_send(*args, **kwargs):
+            started.set()
+            release.wait(5)
+
+        self.provider.send.side_effect = slow_send
+        thelambda = self.get_lambda(flight=flight)
+        leader = threading.Thread(target=thelambda,
+                                  args=(self.user_id, 'email'))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=thelambda,
+                                    args=(self.user_id, 'email'))
+        follower.start()
+        for _ in range(500):
+            if COALESCED_CALLS.get('test-verify', 'in_flight') >= 1:
+                break
+            time.sleep(0.01)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        assert len(self.get_codes()) == 1
+        assert self.provider.send.call_count == 1
+
+    @patch.object(verify_code_handlers, 'acquire_advisory_lock',
+                  return_value=True)
+    def test_skip_after_waiting_for_advisory_lock(self, mock):
+        self.add_code('111111', age=1)
+        self.get_lambda(lock='advisory')(self.user_id, 'email')
+        assert mock.call_args[0][2:] == ('verify', self.user_id, 'email')
+        assert self.get_codes() == ['111111']
+        assert not self.provider.send.called
+
+    @patch.object(verify_code_handlers, 'acquire_advisory_lock',
+                  return_value=False)
+    def test_send_with_advisory_lock(self, mock):
+        self.add_code('111111', age=1)
+        self.get_lambda(lock='advisory')(self.user_id, 'email')
+        assert mock.called
+        assert len(self.get_codes()) == 2
+        assert self.provider.send.called
+
+    def test_stateless_code(self):
+        settings = self.get_settings(stateless=True)
+        VerifyRequestLambda(settings, {'email': self.provider})(
+            self.user_id, 'email')
+        assert self.get_codes() == []
+        code_str = self.get_sent_codes()[0]
+
+        thelambda = VerifyCodeLambda(settings)
+        assert thelambda.verify(self.user_id, code_str) == 'email'
+        assert self.user_record['email_verified'] is True
+
+        # The code cannot be used again once the data is verified
+        with self.assertRaises(SkygearException):
+            thelambda.verify(self.user_id, code_str)
+
+    def test_stateless_code_changes_with_data(self):
+        settings = self.get_settings(stateless=True)
+        VerifyRequestLambda(settings, {'email': self.provider})(
+            self.user_id, 'email')
+        code_str = self.get_sent_codes()[0]
+
+        self.user_record['email'] = 'new@example.com'
+        with self.assertRaises(SkygearException):
+            VerifyCodeLambda(settings).verify(self.user_id, code_str)
+
+    def test_stateless_code_changes_with_record_version(self):
+        settings = self.get_settings(stateless=True)
+        VerifyRequestLambda(settings, {'email': self.provider})(
+            self.user_id, 'email')
+        code_str = self.get_sent_codes()[0]
+
+        # Changing the data away and back does not make the code valid
+        self.save_user_record(self.user_record)
+        with self.assertRaises(SkygearException):
+            VerifyCodeLambda(settings).verify(self.user_id, code_str)
+
+    def test_stateless_request_renews_code(self):
+        settings = self.get_settings(stateless=True)
+        thelambda = VerifyRequestLambda(settings, {'email': self.provider})
+        thelambda(self.user_id, 'email')
+        thelambda(self.user_id, 'email')
+        old_code, new_code = self.get_sent_codes()
+        assert old_code != new_code
+
+        with self.assertRaises(SkygearException):
+            VerifyCodeLambda(settings).verify(self.user_id, old_code)
+        assert VerifyCodeLambda(settings).verify(self.user_id, new_code) \
+            == 'email'
+
+    def test_stored_code_consumed_once(self):
+        self.add_code('111111', age=1)
+        thelambda = VerifyCodeLambda(self.get_settings())
+        code = thelambda.get_code(self.user_id, '111111')
+
+        # Consumed by a concurrent request after it was looked up
+        assert thelambda.verify(self.user_id, '111111') == 'email'
+        with self.assertRaises(SkygearException) as cm:
+            thelambda.verify_code(self.user_id, '111111', code)
+        assert str(cm.exception) == 'the code has been used'
+
+    def test_form_looks_up_code_once(self):
+        self.add_code('111111', age=1)
+        settings = self.get_settings()
+        settings.keys['email'].success_redirect = 'http://skygear.test/ok'
+        handler = VerifyCodeFormHandler(settings, {'email': self.provider},
+                                        None)
+        request = MagicMock()
+        request.values = {'auth_id': self.user_id, 'code': '111111'}
+        request.remote_addr = '127.0.0.1'
+        with patch.object(verify_code_handlers, 'get_verify_code',
+                          wraps=verify_code_handlers.get_verify_code) as mock:
+            with request_connection():
+                response = handler(request)
+        assert response.status_code == 302
+        assert mock.call_count == 1
+        assert self.user_record['email_verified'] is True
+        with self.engine.begin() as c:
+            code = c.execute(self.tables['_verify_code'].select()).fetchone()
+        assert code.consumed
@@ -0,0 +1,165 @@
+# Copyright 2018 Oursky Ltd.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+
+from skygear.utils.context import current_request_id
+
+logger = logging.getLogger(__name__)
+try:
+    # Available in py-skygear v1.6
+    from skygear.utils.logging import setLoggerTag
+    setLoggerTag(logger, 'auth_plugin')
+except ImportError:
+    pass
+
+
+_enabled = False
+_min_duration = 0
+_local = threading.local()
+
+
+def configure_timing(settings):
+    """
+    Enable or disable the timing log with the specified timing settings.
+    """
+    global _enabled, _min_duration
+    _enabled = bool(getattr(settings, 'enable', False))
+    _min_duration = getattr(settings, 'min_duration', 0) or 0
+
+
+class RequestTiming:
+    """
+    Durations of the stages of a request, keyed by stage name.
+    """
+    def __init__(self, kind, name, correlation_id):
+        self.kind = kind
+        self.name = name
+        self.correlation_id = correlation_id
+        self.stages = {}
+        self.start = time.perf_counter()
+
+    def add(self, stage, duration):
+        count, total = self.stages.get(stage, (0, 0.0))
+        self.stages[stage] = (count + 1, total + duration)
+
+    def as_dict(self, duration, outcome):
+        return {
+            'correlation_id': self.correlation_id,
+            'kind': self.kind,
+            'name': self.name,
+            'outcome': outcome,
+            'duration_ms': round(duration * 1000, 3),
+            'stages': {
+                stage: {
+                    'count': count,
+                    'duration_ms': round(total * 1000, 3),
+                }
+                for stage, (count, total) in self.stages.items()
+            },
+        }
+
+
+def get_correlation_id():
+    """
+    Return the request ID assigned by Skygear Server, or a new random ID
+    if it is not available.
+    """
+    return current_request_id() or uuid.uuid4().hex
+
+
+def current_request_timing():
+    return getattr(_local, 'timing', None)
+
+
+def begin_request(kind, name):
+    """
+    Start timing a request on the current thread. Return None if the timing
+    log is disabled or a request is already being timed.
+    """
+    if not _enabled or current_request_timing() is not None:
+        return None
+    timing = RequestTiming(kind, name, get_correlation_id())
+    _local.timing = timing
+    return timing
+
+
+def end_request(timing, outcome):
+    """
+    Stop timing a request and write its stage durations as a JSON log line.
+    """
+    if timing is None:
+        return
+    _local.timing = None
+    duration = time.perf_counter() - timing.start
+    if duration * 1000 < _min_duration:
+        return
+    logger.info(json.dumps(timing.as_dict(duration, outcome),
+                           sort_keys=True))
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ('timing', 'stage', 'start')
+
+    def __init__(self, timing, stage):
+        self.timing = timing
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.timing.add(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def span(stage):
+    """
+    Context manager adding the time spent in the block to the stage of the
+    request being timed. It does nothing if no request is being timed.
+    """
+    timing = getattr(_local, 'timing', None)
+    if timing is None:
+        return _NULL_SPAN
+    return _Span(timing, stage)
+
+
+def timed(stage):
+    """
+    Decorator adding the time spent in the function to the stage of the
+    request being timed.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator